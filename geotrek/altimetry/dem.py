@@ -0,0 +1,160 @@
+import struct
+
+import numpy
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db import connection
+
+
+# WKB raster pixel types: numpy type and size in bytes
+PIXEL_TYPES = {
+    0: 'u1',   # 1BB
+    1: 'u1',   # 2BUI
+    2: 'u1',   # 4BUI
+    3: 'i1',   # 8BSI
+    4: 'u1',   # 8BUI
+    5: 'i2',   # 16BSI
+    6: 'u2',   # 16BUI
+    7: 'i4',   # 32BSI
+    8: 'u4',   # 32BUI
+    10: 'f4',  # 32BF
+    11: 'f8',  # 64BF
+}
+
+BAND_IS_OFFLINE = 0x80
+BAND_HAS_NODATA = 0x40
+BAND_IS_NODATA = 0x20
+
+
+class DEMTile(object):
+    """
+    Values of a raster tile, with its upper-left corner and pixel size.
+    Pixels without data are ``NaN``.
+    """
+    def __init__(self, x, y, scale_x, scale_y, values):
+        self.x = x
+        self.y = y
+        self.scale_x = scale_x
+        self.scale_y = scale_y
+        self.values = values
+
+    @classmethod
+    def from_wkb(cls, data):
+        """
+        Read first band of a raster in PostGIS WKB format, as returned by
+        ``ST_AsBinary(rast)``. Raster skew is not supported.
+        """
+        data = bytes(data)
+        endian = '<' if ord(data[0:1]) == 1 else '>'
+        header = struct.unpack(endian + 'HHddddddiHH', data[1:61])
+        version, nbands, scale_x, scale_y, x, y, skew_x, skew_y, srid, width, height = header
+        values = numpy.empty((height, width), dtype=float)
+        values.fill(numpy.nan)
+        if nbands == 0:
+            return cls(x, y, scale_x, scale_y, values)
+
+        flags = ord(data[61:62])
+        pixel_type = numpy.dtype(endian + PIXEL_TYPES[flags & 0x0F])
+        offset = 62 + pixel_type.itemsize
+        if flags & (BAND_IS_OFFLINE | BAND_IS_NODATA):
+            return cls(x, y, scale_x, scale_y, values)
+
+        nodata = numpy.frombuffer(data, dtype=pixel_type, count=1, offset=62)[0]
+        pixels = numpy.frombuffer(data, dtype=pixel_type, count=width * height, offset=offset)
+        values[:] = pixels.reshape((height, width))
+        if flags & BAND_HAS_NODATA:
+            values[pixels.reshape((height, width)) == nodata] = numpy.nan
+        return cls(x, y, scale_x, scale_y, values)
+
+    def sample(self, xs, ys, grid):
+        """
+        Fill ``grid`` (``len(ys) x len(xs)``) with bilinear interpolation of
+        tile values, for points falling in the tile.
+        """
+        height, width = self.values.shape
+        # Fractional pixel coordinates
+        cols = (xs - self.x) / self.scale_x
+        rows = (ys - self.y) / self.scale_y
+        inside_x = numpy.flatnonzero((cols >= 0) & (cols < width))
+        inside_y = numpy.flatnonzero((rows >= 0) & (rows < height))
+        if inside_x.size == 0 or inside_y.size == 0:
+            return
+        cols, rows = cols[inside_x], rows[inside_y]
+
+        # Interpolate between pixels centers
+        fcols = numpy.clip(cols - 0.5, 0, width - 1)
+        frows = numpy.clip(rows - 0.5, 0, height - 1)
+        c0 = numpy.floor(fcols).astype(int)
+        r0 = numpy.floor(frows).astype(int)
+        c1 = numpy.minimum(c0 + 1, width - 1)
+        r1 = numpy.minimum(r0 + 1, height - 1)
+        wc = fcols - c0
+        wr = (frows - r0)[:, numpy.newaxis]
+        v = self.values
+        top = v[r0[:, numpy.newaxis], c0] * (1 - wc) + v[r0[:, numpy.newaxis], c1] * wc
+        bottom = v[r1[:, numpy.newaxis], c0] * (1 - wc) + v[r1[:, numpy.newaxis], c1] * wc
+        values = top * (1 - wr) + bottom * wr
+
+        # Use value of containing pixel when a neighbour has no data
+        nearest = v[numpy.floor(rows).astype(int)[:, numpy.newaxis], numpy.floor(cols).astype(int)]
+        values = numpy.where(numpy.isnan(values), nearest, values)
+
+        grid[numpy.ix_(inside_y, inside_x)] = values
+
+
+def dem_version():
+    """
+    Identifier of the loaded DEM (``loaddem`` recreates the table),
+    or None if there is no DEM.
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT 1 FROM information_schema.tables WHERE table_name='mnt'")
+    if cursor.rowcount == 0:
+        return None
+    cursor.execute("SELECT 'mnt'::regclass::oid")
+    return cursor.fetchone()[0]
+
+
+def iter_tiles(extent):
+    """
+    Read raster tiles intersecting the extent, whole, in binary format.
+    """
+    xmin, ymin, xmax, ymax = extent
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT ST_AsBinary(rast) FROM mnt
+        WHERE ST_Intersects(rast, ST_MakeEnvelope(%s, %s, %s, %s, %s))
+    """, [xmin, ymin, xmax, ymax, settings.SRID])
+    row = cursor.fetchone()
+    while row is not None:
+        yield DEMTile.from_wkb(row[0])
+        row = cursor.fetchone()
+
+
+def sample_grid(extent, precision):
+    """
+    Elevations of a regular grid covering the extent (``xmin``, ``ymin``
+    included), rounded to integer, as a ``(rows, columns)`` array with rows
+    going north. Points without data are ``NaN``.
+
+    Sampled grids are kept in cache, by DEM, extent and precision.
+    """
+    version = dem_version()
+    if version is None:
+        return None
+    xmin, ymin, xmax, ymax = extent
+    cache = get_cache('fat')
+    key = 'altimetry_dem_grid_%s_%s_%s_%s_%s_%s' % (version, xmin, ymin, xmax, ymax, precision)
+    grid = cache.get(key)
+    if grid is not None:
+        return grid
+
+    xs = numpy.arange(xmin, xmax + 1, precision, dtype=float)
+    ys = numpy.arange(ymin, ymax + 1, precision, dtype=float)
+    grid = numpy.empty((len(ys), len(xs)), dtype=float)
+    grid.fill(numpy.nan)
+    for tile in iter_tiles(extent):
+        tile.sample(xs, ys, grid)
+    grid = numpy.rint(grid)
+    cache.set(key, grid)
+    return grid
@@ -1,5 +1,8 @@
 import logging
+import math
 
+import numpy
+from django.contrib.gis.gdal import CoordTransform, SpatialReference
 from django.contrib.gis.geos import GEOSGeometry
 from django.utils.translation import ugettext as _
 from django.contrib.gis.geos import LineString
@@ -9,44 +12,92 @@ from django.db import connection
 import pygal
 from pygal.style import LightSolarizedStyle
 
+from . import dem
+
 
 logger = logging.getLogger(__name__)
 
 
 class AltimetryHelper(object):
+    # GDAL coordinates transformations, by (source, target) SRIDs
+    _coord_transforms = {}
+
     @classmethod
     def elevation_profile(cls, geometry3d, precision=None, offset=0):
         """Extract elevation profile from a 3D geometry.
 
         :precision:  geometry sampling in meters
         """
+        return cls.elevation_profiles([geometry3d], precision, offset)[0]
+
+    @classmethod
+    def elevation_profiles(cls, geometries, precision=None, offset=0):
+        """Extract elevation profiles of many 3D geometries at once.
+
+        Distances are computed in-process, and all vertices are transformed
+        to API SRID with a single call per SRID.
+        Returns a list of ``[(distance, x, y, z), ...]``.
+        """
         precision = precision or settings.ALTIMETRIC_PROFILE_PRECISION
 
+        measures = [cls._measures(geom, offset) if geom is not None else None
+                    for geom in geometries]
+
+        profiles = [[] for geom in geometries]
+        for srid in set([geom.srid for geom in geometries if geom is not None]):
+            indices = [i for i, geom in enumerate(geometries) if geom is not None and geom.srid == srid]
+            coords = numpy.concatenate([cls._vertices(geometries[i]) for i in indices])
+            coords = cls._transform(coords, srid, settings.API_SRID)
+            # Join (offset+distance, x, y, z) together
+            start = 0
+            for i in indices:
+                end = start + len(measures[i])
+                dxyz = numpy.column_stack((measures[i], coords[start:end]))
+                profiles[i] = [tuple(v) for v in dxyz.tolist()]
+                start = end
+        return profiles
+
+    @classmethod
+    def _vertices(cls, geometry3d):
+        if geometry3d.geom_type == 'MultiLineString':
+            return numpy.concatenate([numpy.array(subcoords, dtype=float)
+                                      for subcoords in geometry3d.coords])
+        return numpy.array(geometry3d.coords, dtype=float)
+
+    @classmethod
+    def _measures(cls, geometry3d, offset=0):
+        """Distance from origin of each vertex, measured on 2D geometry
+        (like ``ST_AddMeasure()``).
+        """
         if geometry3d.geom_type == 'MultiLineString':
-            profile = []
+            measures = []
             for subcoords in geometry3d.coords:
-                subline = LineString(subcoords, srid=geometry3d.srid)
-                offset += subline.length
-                subprofile = AltimetryHelper.elevation_profile(subline, precision, offset)
-                profile.extend(subprofile)
-            return profile
-
-        # Add measure to 2D version of geometry3d
-        # Get distance from origin for each vertex
-        sql = """
-        WITH line2d AS (SELECT ST_force_2D('%(ewkt)s'::geometry) AS geom),
-             line_measure AS (SELECT ST_Addmeasure(geom, 0, ST_length(geom)) AS geom FROM line2d),
-             points2dm AS (SELECT (ST_DumpPoints(geom)).geom AS point FROM line_measure)
-        SELECT (%(offset)s + ST_M(point)) FROM points2dm;
-        """ % {'offset': offset, 'ewkt': geometry3d.ewkt}
-        cursor = connection.cursor()
-        cursor.execute(sql)
-        pointsm = cursor.fetchall()
-        # Join (offset+distance, x, y, z) together
-        geom3dapi = geometry3d.transform(settings.API_SRID, clone=True)
-        assert len(pointsm) == len(geom3dapi.coords), 'Cannot map distance to xyz'
-        dxyz = [pointsm[i] + v for i, v in enumerate(geom3dapi.coords)]
-        return dxyz
+                submeasures = cls._line_measures(numpy.array(subcoords, dtype=float))
+                # Offset of sub-lines includes their own length
+                offset += submeasures[-1]
+                measures.append(offset + submeasures)
+            return numpy.concatenate(measures)
+        return offset + cls._line_measures(numpy.array(geometry3d.coords, dtype=float))
+
+    @classmethod
+    def _line_measures(cls, coords):
+        deltas = numpy.diff(coords[:, :2], axis=0)
+        steps = numpy.sqrt((deltas * deltas).sum(axis=1))
+        return numpy.concatenate(([0.0], numpy.cumsum(steps)))
+
+    @classmethod
+    def _transform(cls, coords, source_srid, target_srid):
+        """Transform an array of coordinates with a single GDAL call.
+        """
+        if source_srid == target_srid:
+            return coords
+        transform = cls._coord_transforms.get((source_srid, target_srid))
+        if transform is None:
+            transform = CoordTransform(SpatialReference(source_srid), SpatialReference(target_srid))
+            cls._coord_transforms[(source_srid, target_srid)] = transform
+        line = LineString(coords, srid=source_srid)
+        line.transform(transform)
+        return line.array
 
     @classmethod
     def altimetry_limits(cls, profile):
@@ -130,75 +181,35 @@ class AltimetryHelper(object):
             precision = int(width / max_resolution)
         if height / precision > 10000:
             precision = int(width / max_resolution)
-        cursor = connection.cursor()
-        cursor.execute("SELECT 1 FROM information_schema.tables WHERE table_name='mnt'")
-        if cursor.rowcount == 0:
+        grid = dem.sample_grid((xmin, ymin, xmax, ymax), precision)
+        if grid is None:
             logger.warn("No DEM present")
             return {}
+        draped = grid[~numpy.isnan(grid)]
+        if draped.size == 0:
+            logger.warn("No DEM data in area")
+            return {}
+        resolution_h, resolution_w = grid.shape
+        min_z, max_z, center_z = int(draped.min()), int(draped.max()), draped.mean()
 
-        sql = """
-            -- Author: Celian Garcia
-            WITH columns AS (
-                    SELECT generate_series({xmin}::int, {xmax}::int, {precision}) AS x
-                ),
-                lines AS (
-                    SELECT generate_series({ymin}::int, {ymax}::int, {precision}) AS y
-                ),
-                resolution AS (
-                    SELECT x, y
-                    FROM (SELECT COUNT(x) AS x FROM columns) AS col,
-                         (SELECT COUNT(y) AS y FROM lines)   AS lin
-                ),
-                points2d AS (
-                    SELECT row_number() OVER () AS id,
-                           ST_SetSRID(ST_MakePoint(x, y), {srid}) AS geom,
-                           ST_Transform(ST_SetSRID(ST_MakePoint(x, y), {srid}), 4326) AS geomll
-                    FROM lines, columns
-                ),
-                draped AS (
-                    SELECT id, ST_Value(mnt.rast, p.geom)::int AS altitude
-                    FROM mnt, points2d AS p
-                    WHERE ST_Intersects(mnt.rast, p.geom)
-                ),
-                all_draped AS (
-                    SELECT geomll, geom, altitude
-                    FROM points2d LEFT JOIN draped ON (points2d.id = draped.id)
-                    ORDER BY points2d.id
-                ),
-                extent_latlng AS (
-                    SELECT ST_Envelope(ST_Union(geom)) AS extent,
-                           MIN(altitude) AS min_z,
-                           MAX(altitude) AS max_z,
-                           AVG(altitude) AS center_z
-                    FROM all_draped
-                )
-            SELECT extent,
-                   ST_transform(extent, 4326),
-                   center_z,
-                   min_z,
-                   max_z,
-                   resolution.x AS resolution_w,
-                   resolution.y AS resolution_h,
-                   altitude
-            FROM extent_latlng, resolution, all_draped;
-        """.format(xmin=xmin, ymin=ymin, xmax=xmax, ymax=ymax,
-                   srid=settings.SRID, precision=precision)
-        cursor.execute(sql)
-        result = cursor.fetchall()
-        first = result[0]
-        envelop_native, envelop, center_z, min_z, max_z, resolution_w, resolution_h, a = first
+        # Envelope of grid points
+        cursor = connection.cursor()
+        cursor.execute("""
+            WITH extent AS (SELECT ST_MakeEnvelope(%s, %s, %s, %s, %s) AS geom)
+            SELECT geom, ST_Transform(geom, 4326) FROM extent
+        """, [xmin, ymin, xmin + (resolution_w - 1) * precision,
+              ymin + (resolution_h - 1) * precision, settings.SRID])
+        envelop_native, envelop = cursor.fetchone()
         envelop = GEOSGeometry(envelop, srid=4326)
         envelop_native = GEOSGeometry(envelop_native, srid=settings.SRID)
 
         altitudes = []
-        row = []
-        for i, record in enumerate(result):
-            if i > 0 and i % resolution_w == 0:
-                altitudes.append(row)
-                row = []
-            elevation = (record[7] or 0.0) - min_z
-            row.append(elevation)
-        altitudes.append(row)
+        for line in grid.tolist():
+            row = []
+            for z in line:
+                altitude = None if math.isnan(z) else int(z)
+                row.append((altitude or 0.0) - min_z)
+            altitudes.append(row)
 
         area = {
             'center': {
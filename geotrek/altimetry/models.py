@@ -1,4 +1,5 @@
 import os
+from contextlib import contextmanager
 
 from django.conf import settings
 from django.contrib.gis.db import models
@@ -9,6 +10,11 @@ from mapentity.helpers import is_file_newer, convertit_download, smart_urljoin
 from .helpers import AltimetryHelper
 
 
+# Elevation profiles computed in batch, by model and pk, only while in a
+# ``prefetched_elevation_profiles()`` block of the model
+_prefetched_profiles = {}
+
+
 class AltimetryMixin(models.Model):
     # Computed values (managed at DB-level with triggers)
     geom_3d = models.GeometryField(dim=3, srid=settings.SRID, spatial_index=False,
@@ -50,8 +56,32 @@ class AltimetryMixin(models.Model):
         return self
 
     def get_elevation_profile(self):
+        prefetched = _prefetched_profiles.get(type(self), {}).get(self.pk)
+        if prefetched is not None and self.geom_3d is not None and prefetched[0] == bytes(self.geom_3d.ewkb):
+            return prefetched[1]
         return AltimetryHelper.elevation_profile(self.geom_3d)
 
+    @classmethod
+    @contextmanager
+    def prefetched_elevation_profiles(cls, objects):
+        """Compute elevation profiles of many objects at once. In the block,
+        they are returned by ``get_elevation_profile()`` while 3D geometry is
+        unchanged. Nested blocks keep profiles of the outer one.
+        """
+        nested = cls in _prefetched_profiles
+        prefetched = _prefetched_profiles.setdefault(cls, {})
+        try:
+            objects = [obj for obj in objects
+                       if obj.geom_3d is not None and
+                       prefetched.get(obj.pk, (None,))[0] != bytes(obj.geom_3d.ewkb)]
+            profiles = AltimetryHelper.elevation_profiles([obj.geom_3d for obj in objects])
+            for obj, profile in zip(objects, profiles):
+                prefetched[obj.pk] = (bytes(obj.geom_3d.ewkb), profile)
+            yield
+        finally:
+            if not nested:
+                del _prefetched_profiles[cls]
+
     def get_elevation_area(self):
         return AltimetryHelper.elevation_area(self.geom)
 
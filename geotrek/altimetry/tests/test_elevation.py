@@ -1,3 +1,6 @@
+import mock
+import numpy
+
 from django.conf import settings
 from django.test import TestCase
 from django.db import connections, DEFAULT_DB_ALIAS
@@ -5,6 +8,7 @@ from django.contrib.gis.geos import MultiLineString, LineString
 
 from geotrek.core.models import Path
 from geotrek.core.factories import TopologyFactory
+from geotrek.altimetry import dem
 from geotrek.altimetry.helpers import AltimetryHelper
 
 
@@ -44,6 +48,24 @@ class ElevationTest(TestCase):
         self.assertEqual(profile[5][3], 20.0)
         self.assertEqual(profile[6][3], 22.0)
 
+    def test_prefetched_elevation_profile(self):
+        profile = self.path.get_elevation_profile()
+        with Path.prefetched_elevation_profiles([self.path]):
+            with mock.patch.object(AltimetryHelper, 'elevation_profile') as elevation_profile:
+                self.assertEqual(self.path.get_elevation_profile(), profile)
+                self.assertFalse(elevation_profile.called)
+        with mock.patch.object(AltimetryHelper, 'elevation_profile') as elevation_profile:
+            self.path.get_elevation_profile()
+            self.assertTrue(elevation_profile.called)
+
+    def test_prefetched_elevation_profile_with_other_elevation(self):
+        with Path.prefetched_elevation_profiles([self.path]):
+            self.path.geom_3d = LineString([(x, y, z + 1) for x, y, z in self.path.geom_3d.coords],
+                                           srid=self.path.geom_3d.srid)
+            with mock.patch.object(AltimetryHelper, 'elevation_profile') as elevation_profile:
+                self.path.get_elevation_profile()
+                self.assertTrue(elevation_profile.called)
+
     def test_elevation_limits(self):
         limits = self.path.get_elevation_limits()
         self.assertEqual(limits[0], 1106)
@@ -101,6 +123,19 @@ class ElevationProfileTest(TestCase):
 
         profile = AltimetryHelper.elevation_profile(geom)
         self.assertEqual(len(profile), 4)
+        # Offset of sub-lines includes their own length
+        self.assertEqual([step[0] for step in profile], [1.0, 2.0, 3.5, 6.0])
+        self.assertEqual([step[3] for step in profile], [8, 10, 6, 7])
+
+    def test_elevation_profiles_batch(self):
+        geoms = [LineString((1.5, 2.5, 8), (2.5, 2.5, 10), (2.5, 5.5, 12), srid=settings.SRID),
+                 None,
+                 LineString((0, 0, 0), (3, 4, 5), srid=settings.SRID)]
+        profiles = AltimetryHelper.elevation_profiles(geoms)
+        self.assertEqual(len(profiles), 3)
+        self.assertEqual(profiles[0], AltimetryHelper.elevation_profile(geoms[0]))
+        self.assertEqual(profiles[1], [])
+        self.assertEqual([step[0] for step in profiles[2]], [0.0, 5.0])
 
     def test_elevation_svg_output(self):
         geom = LineString((1.5, 2.5, 8), (2.5, 2.5, 10),
@@ -192,9 +227,46 @@ class ElevationAreaTest(TestCase):
 
     def test_area_provides_altitudes_extent(self):
         extent = self.area['extent']
-        self.assertEqual(extent['altitudes']['max'], 45)
+        # Bilinear interpolation between pixels centers
+        self.assertEqual(extent['altitudes']['max'], 40)
         self.assertEqual(extent['altitudes']['min'], 0)
 
+    def test_area_without_dem_is_empty(self):
+        conn = connections[DEFAULT_DB_ALIAS]
+        conn.cursor().execute('DROP TABLE mnt')
+        self.assertEqual(AltimetryHelper.elevation_area(self.geom), {})
+
+
+class DEMTileTest(TestCase):
+    def setUp(self):
+        conn = connections[DEFAULT_DB_ALIAS]
+        cur = conn.cursor()
+        cur.execute('CREATE TABLE mnt (rid serial primary key, rast raster)')
+        cur.execute('INSERT INTO mnt (rast) VALUES (ST_MakeEmptyRaster(3, 2, 0, 50, 25, -25, 0, 0, %s))', [settings.SRID])
+        cur.execute('UPDATE mnt SET rast = ST_AddBand(rast, \'16BSI\', 0, -9999)')
+        for x, y, value in [(1, 1, 10), (2, 1, 20), (3, 1, -9999), (1, 2, 30), (2, 2, 40), (3, 2, 50)]:
+            cur.execute('UPDATE mnt SET rast = ST_SetValue(rast, %s, %s, %s::float)', [x, y, value])
+
+    def test_tiles_are_read_from_binary(self):
+        tiles = list(dem.iter_tiles((0, 0, 75, 50)))
+        self.assertEqual(len(tiles), 1)
+        tile = tiles[0]
+        self.assertEqual((tile.x, tile.y, tile.scale_x, tile.scale_y), (0, 50, 25, -25))
+        self.assertEqual(tile.values[:, :2].tolist(), [[10, 20], [30, 40]])
+        self.assertTrue(numpy.isnan(tile.values[0, 2]))
+        self.assertEqual(tile.values[1, 2], 50)
+
+    def test_bilinear_sampling(self):
+        grid = dem.sample_grid((0, 0, 50, 50), 25)
+        # Rows go north, points out of raster have no data
+        self.assertEqual(grid.shape, (3, 3))
+        self.assertTrue(numpy.isnan(grid[0]).all())
+        self.assertEqual(grid[1, :2].tolist(), [20, 25])
+        self.assertEqual(grid[2, :2].tolist(), [10, 15])
+        # Neighbour without data: value of containing pixel
+        self.assertEqual(grid[1, 2], 50)
+        self.assertTrue(numpy.isnan(grid[2, 2]))
+
 
 class LengthTest(TestCase):
 
@@ -14,6 +14,8 @@ class Command(BaseCommand):
     option_list = BaseCommand.option_list + (
         make_option('-l', dest='limit', type='int',
                     help='Limit number of lines to import'),
+        make_option('-b', '--batch-size', dest='batch_size', type='int',
+                    help='Save lines by chunks of this size'),
     )
 
     def handle(self, *args, **options):
@@ -42,6 +44,8 @@ class Command(BaseCommand):
                     line=line, eid=eid, progress=int(100 * progress)))
 
         parser = Parser(progress_cb=progress_cb)
+        if options.get('batch_size'):
+            parser.batch_size = options['batch_size']
 
         try:
             parser.parse(args[1] if len(args) >= 2 else None, limit=limit)
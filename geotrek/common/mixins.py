@@ -15,7 +15,7 @@ from easy_thumbnails.exceptions import InvalidImageFormatError
 from easy_thumbnails.files import get_thumbnailer
 from embed_video.backends import detect_backend, VideoDoesntExistException
 
-from geotrek.common.utils import classproperty
+from geotrek.common.utils import classproperty, prefetchable
 
 logger = logging.getLogger(__name__)
 
@@ -93,6 +93,30 @@ class PicturesMixin(object):
     def pictures(self, values):
         self._pictures = values
 
+    @classmethod
+    def prefetch_attachments(cls, objects):
+        """
+        Fetch pictures, videos and files of many objects at once.
+        """
+        from paperclip.models import Attachment
+
+        attachments = Attachment.objects.filter(content_type__app_label=cls._meta.app_label,
+                                                content_type__model=cls._meta.model_name,
+                                                object_id__in=[obj.pk for obj in objects])
+        pictures, videos, files = {}, {}, {}
+        for attachment in attachments.order_by('-starred', 'attachment_file'):
+            if attachment.attachment_video:
+                videos.setdefault(attachment.object_id, []).append(attachment)
+            if attachment.is_image:
+                if attachment.title != 'mapimage':
+                    pictures.setdefault(attachment.object_id, []).append(attachment)
+            elif attachment.attachment_file.name:
+                files.setdefault(attachment.object_id, []).append(attachment)
+        for obj in objects:
+            obj.pictures = pictures.get(obj.pk, [])
+            obj._videos = videos.get(obj.pk, [])
+            obj._files = files.get(obj.pk, [])
+
     @property
     def serializable_pictures(self):
         serialized = []
@@ -170,6 +194,8 @@ class PicturesMixin(object):
 
     @property
     def videos(self):
+        if hasattr(self, '_videos'):
+            return self._videos
         all_attachments = self.attachments.order_by('-starred')
         return all_attachments.exclude(attachment_video='')
 
@@ -193,6 +219,8 @@ class PicturesMixin(object):
 
     @property
     def files(self):
+        if hasattr(self, '_files'):
+            return self._files
         all_attachments = self.attachments.order_by('-starred')
         all_attachments = all_attachments.exclude(attachment_file='')
         return [a for a in all_attachments if not a.is_image]
@@ -401,5 +429,10 @@ class AddPropertyMixin(object):
     def add_property(cls, name, func, verbose_name):
         if hasattr(cls, name):
             raise AttributeError("%s has already an attribute %s" % (cls, name))
-        setattr(cls, name, property(func))
+        setattr(cls, name, property(prefetchable(func, name)))
         setattr(cls, '%s_verbose_name' % name, verbose_name)
+
+    def set_prefetched(self, name, value):
+        """ Value of property ``name`` for this object, computed by a batch loader
+        """
+        self.__dict__.setdefault('_prefetched', {})[name] = value
@@ -5,7 +5,7 @@ from django.conf import settings
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
-from paperclip.models import FileType as BaseFileType
+from paperclip.models import FileType as BaseFileType, Attachment
 
 from geotrek.authent.models import StructureRelated
 from geotrek.common.mixins import PictogramMixin, OptionalPictogramMixin
@@ -39,6 +39,27 @@ class FileType(StructureRelated, BaseFileType):
         return cls.for_user(request.user)
 
 
+class AttachmentSource(models.Model):
+    """
+    Where an imported attachment was downloaded from, with the validators
+    of its content (HTTP ETag and Last-Modified, size), so that next imports
+    do not download it again while it is unchanged.
+    """
+    attachment = models.OneToOneField(Attachment, related_name='source', db_column='fichier')
+    url = models.CharField(max_length=512, verbose_name=_(u"URL"))
+    etag = models.CharField(max_length=256, blank=True, default='', verbose_name=_(u"ETag"))
+    last_modified = models.CharField(max_length=64, blank=True, default='', verbose_name=_(u"Last modified"))
+    size = models.IntegerField(null=True, blank=True, verbose_name=_(u"Size"))
+
+    class Meta:
+        db_table = 'fl_t_fichier_source'
+        verbose_name = _(u"Attachment source")
+        verbose_name_plural = _(u"Attachment sources")
+
+    def __unicode__(self):
+        return self.url
+
+
 class Theme(PictogramMixin):
 
     label = models.CharField(verbose_name=_(u"Label"), max_length=128, db_column='theme')
@@ -1,20 +1,25 @@
 # -*- encoding: utf-8 -*-
 
+import ftplib
 import os
 import re
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+import threading
 import xlrd
 import xml.etree.ElementTree as ET
-import urllib2
 
-from ftplib import FTP
-from os.path import dirname
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 from urlparse import urlparse
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import signals
+from django.db.models.fields import FieldDoesNotExist
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.gdal import DataSource
 from django.core.files.base import ContentFile
 from django.template.loader import render_to_string
@@ -27,7 +32,7 @@ from modeltranslation.translator import translator, NotRegistered
 from paperclip.models import Attachment, attachment_upload
 
 from geotrek.authent.models import default_structure
-from geotrek.common.models import FileType
+from geotrek.common.models import FileType, AttachmentSource
 
 
 class ImportError(Exception):
@@ -46,6 +51,11 @@ class ValueImportError(ImportError):
     pass
 
 
+# Natural key values shared by several objects (never served from cache)
+_AMBIGUOUS = object()
+_UNKNOWN = object()
+
+
 class Parser(object):
     label = None
     filename = None
@@ -65,6 +75,7 @@ class Parser(object):
     non_fields = {}
     natural_keys = {}
     field_options = {}
+    batch_size = None  # Rows parsed and saved at once (row by row if None)
 
     def __init__(self, progress_cb=None):
         self.warnings = {}
@@ -74,6 +85,16 @@ class Parser(object):
         self.nb_updated = 0
         self.nb_unmodified = 0
         self.progress_cb = progress_cb
+        # Related objects by (model, natural key) and natural key value,
+        # None for values which do not exist
+        self.lookups = {}
+        self.nb_lookup_hits = 0
+        self.nb_lookup_misses = 0
+        self.fields_cache = {}
+        # Many-to-many values saved at the end of chunk (batch mode), by
+        # (object id, field), and previous values for the current row
+        self.m2m_values = None
+        self.m2m_undo = {}
 
         try:
             mto = translator.get_options_for_model(self.model)
@@ -141,8 +162,15 @@ class Parser(object):
                 required = u"required " if self.field_options.get(dst, {}).get('required', False) else ""
                 raise ValueImportError(_(u"Missing {required}field '{src}'").format(required=required, src=src))
 
+    def get_field(self, dst):
+        try:
+            return self.fields_cache[dst]
+        except KeyError:
+            field = self.fields_cache[dst] = self.model._meta.get_field_by_name(dst)[0]
+            return field
+
     def apply_filter(self, dst, src, val):
-        field = self.model._meta.get_field_by_name(dst)[0]
+        field = self.get_field(dst)
         if (isinstance(field, models.ForeignKey) or isinstance(field, models.ManyToManyField)):
             if dst not in self.natural_keys:
                 raise ValueImportError(_(u"Destination field '{dst}' not in natural keys configuration").format(dst=dst))
@@ -161,7 +189,7 @@ class Parser(object):
             return getattr(self, 'save_{0}'.format(dst))(src, val)
 
     def set_value(self, dst, src, val):
-        field = self.model._meta.get_field_by_name(dst)[0]
+        field = self.get_field(dst)
         if val is None and not field.null:
             if field.blank and (isinstance(field, models.CharField) or isinstance(field, models.TextField)):
                 val = u""
@@ -169,7 +197,15 @@ class Parser(object):
                 raise RowImportError(_(u"Null value not allowed for field '{src}'".format(src=src)))
         if val == u"" and not field.blank:
             raise RowImportError(_(u"Blank value not allowed for field '{src}'".format(src=src)))
+        if isinstance(field, models.ManyToManyField) and self.m2m_values is not None and self.bulk_m2m_allowed(field):
+            key = (id(self.obj), dst)
+            self.m2m_undo.setdefault(key, self.m2m_values.get(key))
+            self.m2m_values[key] = (self.obj, self.line, val)
+            return
         setattr(self.obj, dst, val)
+        if isinstance(field, models.ManyToManyField):
+            # Do not compare next rows with prefetched values (batch mode)
+            getattr(self.obj, '_prefetched_objects_cache', {}).pop(dst, None)
 
     def parse_real_field(self, dst, src, val):
         """Returns True if modified"""
@@ -179,7 +215,8 @@ class Parser(object):
             val = self.apply_filter(dst, src, val)
         if hasattr(self.obj, dst):
             if dst in self.m2m_fields or dst in self.m2m_constant_fields:
-                old = set(getattr(self.obj, dst).all())
+                pending = (self.m2m_values or {}).get((id(self.obj), dst))
+                old = set(pending[2] if pending else getattr(self.obj, dst).all())
                 val = set(val)
             else:
                 old = getattr(self.obj, dst)
@@ -226,17 +263,28 @@ class Parser(object):
                 continue
         return updated
 
-    def parse_obj(self, row, operation):
+    def parse_obj_fields(self, row):
+        """Returns modified fields, None if row is invalid"""
         try:
             update_fields = self.parse_fields(row, self.fields)
             update_fields += self.parse_fields(row, self.constant_fields)
         except RowImportError as warnings:
             self.add_warning(unicode(warnings))
+            return None
+        return update_fields
+
+    def parse_obj(self, row, operation):
+        update_fields = self.parse_obj_fields(row)
+        if update_fields is None:
             return
         if operation == u"created":
             self.obj.save()
         else:
             self.obj.save(update_fields=update_fields)
+        self.parse_obj_relations(row, operation, update_fields)
+
+    def parse_obj_relations(self, row, operation, update_fields):
+        """Parse fields of saved object which need its primary key, and count it"""
         update_fields += self.parse_fields(row, self.m2m_fields)
         update_fields += self.parse_fields(row, self.m2m_constant_fields)
         update_fields += self.parse_fields(row, self.non_fields, non_field=True)
@@ -276,18 +324,9 @@ class Parser(object):
                 self.add_warning(unicode(warnings))
                 return
             objects = self.model.objects.filter(**eid_kwargs)
-        if len(objects) == 0 and self.update_only:
-            if self.warn_on_missing_objects:
-                self.add_warning(_(u"Bad value '{eid_val}' for field '{eid_src}'. No object with this identifier").format(eid_val=self.eid_val, eid_src=self.eid_src))
-            return
-        elif len(objects) == 0:
-            objects = [self.model(**eid_kwargs)]
-            operation = u"created"
-        elif len(objects) >= 2 and not self.duplicate_eid_allowed:
-            self.add_warning(_(u"Bad value '{eid_val}' for field '{eid_src}'. Multiple objects with this identifier").format(eid_val=self.eid_val, eid_src=self.eid_src))
+        objects, operation = self.select_objects(objects, eid_kwargs)
+        if objects is None:
             return
-        else:
-            operation = u"updated"
         for self.obj in objects:
             self.parse_obj(row, operation)
             self.to_delete.discard(self.obj.pk)
@@ -295,6 +334,241 @@ class Parser(object):
         if self.progress_cb:
             self.progress_cb(float(self.line) / self.nb, self.line, self.eid_val)
 
+    def select_objects(self, objects, eid_kwargs):
+        """Returns objects to parse row into and operation, (None, None) to skip row"""
+        if len(objects) == 0 and self.update_only:
+            if self.warn_on_missing_objects:
+                self.add_warning(_(u"Bad value '{eid_val}' for field '{eid_src}'. No object with this identifier").format(eid_val=self.eid_val, eid_src=self.eid_src))
+            return None, None
+        elif len(objects) == 0:
+            return [self.model(**eid_kwargs)], u"created"
+        elif len(objects) >= 2 and not self.duplicate_eid_allowed:
+            self.add_warning(_(u"Bad value '{eid_val}' for field '{eid_src}'. Multiple objects with this identifier").format(eid_val=self.eid_val, eid_src=self.eid_src))
+            return None, None
+        return objects, u"updated"
+
+    def eid_key(self, val):
+        """Identifier value, as compared by database"""
+        if isinstance(val, models.Model):
+            return val.pk
+        return self.get_field(self.eid).get_prep_value(val)
+
+    def fetch_objects(self, eid_vals):
+        """Existing objects by identifier, with their many-to-many relations"""
+        related = []
+        for dst in list(self.m2m_fields) + list(self.m2m_constant_fields):
+            try:
+                if isinstance(self.get_field(dst), models.ManyToManyField):
+                    related.append(dst)
+            except FieldDoesNotExist:
+                continue
+        queryset = self.model.objects.filter(**{'{0}__in'.format(self.eid): eid_vals})
+        objects = {}
+        for obj in queryset.prefetch_related(*related):
+            objects.setdefault(self.eid_key(getattr(obj, self.eid)), []).append(obj)
+        return objects
+
+    def parse_rows(self, rows):
+        """
+        Parse a chunk of rows (batch mode): existing objects are fetched with
+        one query, and new or modified objects with their relations are saved
+        at once, in one transaction. Counts and warnings are the same as row
+        by row.
+        """
+        entries = []
+        for row in rows:
+            self.eid_val = None
+            self.line += 1
+            try:
+                eid_kwargs = {} if self.eid is None else self.get_eid_kwargs(row)
+            except RowImportError as warnings:
+                self.add_warning(unicode(warnings))
+                continue
+            except Exception as e:
+                if settings.DEBUG:
+                    raise
+                self.add_warning(unicode(e))
+                continue
+            entries.append((self.line, self.eid_val, row, eid_kwargs))
+        nb_lines = self.line
+
+        existing = {}
+        if self.eid is not None and entries:
+            existing = self.fetch_objects([entry[3][self.eid] for entry in entries])
+
+        # Parse fields in memory
+        parsed = []
+        to_create = OrderedDict()
+        to_update = OrderedDict()
+        for self.line, self.eid_val, row, eid_kwargs in entries:
+            key = None if self.eid is None else self.eid_key(eid_kwargs[self.eid])
+            objects, operation = self.select_objects(existing.get(key, []), eid_kwargs)
+            if objects is None:
+                continue
+            results = []
+            try:
+                for self.obj in objects:
+                    update_fields = self.parse_obj_fields(row)
+                    results.append((self.obj, operation, update_fields))
+                    if update_fields is None:
+                        continue
+                    if operation == u"created":
+                        to_create[id(self.obj)] = (self.obj, self.line)
+                        if self.eid is not None:
+                            # Next rows with this identifier update it
+                            existing[key] = [self.obj]
+                    elif update_fields and id(self.obj) not in to_create:
+                        updated = to_update.setdefault(id(self.obj), (self.obj, self.line, set()))
+                        updated[2].update(update_fields)
+            except Exception as e:
+                if settings.DEBUG:
+                    raise
+                self.add_warning(unicode(e))
+                continue
+            parsed.append((self.line, self.eid_val, row, results))
+
+        with transaction.atomic():
+            failed = self.save_objects(to_create.values(), to_update.values())
+            self.m2m_values = OrderedDict()
+            try:
+                self.parse_rows_relations(parsed, failed)
+                self.save_m2m_values()
+            finally:
+                self.m2m_values = None
+        self.line = nb_lines
+
+    def parse_rows_relations(self, parsed, failed):
+        """Parse fields which need primary keys, with a savepoint per row"""
+        for self.line, self.eid_val, row, results in parsed:
+            if any(id(obj) in failed for obj, operation, update_fields in results):
+                continue
+            self.m2m_undo = {}
+            try:
+                with transaction.atomic():
+                    for self.obj, operation, update_fields in results:
+                        if update_fields is not None:
+                            self.parse_obj_relations(row, operation, update_fields)
+                        self.to_delete.discard(self.obj.pk)
+            except Exception as e:
+                if settings.DEBUG:
+                    raise
+                # Forget many-to-many values of this row
+                for key, previous in self.m2m_undo.items():
+                    if previous is None:
+                        del self.m2m_values[key]
+                    else:
+                        self.m2m_values[key] = previous
+                self.add_warning(unicode(e))
+                continue
+            self.nb_success += 1
+            if self.progress_cb:
+                self.progress_cb(float(self.line) / self.nb, self.line, self.eid_val)
+
+    def bulk_m2m_allowed(self, field):
+        """Bulk statements on relation table do not send ``m2m_changed`` signals"""
+        through = field.rel.through
+        return through._meta.auto_created and not signals.m2m_changed.has_listeners(through)
+
+    def save_m2m_values(self):
+        """
+        Replace many-to-many relations set in batch mode, with two statements
+        per field. Relations are set object after object if they fail.
+        """
+        fields = OrderedDict()
+        for (obj_id, dst), (obj, line, val) in self.m2m_values.items():
+            fields.setdefault(dst, []).append((obj, line, val))
+        for dst, values in fields.items():
+            field = self.get_field(dst)
+            through = field.rel.through
+            source = '{0}_id'.format(field.m2m_field_name())
+            target = '{0}_id'.format(field.m2m_reverse_field_name())
+            try:
+                with transaction.atomic():
+                    through.objects.filter(**{'{0}__in'.format(source): [obj.pk for obj, line, val in values]}).delete()
+                    through.objects.bulk_create([through(**{source: obj.pk, target: pk})
+                                                 for obj, line, val in values
+                                                 for pk in set([related.pk for related in val])])
+            except Exception:
+                for obj, line, val in values:
+                    try:
+                        with transaction.atomic():
+                            setattr(obj, dst, val)
+                    except Exception as e:
+                        if settings.DEBUG:
+                            raise
+                        self.line = line
+                        self.add_warning(unicode(e))
+
+    def bulk_save_allowed(self):
+        """Bulk statements do not call ``save()`` nor send signals"""
+        return (self.eid is not None and not self.model._meta.parents and
+                self.model.save.im_func is models.Model.save.im_func and
+                not signals.pre_save.has_listeners(self.model) and
+                not signals.post_save.has_listeners(self.model))
+
+    def bulk_create(self, objects):
+        self.model.objects.bulk_create(objects)
+        # Primary keys are not returned by bulk_create()
+        missing = [obj for obj in objects if obj.pk is None]
+        if missing:
+            queryset = self.model.objects.filter(**{'{0}__in'.format(self.eid): [getattr(obj, self.eid) for obj in missing]})
+            pks = {self.eid_key(eid_val): pk for eid_val, pk in queryset.values_list(self.eid, 'pk')}
+            for obj in missing:
+                obj.pk = pks[self.eid_key(getattr(obj, self.eid))]
+
+    def bulk_update(self, objects):
+        """Update objects (with their modified fields) with one statement per set of values"""
+        groups = OrderedDict()
+        for obj, fields in objects:
+            values = [(field, None, field.pre_save(obj, False))
+                      for field in obj._meta.local_concrete_fields
+                      if not field.primary_key and (field.name in fields or field.attname in fields)]
+            try:
+                key = tuple([(field.attname, value) for field, model, value in values])
+                hash(key)
+            except TypeError:
+                key = id(obj)
+            groups.setdefault(key, (values, []))[1].append(obj.pk)
+        for values, pks in groups.values():
+            # Same statement as save(update_fields=...), for several objects
+            self.model._base_manager.filter(pk__in=pks)._update(values)
+
+    def save_objects(self, to_create, to_update):
+        """
+        Save new objects and modified fields of objects (with their line) in
+        one transaction, with bulk statements when possible. Returns ids of
+        objects which could not be saved.
+        """
+        failed = set()
+        with transaction.atomic():
+            if self.bulk_save_allowed():
+                pks = [obj.pk for obj, line in to_create]
+                try:
+                    with transaction.atomic():
+                        self.bulk_create([obj for obj, line in to_create])
+                        self.bulk_update([(obj, fields) for obj, line, fields in to_update])
+                    return failed
+                except Exception:
+                    # Save objects one by one, to report failures on their line
+                    for (obj, line), pk in zip(to_create, pks):
+                        obj.pk = pk
+            for obj, line in to_create:
+                self.save_object(obj, line, failed)
+            for obj, line, fields in to_update:
+                self.save_object(obj, line, failed, update_fields=list(fields))
+        return failed
+
+    def save_object(self, obj, line, failed, **kwargs):
+        try:
+            with transaction.atomic():
+                obj.save(**kwargs)
+        except Exception as e:
+            if settings.DEBUG:
+                raise
+            self.line = line
+            self.add_warning(unicode(e))
+            failed.add(id(obj))
+
     def report(self, output_format='txt'):
         context = {
             'nb_success': self.nb_success,
@@ -303,6 +577,8 @@ class Parser(object):
             'nb_updated': self.nb_updated,
             'nb_deleted': len(self.to_delete) if self.delete else None,
             'nb_unmodified': self.nb_unmodified,
+            'nb_lookups': self.nb_lookup_hits + self.nb_lookup_misses,
+            'nb_lookup_hits': self.nb_lookup_hits,
             'warnings': self.warnings,
         }
         return render_to_string('common/parser_report.{output_format}'.format(output_format=output_format), context)
@@ -326,20 +602,60 @@ class Parser(object):
                 val = mapping[val]
         return val
 
+    def preload_natural_keys(self):
+        """
+        Fill lookup cache with all objects of models related by fields of
+        ``natural_keys``, with two queries per model.
+        """
+        for dst, natural_key in self.natural_keys.iteritems():
+            try:
+                field = self.get_field(dst)
+            except FieldDoesNotExist:
+                continue
+            if not isinstance(field, (models.ForeignKey, models.ManyToManyField)):
+                continue
+            model = field.rel.to
+            if (model, natural_key) in self.lookups:
+                continue
+            pks = {}
+            for value, pk in model.objects.values_list(natural_key, 'pk'):
+                pks[value] = _AMBIGUOUS if value in pks else pk
+            objects = model.objects.in_bulk([pk for pk in pks.values() if pk is not _AMBIGUOUS])
+            self.lookups[(model, natural_key)] = {
+                value: _AMBIGUOUS if pk is _AMBIGUOUS else objects[pk]
+                for value, pk in pks.iteritems() if value is not None and (pk is _AMBIGUOUS or pk in objects)
+            }
+
+    def get_natural(self, model, field, val, create=False):
+        """
+        Returns the object of model whose natural key ``field`` is ``val``
+        (None if it does not exist), from lookup cache when possible.
+        """
+        lookups = self.lookups.setdefault((model, field), {})
+        obj = lookups.get(val, _UNKNOWN)
+        if obj is _UNKNOWN or obj is _AMBIGUOUS or (obj is None and create):
+            self.nb_lookup_misses += 1
+            if create:
+                obj, created = model.objects.get_or_create(**{field: val})
+                if created:
+                    self.add_warning(_(u"{model} '{val}' did not exist in Geotrek-Admin and was automatically created").format(model=model._meta.verbose_name.title(), val=obj))
+            else:
+                try:
+                    obj = model.objects.get(**{field: val})
+                except model.DoesNotExist:
+                    obj = None
+            lookups[val] = obj
+        else:
+            self.nb_lookup_hits += 1
+        if obj is None:
+            self.add_warning(_(u"{model} '{val}' does not exists in Geotrek-Admin. Please add it").format(model=model._meta.verbose_name.title(), val=val))
+        return obj
+
     def filter_fk(self, src, val, model, field, mapping=None, partial=False, create=False):
         val = self.get_mapping(src, val, mapping, partial)
         if val is None:
             return None
-        if create:
-            val, created = model.objects.get_or_create(**{field: val})
-            if created:
-                self.add_warning(_(u"{model} '{val}' did not exist in Geotrek-Admin and was automatically created").format(model=model._meta.verbose_name.title(), val=val))
-            return val
-        try:
-            return model.objects.get(**{field: val})
-        except model.DoesNotExist:
-            self.add_warning(_(u"{model} '{val}' does not exists in Geotrek-Admin. Please add it").format(model=model._meta.verbose_name.title(), val=val))
-            return None
+        return self.get_natural(model, field, val, create)
 
     def filter_m2m(self, src, val, model, field, mapping=None, partial=False, create=False):
         if not val:
@@ -352,24 +668,16 @@ class Parser(object):
             subval = self.get_mapping(src, subval, mapping, partial)
             if subval is None:
                 continue
-            if create:
-                subval, created = model.objects.get_or_create(**{field: subval})
-                if created:
-                    self.add_warning(_(u"{model} '{val}' did not exist in Geotrek-Admin and was automatically created").format(model=model._meta.verbose_name.title(), val=subval))
-                dst.append(subval)
-                continue
-            try:
-                dst.append(model.objects.get(**{field: subval}))
-            except model.DoesNotExist:
-                self.add_warning(_(u"{model} '{val}' does not exists in Geotrek-Admin. Please add it").format(model=model._meta.verbose_name.title(), val=subval))
-                continue
+            obj = self.get_natural(model, field, subval, create)
+            if obj is not None:
+                dst.append(obj)
         return dst
 
     def start(self):
         # FIXME: use mapping if it exists
         kwargs = {}
         for dst, val in self.constant_fields.iteritems():
-            field = self.model._meta.get_field_by_name(dst)[0]
+            field = self.get_field(dst)
             if isinstance(field, models.ForeignKey):
                 natural_key = self.natural_keys[dst]
                 try:
@@ -380,13 +688,17 @@ class Parser(object):
                 kwargs[dst] = val
         for dst, val in self.m2m_constant_fields.iteritems():
             assert not self.separator or self.separator not in val
-            field = self.model._meta.get_field_by_name(dst)[0]
+            field = self.get_field(dst)
             natural_key = self.natural_keys[dst]
             try:
                 kwargs[dst] = field.rel.to.objects.get(**{natural_key: subval for subval in val})
             except field.rel.to.DoesNotExist:
                 raise GlobalImportError(_(u"{model} '{val}' does not exists in Geotrek-Admin. Please add it").format(model=field.rel.to._meta.verbose_name.title(), val=val))
-        self.to_delete = set(self.model.objects.filter(**kwargs).values_list('pk', flat=True))
+        if self.delete:
+            self.to_delete = set(self.model.objects.filter(**kwargs).values_list('pk', flat=True))
+        else:
+            self.to_delete = set()
+        self.preload_natural_keys()
 
     def end(self):
         if self.delete:
@@ -400,15 +712,24 @@ class Parser(object):
         if self.filename and not os.path.exists(self.filename):
             raise GlobalImportError(_(u"File does not exists at: {filename}").format(filename=self.filename))
         self.start()
+        rows = []
         for i, row in enumerate(self.next_row()):
             if limit and i >= limit:
                 break
+            if self.batch_size:
+                rows.append(row)
+                if len(rows) >= self.batch_size:
+                    self.parse_rows(rows)
+                    rows = []
+                continue
             try:
                 self.parse_row(row)
             except Exception as e:
                 if settings.DEBUG:
                     raise
                 self.add_warning(unicode(e))
+        if rows:
+            self.parse_rows(rows)
         self.end()
 
 
@@ -477,6 +798,8 @@ class AttachmentParserMixin(object):
     base_url = ''
     delete_attachments = False
     filetype_name = u"Photographie"
+    download_jobs = 4  # Concurrent attachments downloads
+    download_queue_size = 100  # Attachments queued before downloading them (row by row)
     non_fields = {
         'attachments': _(u"Attachments"),
     }
@@ -488,64 +811,64 @@ class AttachmentParserMixin(object):
         except FileType.DoesNotExist:
             raise GlobalImportError(_(u"FileType '{name}' does not exists in Geotrek-Admin. Please add it").format(name=self.filetype_name))
         self.creator, created = get_user_model().objects.get_or_create(username='import', defaults={'is_active': False})
+        # Attachments to download or check, by primary keys, when rows are parsed
+        self.attachments_jobs = []
+        self.attachments_objects = set()
+        self.attachments_unmodified = set()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=self.download_jobs)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.ftp_connections = {}
+        self.ftp_lock = threading.Lock()
+
+    def end(self):
+        try:
+            self.sync_attachments()
+        finally:
+            for ftp, lock in self.ftp_connections.values():
+                ftp.close()
+            self.ftp_connections = {}
+        super(AttachmentParserMixin, self).end()
+
+    def parse_row(self, row):
+        super(AttachmentParserMixin, self).parse_row(row)
+        if len(self.attachments_jobs) >= self.download_queue_size:
+            self.sync_attachments()
+
+    def parse_rows(self, rows):
+        super(AttachmentParserMixin, self).parse_rows(rows)
+        # Chunk is committed
+        self.sync_attachments()
 
     def filter_attachments(self, src, val):
         if not val:
             return []
         return [(subval.strip(), '', '') for subval in val.split(self.separator) if subval.strip()]
 
-    def has_size_changed(self, url, attachment):
-        try:
-            parsed_url = urlparse(url)
-            if parsed_url.scheme == 'ftp':
-                directory = dirname(parsed_url.path)
-
-                ftp = FTP(parsed_url.hostname)
-                ftp.login(user=parsed_url.username, passwd=parsed_url.password)
-                ftp.cwd(directory)
-                size = ftp.size(parsed_url.path.split('/')[-1:][0])
-                return size != attachment.attachment_file.size
-
-            if parsed_url.scheme == 'http' or parsed_url.scheme == 'https':
-                http = urllib2.urlopen(url)
-                size = http.headers.getheader('content-length')
-                return int(size) != attachment.attachment_file.size
-        except:
-            return False
-        return True
-
-    def download_attachment(self, url):
-        if url[:6] == 'ftp://':
-            try:
-                response = urllib2.urlopen(url)
-            except:
-                self.add_warning(_(u"Failed to download '{url}'").format(url=url))
-                return None
-            return response.read()
-        else:
-            try:
-                response = requests.get(url)
-            except requests.exceptions.RequestException as e:
-                raise ValueImportError('Failed to load attachment: ' + unicode(e))
-            if response.status_code != requests.codes.ok:
-                self.add_warning(_(u"Failed to download '{url}'").format(url=url))
-                return None
-            return response.content
+    def parse_obj_relations(self, row, operation, update_fields):
+        nb_unmodified = self.nb_unmodified
+        super(AttachmentParserMixin, self).parse_obj_relations(row, operation, update_fields)
+        if self.nb_unmodified > nb_unmodified and self.obj.pk in self.attachments_objects:
+            # Counted as updated if one of its attachments is (see sync_attachments())
+            self.attachments_unmodified.add(self.obj.pk)
 
     def save_attachments(self, src, val):
+        """
+        Update legend and author of attachments, and queue them to be
+        downloaded (new) or checked (existing) by ``sync_attachments()``.
+        """
         updated = False
-        attachments_to_delete = list(Attachment.objects.attachments_for_object(self.obj))
+        attachments_to_delete = list(Attachment.objects.attachments_for_object(self.obj).select_related('source'))
         for url, legend, author in self.filter_attachments(src, val):
             url = self.base_url + url
             legend = legend or u""
             author = author or u""
             name = os.path.basename(url)
-            found = False
             for attachment in attachments_to_delete:
                 upload_name, ext = os.path.splitext(attachment_upload(attachment, name))
                 existing_name = attachment.attachment_file.name
-                if re.search(ur"^{name}(_\d+)?{ext}$".format(name=upload_name, ext=ext), existing_name) and not self.has_size_changed(url, attachment):
-                    found = True
+                if re.search(ur"^{name}(_\d+)?{ext}$".format(name=upload_name, ext=ext), existing_name):
                     attachments_to_delete.remove(attachment)
                     if author != attachment.author or legend != attachment.legend:
                         attachment.author = author
@@ -553,26 +876,175 @@ class AttachmentParserMixin(object):
                         attachment.save()
                         updated = True
                     break
-            if found:
-                continue
-            content = self.download_attachment(url)
-            if content is None:
-                continue
-            f = ContentFile(content)
-            attachment = Attachment()
-            attachment.content_object = self.obj
-            attachment.attachment_file.save(name, f, save=False)
-            attachment.filetype = self.filetype
-            attachment.creator = self.creator
-            attachment.author = author
-            attachment.legend = legend
-            attachment.save()
-            updated = True
+            else:
+                attachment = None
+            self.attachments_jobs.append((self.obj.pk, self.line, url, name, legend, author,
+                                          attachment.pk if attachment is not None else None))
+            self.attachments_objects.add(self.obj.pk)
         if self.delete_attachments:
             for att in attachments_to_delete:
                 att.delete()
         return updated
 
+    def sync_attachments(self):
+        """
+        Download queued attachments with ``download_jobs`` concurrent
+        downloads. Existing attachments are downloaded again only if they
+        changed since last import.
+        """
+        jobs, self.attachments_jobs = self.attachments_jobs, []
+        unmodified, self.attachments_unmodified = self.attachments_unmodified, set()
+        self.attachments_objects = set()
+        if not jobs:
+            return
+        attachments = Attachment.objects.select_related('source').in_bulk([job[6] for job in jobs if job[6] is not None])
+        jobs = [job[:6] + (attachments.get(job[6]),) for job in jobs]
+
+        def fetch((job, known)):
+            try:
+                return job, self.fetch_attachment(job[2], known), None
+            except Exception as e:
+                return job, (None, None), e
+
+        # Validators are read here: threads must not query database
+        jobs = [(job, self.known_validators(job[6]) if job[6] is not None else None) for job in jobs]
+        line = self.line
+        pool = ThreadPool(max(1, min(self.download_jobs, len(jobs))))
+        try:
+            # Attachments are saved by this thread, as they arrive
+            for job, (content, validators), error in pool.imap_unordered(fetch, jobs):
+                self.save_attachment(job, content, validators, error, unmodified)
+        finally:
+            self.line = line
+            pool.close()
+            pool.join()
+
+    def known_validators(self, attachment):
+        try:
+            size = attachment.attachment_file.size
+        except (OSError, ValueError):
+            # File is missing: download it again
+            return None
+        try:
+            source = attachment.source
+        except AttachmentSource.DoesNotExist:
+            return {'etag': u"", 'last_modified': u"", 'size': size}
+        return {'etag': source.etag, 'last_modified': source.last_modified, 'size': size}
+
+    def save_attachment(self, job, content, validators, error, unmodified):
+        pk, line, url, name, legend, author, attachment = job
+        self.line = line
+        if error is not None:
+            # Keep existing attachment if it can not be checked
+            if attachment is None:
+                self.add_warning(_(u"Failed to download '{url}'").format(url=url))
+            return
+        if content is None:
+            if attachment is not None:
+                self.save_attachment_source(attachment, url, validators)
+            return
+        f = ContentFile(content)
+        new_attachment = Attachment()
+        new_attachment.content_type = ContentType.objects.get_for_model(self.model)
+        new_attachment.object_id = pk
+        new_attachment.attachment_file.save(name, f, save=False)
+        new_attachment.filetype = self.filetype
+        new_attachment.creator = self.creator
+        new_attachment.author = author
+        new_attachment.legend = legend
+        new_attachment.save()
+        self.save_attachment_source(new_attachment, url, validators)
+        if attachment is not None and self.delete_attachments:
+            attachment.delete()
+        if pk in unmodified:
+            unmodified.discard(pk)
+            self.nb_unmodified -= 1
+            self.nb_updated += 1
+
+    def save_attachment_source(self, attachment, url, validators):
+        try:
+            source = attachment.source
+        except AttachmentSource.DoesNotExist:
+            source = AttachmentSource(attachment=attachment)
+        values = dict(validators, url=url)
+        if any(getattr(source, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(source, field, value)
+            source.save()
+
+    def fetch_attachment(self, url, known=None):
+        """
+        Returns content of attachment at url (None if it did not change since
+        ``known`` validators) and its validators (etag, last_modified and
+        size). Called from download threads: must not query database.
+        """
+        if urlparse(url).scheme == 'ftp':
+            return self.fetch_ftp_attachment(url, known)
+        return self.fetch_http_attachment(url, known)
+
+    def fetch_http_attachment(self, url, known):
+        headers = {}
+        if known is not None:
+            if known['etag']:
+                headers['If-None-Match'] = known['etag']
+            if known['last_modified']:
+                headers['If-Modified-Since'] = known['last_modified']
+            if not headers:
+                # No validators yet: compare sizes
+                response = self.session.head(url, allow_redirects=True)
+                if (response.status_code == requests.codes.ok and
+                        response.headers.get('content-length') == str(known['size'])):
+                    return None, self.http_validators(response, known['size'])
+        response = self.session.get(url, headers=headers)
+        if response.status_code == requests.codes.not_modified:
+            return None, self.http_validators(response, known['size'], known)
+        if response.status_code != requests.codes.ok:
+            raise ValueImportError(_(u"Failed to download '{url}'").format(url=url))
+        size = len(response.content)
+        if known is not None and size == known['size']:
+            # Validators not supported by server
+            return None, self.http_validators(response, size)
+        return response.content, self.http_validators(response, size)
+
+    def http_validators(self, response, size, default=None):
+        default = default or {}
+        return {
+            'etag': response.headers.get('etag') or default.get('etag', u""),
+            'last_modified': response.headers.get('last-modified') or default.get('last_modified', u""),
+            'size': size,
+        }
+
+    def ftp_connection(self, parsed_url):
+        """Returns connection to FTP server (one per host), and its lock"""
+        key = (parsed_url.hostname, parsed_url.port, parsed_url.username)
+        with self.ftp_lock:
+            if key not in self.ftp_connections:
+                ftp = ftplib.FTP()
+                ftp.connect(parsed_url.hostname, parsed_url.port or 21)
+                ftp.login(user=parsed_url.username, passwd=parsed_url.password)
+                self.ftp_connections[key] = (ftp, threading.Lock())
+            return key, self.ftp_connections[key]
+
+    def fetch_ftp_attachment(self, url, known):
+        parsed_url = urlparse(url)
+        directory, filename = os.path.split(parsed_url.path)
+        key, (ftp, lock) = self.ftp_connection(parsed_url)
+        with lock:
+            try:
+                ftp.cwd(directory)
+                size = ftp.size(filename)
+                if known is not None and size == known['size']:
+                    return None, {'etag': u"", 'last_modified': u"", 'size': size}
+                chunks = []
+                ftp.retrbinary('RETR {0}'.format(filename), chunks.append)
+            except ftplib.all_errors:
+                # Connect again for next files
+                with self.ftp_lock:
+                    self.ftp_connections.pop(key, None)
+                ftp.close()
+                raise
+        return ''.join(chunks), {'etag': u"", 'last_modified': u"", 'size': size}
+
 
 class TourInSoftParser(AttachmentParserMixin, Parser):
     @property
@@ -4,6 +4,7 @@ from django.utils.translation import get_language
 
 from rest_framework import serializers as rest_serializers
 from rest_framework import serializers as rest_fields
+from rest_framework_gis.fields import GeometryField
 
 from .models import Theme, RecordSource, TargetPortal
 
@@ -35,6 +36,21 @@ class PicturesSerializerMixin(rest_serializers.ModelSerializer):
         fields = ('thumbnail', 'pictures', 'videos', 'files')
 
 
+class GeoJSONGeometryField(GeometryField):
+    """ Geometry computed by ``prefetch_geojson()`` (simplified, rounded...),
+    or full geometry of object.
+    """
+    def field_to_native(self, obj, field_name):
+        prefetched = obj.__dict__.get('_prefetched', {})
+        if 'geojson' in prefetched:
+            return prefetched['geojson']
+        return super(GeoJSONGeometryField, self).field_to_native(obj, field_name)
+
+
+class GeoJSONSerializerMixin(rest_serializers.ModelSerializer):
+    geom = GeoJSONGeometryField()
+
+
 class BasePublishableSerializerMixin(rest_serializers.ModelSerializer):
     published_status = rest_serializers.Field(source='published_status')
 
@@ -1,4 +1,5 @@
 # -*- encoding: utf-8 -*-
+import json
 
 from django.utils import translation
 from django.utils.translation import ugettext as _
@@ -22,3 +23,22 @@ class CommonTest(AuthentFixturesTest, TranslationResetMixin, MapEntityTest):
 
     def get_bad_data(self):
         return {'topology': 'doh!'}, _(u'Topology is not valid.')
+
+    def test_api_geojson_list_for_model(self):
+        if self.model is None:
+            return  # Abstract test should not run
+        self.login()
+
+        obj = self.modelfactory.create()
+        list_url = '{api_prefix}{modelname}s.geojson'.format(api_prefix=self.api_prefix,
+                                                             modelname=self.model._meta.module_name)
+        response = self.client.get(list_url)
+        self.assertEqual(response.status_code, 200)
+        # Some lists are streamed
+        content = ''.join(response.streaming_content) if response.streaming else response.content
+        result = json.loads(content)
+        self.assertEqual(result['type'], 'FeatureCollection')
+        self.assertEqual(len(result['features']), 1)
+        first_result = result['features'][0]
+        self.assertEqual(first_result['id'], obj.pk)
+        self.assertEqual(first_result['type'], 'Feature')
@@ -9,13 +9,19 @@ from django.test import TestCase
 from django.conf import settings
 from django.core.management import call_command
 from django.core.management.base import CommandError
-from django.test.utils import override_settings
+from django.db import connection
+from django.test.utils import override_settings, CaptureQueriesContext
 from django.template.base import TemplateDoesNotExist
 
 from paperclip.models import Attachment
+from requests.structures import CaseInsensitiveDict
 
-from geotrek.trekking.models import Trek
-from geotrek.common.models import Organism, FileType
+from geotrek.authent.factories import StructureFactory
+from geotrek.trekking.factories import DifficultyLevelFactory
+from geotrek.trekking.models import Trek, DifficultyLevel
+from geotrek.common.factories import ThemeFactory, TargetPortalFactory
+from geotrek.common.models import Organism, FileType, Theme, AttachmentSource
+from geotrek.flatpages.models import FlatPage
 from geotrek.common.parsers import ExcelParser, AttachmentParserMixin, TourInSoftParser
 
 
@@ -34,6 +40,33 @@ class AttachmentParser(AttachmentParserMixin, OrganismEidParser):
     non_fields = {'attachments': 'photo'}
 
 
+class OrganismRowsParser(ExcelParser):
+    model = Organism
+    url = 'http://localhost/organisms'
+    fields = {'organism': 'nom', 'structure': 'structure'}
+    natural_keys = {'structure': 'name'}
+    eid = 'organism'
+    rows = []
+
+    def next_row(self):
+        self.nb = len(self.rows)
+        for row in self.rows:
+            yield row
+
+
+class FlatPageRowsParser(OrganismRowsParser):
+    model = FlatPage
+    fields = {'title': 'titre'}
+    m2m_fields = {'portal': 'portails'}
+    natural_keys = {'portal': 'name'}
+    eid = 'title'
+
+
+class TrekNaturalKeysParser(ExcelParser):
+    model = Trek
+    natural_keys = {'difficulty': 'difficulty', 'themes': 'label'}
+
+
 class ParserTests(TestCase):
     def test_bad_parser_class(self):
         with self.assertRaises(CommandError) as cm:
@@ -89,6 +122,146 @@ class ParserTests(TestCase):
             parser.report(output_format='toto')
 
 
+class NaturalKeysCacheTests(TestCase):
+    def setUp(self):
+        self.easy = DifficultyLevelFactory.create(difficulty=u"Easy")
+        self.themes = [ThemeFactory.create(label=u"Nature"), ThemeFactory.create(label=u"Culture")]
+        self.parser = TrekNaturalKeysParser()
+        self.parser.start()
+
+    def test_preloaded_lookups(self):
+        with self.assertNumQueries(0):
+            for i in range(3):
+                self.assertEqual(self.parser.filter_fk('DIFF', u"Easy", DifficultyLevel, 'difficulty'), self.easy)
+                self.assertEqual(self.parser.filter_m2m('THEMES', u"Nature+Culture", Theme, 'label'), self.themes)
+        self.assertEqual(self.parser.nb_lookup_hits, 9)
+        self.assertEqual(self.parser.nb_lookup_misses, 0)
+        self.assertIn('9/9 related objects lookups served from cache.', self.parser.report())
+
+    def test_missing_values_are_queried_once(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.parser.filter_fk('DIFF', u"Hard", DifficultyLevel, 'difficulty'))
+            self.assertIsNone(self.parser.filter_fk('DIFF', u"Hard", DifficultyLevel, 'difficulty'))
+        self.assertEqual(len(self.parser.warnings[u"Line 0"]), 2)
+
+    def test_created_values_are_cached(self):
+        hard = self.parser.filter_fk('DIFF', u"Hard", DifficultyLevel, 'difficulty', create=True)
+        self.assertEqual(hard.difficulty, u"Hard")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.parser.filter_fk('DIFF', u"Hard", DifficultyLevel, 'difficulty'), hard)
+
+    def test_ambiguous_values_are_not_cached(self):
+        DifficultyLevelFactory.create(difficulty=u"Easy")
+        parser = TrekNaturalKeysParser()
+        parser.start()
+        with self.assertRaises(DifficultyLevel.MultipleObjectsReturned):
+            parser.filter_fk('DIFF', u"Easy", DifficultyLevel, 'difficulty')
+
+
+class BatchParserTests(TestCase):
+    def setUp(self):
+        self.structures = [StructureFactory.create(), StructureFactory.create()]
+
+    def parse(self, rows, batch_size=None):
+        Organism.objects.all().delete()
+        parser = OrganismRowsParser()
+        parser.rows = rows
+        parser.batch_size = batch_size
+        parser.parse()
+        return parser
+
+    def assertSameResults(self, rows, batch_sizes=(None, 1, 2, 10)):
+        expected = None
+        for batch_size in batch_sizes:
+            parser = self.parse(rows, batch_size)
+            results = (parser.nb_success, parser.nb_created, parser.nb_updated, parser.nb_unmodified,
+                       parser.warnings.keys(), sorted(Organism.objects.values_list('organism', 'structure__name')))
+            if expected is None:
+                expected = results
+            self.assertEqual(results, expected)
+        return expected
+
+    def test_same_counts_as_row_by_row(self):
+        s1, s2 = [structure.name for structure in self.structures]
+        rows = [
+            {'NOM': u"A", 'STRUCTURE': s1},
+            {'NOM': u"B", 'STRUCTURE': s1},
+            {'NOM': u"A", 'STRUCTURE': s2},
+            {'NOM': u"B", 'STRUCTURE': s1},
+            {'NOM': u"C", 'STRUCTURE': u"Unknown"},
+        ]
+        results = self.assertSameResults(rows)
+        self.assertEqual(results[:5], (5, 2, 1, 1, [u"Line 5"]))
+        self.assertEqual(results[5], [(u"A", s2), (u"B", s1)])
+
+    def test_failed_rows(self):
+        s1 = self.structures[0].name
+        rows = [
+            {'NOM': u"A", 'STRUCTURE': s1},
+            {'NOM': u"B" * 200, 'STRUCTURE': s1},
+            {'NOM': u"C", 'STRUCTURE': s1},
+        ]
+        # Row by row, failure would abort test transaction
+        results = self.assertSameResults(rows, batch_sizes=(1, 2, 10))
+        self.assertEqual(results[:5], (2, 2, 0, 0, [u"Line 2"]))
+        self.assertEqual(results[5], [(u"A", s1), (u"C", s1)])
+
+    def test_existing_objects_are_fetched_at_once(self):
+        s1, s2 = [structure.name for structure in self.structures]
+        rows = [{'NOM': u"Organism {0}".format(i), 'STRUCTURE': s1} for i in range(20)]
+        self.parse(rows)
+        rows = [{'NOM': u"Organism {0}".format(i), 'STRUCTURE': s2 if i % 2 else s1} for i in range(20)]
+        parser = OrganismRowsParser()
+        parser.rows = rows
+        parser.batch_size = 20
+        with CaptureQueriesContext(connection) as queries:
+            parser.parse()
+        self.assertLess(len(queries), 20)
+        self.assertEqual((parser.nb_updated, parser.nb_unmodified), (10, 10))
+        self.assertEqual(Organism.objects.filter(structure__name=s2).count(), 10)
+
+    def parse_pages(self, rows, batch_size=None):
+        parser = FlatPageRowsParser()
+        parser.rows = rows
+        parser.batch_size = batch_size
+        parser.parse()
+        return parser
+
+    def page_portals(self):
+        return [(page.title, sorted(page.portal.values_list('name', flat=True)))
+                for page in FlatPage.objects.order_by('title')]
+
+    def test_m2m_saved_at_once(self):
+        TargetPortalFactory.create(name=u"A")
+        TargetPortalFactory.create(name=u"B")
+        rows = [{'TITRE': u"Page {0}".format(i), 'PORTAILS': u"A+B" if i % 2 else u"A"} for i in range(20)]
+        with CaptureQueriesContext(connection) as queries:
+            parser = self.parse_pages(rows, batch_size=20)
+        # Relations of all pages are replaced at once
+        self.assertLess(len([query for query in queries if 't_r_page_portal' in query['sql']]), 5)
+        self.assertEqual(parser.nb_created, 20)
+        self.assertIn((u"Page 1", [u"A", u"B"]), self.page_portals())
+        rows = [{'TITRE': u"Page {0}".format(i), 'PORTAILS': u"B"} for i in range(20)]
+        parser = self.parse_pages(rows, batch_size=20)
+        self.assertEqual(parser.nb_updated, 20)
+        self.assertEqual(set([tuple(names) for title, names in self.page_portals()]), set([(u"B",)]))
+
+    def test_m2m_same_as_row_by_row(self):
+        TargetPortalFactory.create(name=u"A")
+        TargetPortalFactory.create(name=u"B")
+        rows = [
+            {'TITRE': u"Page 1", 'PORTAILS': u"A"},
+            {'TITRE': u"Page 1", 'PORTAILS': u"A+B"},
+            {'TITRE': u"Page 1", 'PORTAILS': u"B+A"},
+            {'TITRE': u"Page 2", 'PORTAILS': u"B"},
+        ]
+        for batch_size in (None, 1, 2, 10):
+            FlatPage.objects.all().delete()
+            parser = self.parse_pages(rows, batch_size)
+            self.assertEqual((parser.nb_created, parser.nb_updated, parser.nb_unmodified), (2, 1, 1))
+            self.assertEqual(self.page_portals(), [(u"Page 1", [u"A", u"B"]), (u"Page 2", [u"B"])])
+
+
 @override_settings(MEDIA_ROOT=mkdtemp('geotrek_test'))
 class AttachmentParserTests(TestCase):
     def setUp(self):
@@ -97,10 +270,18 @@ class AttachmentParserTests(TestCase):
     def tearDown(self):
         rmtree(settings.MEDIA_ROOT)
 
-    @mock.patch('requests.get')
+    def response(self, status_code, content='', headers={}):
+        return mock.Mock(status_code=status_code, content=content, headers=CaseInsensitiveDict(headers))
+
+    def parse(self):
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        parser = AttachmentParser()
+        parser.parse(filename)
+        return parser
+
+    @mock.patch('requests.Session.request')
     def test_attachment(self, mocked):
-        mocked.return_value.status_code = 200
-        mocked.return_value.content = ''
+        mocked.return_value = self.response(200, headers={'ETag': '"v1"'})
         filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
         call_command('import', 'geotrek.common.tests.test_parsers.AttachmentParser', filename, verbosity=0)
         organism = Organism.objects.get()
@@ -108,16 +289,71 @@ class AttachmentParserTests(TestCase):
         self.assertEqual(attachment.content_object, organism)
         self.assertEqual(attachment.attachment_file.name, 'paperclip/common_organism/{pk}/titi.png'.format(pk=organism.pk))
         self.assertEqual(attachment.filetype, self.filetype)
+        self.assertEqual(attachment.source.etag, '"v1"')
+        self.assertEqual(attachment.source.size, 0)
 
-    @mock.patch('requests.get')
+    @mock.patch('requests.Session.request')
     def test_attachment_not_updated(self, mocked):
-        mocked.return_value.status_code = 200
-        mocked.return_value.content = ''
-        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
-        call_command('import', 'geotrek.common.tests.test_parsers.AttachmentParser', filename, verbosity=0)
-        call_command('import', 'geotrek.common.tests.test_parsers.AttachmentParser', filename, verbosity=0)
-        self.assertEqual(mocked.call_count, 1)
+        mocked.return_value = self.response(200, headers={'ETag': '"v1"'})
+        self.parse()
+        mocked.return_value = self.response(304)
+        parser = self.parse()
+        # Conditional request, without transfer
+        self.assertEqual(mocked.call_count, 2)
+        self.assertEqual(mocked.call_args[1]['headers'], {'If-None-Match': '"v1"'})
+        self.assertEqual(Attachment.objects.count(), 1)
+        self.assertEqual((parser.nb_updated, parser.nb_unmodified), (0, 1))
+
+    @mock.patch('requests.Session.request')
+    def test_attachment_updated(self, mocked):
+        mocked.return_value = self.response(200, headers={'Last-Modified': 'Mon, 01 Aug 2016 10:00:00 GMT'})
+        self.parse()
+        mocked.return_value = self.response(200, 'new', {'Last-Modified': 'Tue, 02 Aug 2016 10:00:00 GMT'})
+        parser = self.parse()
+        self.assertEqual(mocked.call_args[1]['headers'], {'If-Modified-Since': 'Mon, 01 Aug 2016 10:00:00 GMT'})
+        self.assertEqual(Attachment.objects.count(), 2)
+        self.assertEqual((parser.nb_updated, parser.nb_unmodified), (1, 0))
+        source = Attachment.objects.order_by('-pk')[0].source
+        self.assertEqual((source.last_modified, source.size), ('Tue, 02 Aug 2016 10:00:00 GMT', 3))
+
+    @mock.patch('requests.Session.request')
+    def test_attachment_without_validators(self, mocked):
+        mocked.return_value = self.response(200)
+        self.parse()
+        AttachmentSource.objects.all().delete()
+        mocked.return_value = self.response(200, headers={'Content-Length': '0', 'ETag': '"v1"'})
+        self.parse()
+        # Sizes are compared
+        self.assertEqual(mocked.call_args[0][0], 'HEAD')
+        self.assertEqual(mocked.call_count, 2)
         self.assertEqual(Attachment.objects.count(), 1)
+        self.assertEqual(AttachmentSource.objects.get().etag, '"v1"')
+
+    @mock.patch('requests.Session.request')
+    def test_attachment_failed(self, mocked):
+        mocked.return_value = self.response(404)
+        parser = self.parse()
+        self.assertEqual(Attachment.objects.count(), 0)
+        self.assertEqual(len(parser.warnings), 1)
+        self.assertIn(u"Failed to download", parser.warnings.values()[0][0])
+
+    @mock.patch('requests.Session.request')
+    def test_attachments_downloaded_before_end(self, mocked):
+        mocked.return_value = self.response(200, headers={'ETag': '"v1"'})
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        for batch_size in (None, 1):
+            Attachment.objects.all().delete()
+            parser = AttachmentParser()
+            parser.batch_size = batch_size
+            parser.download_queue_size = 1
+            end = parser.end
+
+            def check_end():
+                self.assertEqual(parser.attachments_jobs, [])
+                self.assertEqual(Attachment.objects.count(), 1)
+                end()
+            parser.end = check_end
+            parser.parse(filename)
 
 
 class TourInSoftParserTests(TestCase):
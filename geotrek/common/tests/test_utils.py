@@ -1,12 +1,19 @@
 # -*- encoding: utf-8 -*-
 
+import os
+import shutil
+import tempfile
+
 import mock
 
+from django.contrib.gis.geos import LineString, Point
 from django.db import connection
 from django.test import TestCase
 
 from ..utils import almostequal, sql_extent, uniquify
 from ..utils.postgresql import debug_pg_notices
+from ..utils.mvt import encode_tile, tile_bounds
+from ..utils.tiles import DEFAULT_TILE_SIZE, TileStore, corridor_tiles, tile_x, tile_y
 from ..utils.import_celery import (create_tmp_destination,
                                    subclasses,
                                    )
@@ -63,3 +70,87 @@ class UtilsTest(TestCase):
             ('/tmp/geotrek/bombadil', '/tmp/geotrek/bombadil/bombadil'),
             create_tmp_destination('bombadil')
         )
+
+
+class VectorTileTest(TestCase):
+    def geometry(self, geometry):
+        """ Encoded tile of a single feature, without properties """
+        return encode_tile([{'name': 'layer', 'extent': 4096,
+                             'features': [{'id': 1, 'geometry': geometry}]}])
+
+    def test_tile_bounds(self):
+        self.assertEqual(tile_bounds(0, 0, 0), (-20037508.342789244, -20037508.342789244,
+                                                20037508.342789244, 20037508.342789244))
+        self.assertEqual(tile_bounds(1, 1, 0), (0, 0, 20037508.342789244, 20037508.342789244))
+
+    def test_encode_point(self):
+        # Examples of vector tiles specification
+        tile = self.geometry({'type': 'Point', 'coordinates': [25, 17]})
+        self.assertIn('\x18\x01"\x03\x09\x32\x22', tile)
+
+    def test_encode_linestring(self):
+        tile = self.geometry({'type': 'LineString', 'coordinates': [[2, 2], [2, 10], [10, 10]]})
+        self.assertIn('\x18\x02"\x08\x09\x04\x04\x12\x00\x10\x10\x00', tile)
+
+    def test_encode_polygon_clockwise(self):
+        expected = '\x18\x03"\x09\x09\x06\x0c\x12\x0a\x0c\x18\x2c\x0f'
+        tile = self.geometry({'type': 'Polygon', 'coordinates': [[[3, 6], [8, 12], [20, 34], [3, 6]]]})
+        self.assertIn(expected, tile)
+        tile = self.geometry({'type': 'Polygon', 'coordinates': [[[3, 6], [20, 34], [8, 12], [3, 6]]]})
+        self.assertNotIn(expected, tile)
+        self.assertIn('\x18\x03"\x09', tile)
+
+    def test_encode_layer(self):
+        tile = encode_tile([{'name': 'paths', 'extent': 4096, 'features': [
+            {'id': 7, 'properties': {'name': u'Chemin', 'published': True, 'empty': None},
+             'geometry': {'type': 'Point', 'coordinates': [1, 2]}},
+        ]}])
+        self.assertTrue(tile.startswith('\x1a'))
+        self.assertIn('\x78\x02\x0a\x05paths', tile)
+        self.assertIn('\x08\x07', tile)
+        self.assertIn('\x1a\x04name', tile)
+        self.assertIn('\x1a\x09published', tile)
+        self.assertNotIn('empty', tile)
+        self.assertIn('\x0a\x06Chemin', tile)
+        self.assertIn('\x38\x01', tile)
+        self.assertTrue(tile.endswith('\x28\x80\x20'))
+
+    def test_skip_empty_geometries(self):
+        tile = self.geometry({'type': 'LineString', 'coordinates': [[2, 2], [2, 2]]})
+        self.assertNotIn('\x18\x02', tile)
+
+
+class TileCoverageTest(TestCase):
+    def test_tile_coordinates(self):
+        self.assertEqual((tile_x(0, 1), tile_y(0.1, 1)), (1, 0))
+        self.assertEqual((tile_x(2.3522, 12), tile_y(48.8566, 12)), (2074, 1409))
+
+    def test_corridor_covers_vertices(self):
+        line = LineString((3.0, 46.5), (3.05, 46.52), (3.1, 46.5), srid=4326)
+        tiles = corridor_tiles(line, 0.005, [13, 14])
+        self.assertEqual(tiles, sorted(set(tiles)))
+        for zoom in (13, 14):
+            for lng, lat in line.coords:
+                self.assertIn((zoom, tile_x(lng, zoom), tile_y(lat, zoom)), tiles)
+
+    def test_corridor_covers_segments(self):
+        line = LineString((3.0, 46.5), (3.2, 46.5), srid=4326)
+        tiles = corridor_tiles(line, 0.001, [14])
+        row = tile_y(46.5, 14)
+        for x in range(tile_x(3.0, 14), tile_x(3.2, 14) + 1):
+            self.assertIn((14, x, row), tiles)
+
+    def test_corridor_is_limited_to_radius(self):
+        point = Point(3.0001, 46.5001, srid=4326)
+        self.assertEqual(corridor_tiles(point, 0.00001, [10]), [(10, tile_x(3.0001, 10), tile_y(46.5001, 10))])
+
+    def test_estimate_size(self):
+        folder = tempfile.mkdtemp()
+        try:
+            store = TileStore(os.path.join(folder, 'store'))
+            self.assertEqual(store.estimate_size([(1, 0, 0), (1, 1, 0)]), 2 * DEFAULT_TILE_SIZE)
+            store.save((1, 0, 0), 'a' * 10)
+            store.save((1, 1, 0), 'b' * 20)
+            self.assertEqual(store.estimate_size([(1, 0, 0), (1, 1, 0), (1, 0, 1), (1, 1, 1)]), 60)
+        finally:
+            shutil.rmtree(folder)
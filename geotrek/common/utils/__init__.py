@@ -1,6 +1,9 @@
+import json
 import logging
 import re
+from functools import wraps
 
+from django.core.cache import get_cache
 from django.db import connection
 from django.utils.timezone import utc
 from django.conf import settings
@@ -43,6 +46,21 @@ class reify(object):
         return val
 
 
+def prefetchable(func, name=None):
+    """ Decorate a property getter, to return the value computed for this
+    object by a batch loader (see ``AddPropertyMixin.set_prefetched()``).
+    """
+    name = name or func.__name__
+
+    @wraps(func)
+    def wrapper(self):
+        prefetched = self.__dict__.get('_prefetched', {})
+        if name in prefetched:
+            return prefetched[name]
+        return func(self)
+    return wrapper
+
+
 class LTE(int):
     """ Less or equal object comparator
     Source: https://github.com/justquick/django-activity-stream/blob/22b22297054776f7864ff642b73add15b256a2ad/actstream/tests.py
@@ -129,6 +147,181 @@ def intersecting(cls, obj, distance=None):
     return qs
 
 
+def _geom_table(model):
+    """ Table and primary key column holding the geometry of model
+    (parent table for topologies)
+    """
+    field, field_model, direct, m2m = model._meta.get_field_by_name('geom')
+    opts = (field_model or model)._meta
+    return opts.db_table, opts.pk.column
+
+
+def intersecting_batch(cls, objects, queryset=None, distance=None):
+    """ Like ``intersecting()``, for many objects at once, in a few queries.
+    Returns a dict of lists keyed by object pk. ``queryset`` can be given to
+    select related objects or restrict results.
+    """
+    result = dict([(obj.pk, []) for obj in objects])
+    if len(objects) == 0:
+        return result
+    if queryset is None:
+        queryset = cls.objects.existing() if hasattr(cls.objects, 'existing') else cls.objects.all()
+    candidates = list(queryset.values_list('pk', flat=True))
+    if len(candidates) == 0:
+        return result
+
+    source_table, source_pk = _geom_table(objects[0].__class__)
+    target_table, target_pk = _geom_table(cls)
+    sql = """
+    WITH sources AS (SELECT unnest(%%s::integer[]) AS id, unnest(%%s::float8[]) AS distance)
+    SELECT s.id, t.%(target_pk)s,
+           CASE WHEN s.distance = 0 AND GeometryType(o.geom) = 'LINESTRING' THEN
+                (SELECT min(ST_Line_Locate_Point(o.geom, ST_StartPoint(p.geom)))
+                 FROM ST_Dump(ST_Intersection(o.geom, t.geom)) AS p)
+           END AS d
+    FROM sources s
+    JOIN %(source_table)s o ON (o.%(source_pk)s = s.id)
+    JOIN %(target_table)s t ON (t.geom && ST_Expand(o.geom, s.distance))
+    WHERE t.%(target_pk)s = ANY(%%s)
+      AND %(self_condition)s
+      AND CASE WHEN s.distance > 0 THEN ST_DWithin(o.geom, t.geom, s.distance)
+               ELSE ST_Intersects(o.geom, t.geom) END
+    """ % {
+        'source_table': source_table, 'source_pk': source_pk,
+        'target_table': target_table, 'target_pk': target_pk,
+        # Prevent self intersection
+        'self_condition': 's.id != t.%s' % target_pk if objects[0].__class__ == cls else 'true',
+    }
+    distances = [(obj.distance(cls) if distance is None else distance) or 0 for obj in objects]
+    cursor = connection.cursor()
+    cursor.execute(sql, [[obj.pk for obj in objects], distances, candidates])
+    rows = cursor.fetchall()
+
+    # Objects in queryset order, then along line for intersections
+    targets = list(queryset.filter(pk__in=set([row[1] for row in rows])))
+    ranks = dict([(target.pk, i) for i, target in enumerate(targets)])
+    targets = dict([(target.pk, target) for target in targets])
+    locations = {}
+    for pk, target_pk, d in rows:
+        locations.setdefault(pk, {})[target_pk] = d
+    for obj, obj_distance in zip(objects, distances):
+        located = locations.get(obj.pk, {})
+        if obj_distance:
+            ordering = [(ranks[pk], pk) for pk in located]
+        else:
+            ordering = [(located[pk] is None, located[pk], ranks[pk], pk) for pk in located]
+        result[obj.pk] = [targets[row[-1]] for row in sorted(ordering)]
+    return result
+
+
+# Meters per pixel of 256px tiles at zoom level 0, at equator
+ZOOM0_RESOLUTION = 156543.03392804097
+
+
+def zoom_tolerance(zoom):
+    """ Simplification tolerance (meters) of geometries displayed at zoom level,
+    i.e. the size of one pixel.
+    """
+    return ZOOM0_RESOLUTION / 2 ** zoom
+
+
+def prefetch_geojson(objects, zoom=None, precision=None):
+    """
+    Compute GeoJSON geometries of objects in ``API_SRID``, simplified for
+    ``zoom`` level and with coordinates rounded to ``precision`` decimals, in
+    one query. They are kept in ``fat`` cache until objects are updated, and
+    used by ``GeoJSONGeometryField`` when serializing objects.
+    """
+    if len(objects) == 0:
+        return
+    tolerance = 0 if zoom is None else zoom_tolerance(zoom)
+    precision = 15 if precision is None else min(precision, 15)
+    table, column = _geom_table(objects[0].__class__)
+
+    # Objects without modification date are not cached
+    keys = {}
+    for obj in objects:
+        date_update = getattr(obj, 'date_update', None)
+        if date_update is not None:
+            keys[obj.pk] = 'geojson_%s_%s_%s_%s_%s' % (table, obj.pk, date_update.isoformat(),
+                                                       tolerance, precision)
+    cache = get_cache('fat')
+    cached = cache.get_many(keys.values())
+    geometries = dict([(obj.pk, cached[keys[obj.pk]]) for obj in objects if keys.get(obj.pk) in cached])
+
+    missing = [obj.pk for obj in objects if obj.pk not in geometries]
+    if missing:
+        cursor = connection.cursor()
+        cursor.execute("""
+        SELECT %(column)s, ST_AsGeoJSON(ST_Transform(ST_SimplifyPreserveTopology(geom, %%s), %%s), %%s)
+        FROM %(table)s
+        WHERE %(column)s = ANY(%%s)
+        """ % {'table': table, 'column': column}, [tolerance, settings.API_SRID, precision, missing])
+        computed = dict([(pk, json.loads(geojson) if geojson else None) for pk, geojson in cursor.fetchall()])
+        cache.set_many(dict([(keys[pk], geometry) for pk, geometry in computed.items() if pk in keys]))
+        geometries.update(computed)
+
+    for obj in objects:
+        obj.set_prefetched('geojson', geometries.get(obj.pk))
+
+
+def queryset_chunks(queryset, chunk_size=100):
+    """
+    Iterate over the objects of queryset, in its order, by lists of
+    ``chunk_size`` objects. Ordered primary keys are read first, then each
+    chunk (with its prefetched relations) is fetched with its own query, so
+    that memory use does not depend on the number of results and no
+    transaction is kept open between chunks.
+    """
+    pks = []
+    seen = set()
+    for pk in queryset.values_list('pk', flat=True):
+        if pk not in seen:
+            seen.add(pk)
+            pks.append(pk)
+    for i in range(0, len(pks), chunk_size):
+        chunk = pks[i:i + chunk_size]
+        positions = dict([(pk, position) for position, pk in enumerate(chunk)])
+        objects = list(queryset.filter(pk__in=chunk))
+        objects.sort(key=lambda obj: positions[obj.pk])
+        yield objects
+
+
+class PrefetchingQuerySetMixin(object):
+    """ Call loaders with the list of fetched objects, once, when the
+    queryset is evaluated. Loaders are kept on clones (filter(), order_by()...).
+    """
+    _loaders = ()
+
+    def _clone(self, klass=None, setup=False, **kwargs):
+        kwargs.setdefault('_loaders', self._loaders)
+        return super(PrefetchingQuerySetMixin, self)._clone(klass, setup, **kwargs)
+
+    def _fetch_all(self):
+        fetched = self._result_cache is not None
+        super(PrefetchingQuerySetMixin, self)._fetch_all()
+        if not fetched:
+            for loader in self._loaders:
+                loader(self._result_cache)
+
+
+_prefetching_classes = {}
+
+
+def prefetch_with(queryset, *loaders):
+    """
+    Like ``prefetch_related()``, with functions loading data for a list of
+    objects, e.g. ``prefetch_with(Trek.objects.all(), prefetch_zoning)``.
+    """
+    klass = queryset.__class__
+    if not issubclass(klass, PrefetchingQuerySetMixin):
+        if klass not in _prefetching_classes:
+            _prefetching_classes[klass] = type('Prefetching%s' % klass.__name__,
+                                               (PrefetchingQuerySetMixin, klass), {})
+        klass = _prefetching_classes[klass]
+    return queryset._clone(klass=klass, _loaders=getattr(queryset, '_loaders', ()) + loaders)
+
+
 def plain_text_preserve_linebreaks(value):
     value = re.sub(ur'\s*<br\s*/?>\s*', u'##~~~~~~##', value)
     value = re.sub(ur'\s*<p>\s*', u'##~~~~~~####~~~~~~##', value)
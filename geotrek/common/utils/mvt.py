@@ -0,0 +1,313 @@
+"""
+Mapbox Vector Tiles (https://github.com/mapbox/vector-tile-spec/tree/master/2.1)
+of querysets, in Web Mercator tiles grid.
+
+Tiles are produced by PostGIS ``ST_AsMVT()`` when available (PostGIS >= 2.4).
+Otherwise geometries are clipped and converted to tile coordinates in
+database, and encoded by ``encode_tile()``.
+"""
+import json
+import math
+import re
+import struct
+
+from django.conf import settings
+from django.db import connection
+
+from geotrek.common.utils import _geom_table
+
+
+# Half of Web Mercator world width
+ORIGIN_SHIFT = 2 * math.pi * 6378137 / 2.0
+
+DEFAULT_EXTENT = 4096
+DEFAULT_BUFFER = 64
+
+_postgis_mvt = None
+
+
+def tile_bounds(z, x, y):
+    """ Web Mercator bounds (xmin, ymin, xmax, ymax) of tile
+    """
+    size = 2 * ORIGIN_SHIFT / 2 ** z
+    xmin = -ORIGIN_SHIFT + x * size
+    ymax = ORIGIN_SHIFT - y * size
+    return (xmin, ymax - size, xmin + size, ymax)
+
+
+def postgis_has_mvt():
+    """ Whether PostGIS provides ``ST_AsMVT()`` (PostGIS >= 2.4 built with protobuf)
+    """
+    global _postgis_mvt
+    if _postgis_mvt is None:
+        cursor = connection.cursor()
+        cursor.execute("SELECT postgis_lib_version(), postgis_full_version()")
+        version, full_version = cursor.fetchone()
+        major, minor = [int(v) for v in re.findall(r'\d+', version)[:2]]
+        _postgis_mvt = (major, minor) >= (2, 4) and 'PROTOBUF' in full_version.upper()
+    return _postgis_mvt
+
+
+def vector_tile(queryset, layer, properties, z, x, y, extent=DEFAULT_EXTENT, buffer=DEFAULT_BUFFER):
+    """
+    Vector tile of the objects of queryset, in a layer named ``layer``. Features
+    have ``id`` and ``properties`` (model fields names) as properties.
+    """
+    table, column = _geom_table(queryset.model)
+    xmin, ymin, xmax, ymax = tile_bounds(z, x, y)
+    margin = (xmax - xmin) * buffer / extent
+
+    qn = connection.ops.quote_name
+    aliases = ['id'] + list(properties)
+    columns = ', '.join(['q.%s' % qn(alias) for alias in aliases])
+    subquery, subparams = queryset.order_by().values_list('pk', *properties).query.sql_with_params()
+    objects = """
+        FROM (%(subquery)s) AS q(%(aliases)s)
+        JOIN %(table)s g ON (g.%(column)s = q.id)
+        WHERE g.geom && ST_Transform(ST_MakeEnvelope(%%s, %%s, %%s, %%s, 3857), %(srid)s)
+    """ % {'subquery': subquery, 'aliases': ', '.join([qn(alias) for alias in aliases]),
+           'table': table, 'column': column, 'srid': settings.SRID}
+    objects_params = list(subparams) + [xmin - margin, ymin - margin, xmax + margin, ymax + margin]
+
+    cursor = connection.cursor()
+    if postgis_has_mvt():
+        cursor.execute("""
+        SELECT ST_AsMVT(tile, %%s, %%s, 'geom') FROM (
+            SELECT %(columns)s,
+                   ST_AsMVTGeom(ST_Transform(g.geom, 3857), ST_MakeEnvelope(%%s, %%s, %%s, %%s, 3857),
+                                %%s, %%s, true) AS geom
+            %(objects)s
+        ) AS tile
+        WHERE geom IS NOT NULL
+        """ % {'columns': columns, 'objects': objects},
+            [layer, extent, xmin, ymin, xmax, ymax, extent, buffer] + objects_params)
+        tile = cursor.fetchone()[0]
+        return str(tile) if tile is not None else ''
+
+    # Clip (with buffer), simplify to tile resolution and scale to tile coordinates
+    cursor.execute("""
+    SELECT %(columns)s, ST_AsGeoJSON(geom, 0) FROM (
+        SELECT %(columns)s,
+               ST_SnapToGrid(ST_TransScale(ST_Intersection(ST_SimplifyPreserveTopology(ST_Transform(g.geom, 3857), %%s),
+                                                           ST_MakeEnvelope(%%s, %%s, %%s, %%s, 3857)),
+                                           %%s, %%s, %%s, %%s), 1) AS geom
+        %(objects)s
+    ) AS q
+    WHERE geom IS NOT NULL AND NOT ST_IsEmpty(geom)
+    """ % {'columns': columns, 'objects': objects},
+        [(xmax - xmin) / extent, xmin - margin, ymin - margin, xmax + margin, ymax + margin,
+         -xmin, -ymax, extent / (xmax - xmin), -extent / (ymax - ymin)] + objects_params)
+    features = []
+    for row in cursor.fetchall():
+        features.append({
+            'id': row[0],
+            'properties': dict(zip(aliases, row[:-1])),
+            'geometry': json.loads(row[-1]),
+        })
+    return encode_tile([{'name': layer, 'extent': extent, 'features': features}])
+
+
+#
+# Protocol buffers encoding
+#
+
+def _varint(value):
+    value &= 0xFFFFFFFFFFFFFFFF
+    result = []
+    while value > 0x7F:
+        result.append(chr((value & 0x7F) | 0x80))
+        value >>= 7
+    result.append(chr(value))
+    return ''.join(result)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _message(field, data):
+    return _key(field, 2) + _varint(len(data)) + data
+
+
+def _packed(field, values):
+    return _message(field, ''.join([_varint(value) for value in values]))
+
+
+def _encode_value(value):
+    if isinstance(value, bool):
+        return _key(7, 0) + _varint(int(value))
+    if isinstance(value, (int, long)):
+        if value < 0:
+            return _key(6, 0) + _varint(_zigzag(value))
+        return _key(5, 0) + _varint(value)
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack('<d', value)
+    if not isinstance(value, unicode):
+        value = unicode(value) if not isinstance(value, str) else value.decode('utf-8')
+    value = value.encode('utf-8')
+    return _message(1, value)
+
+
+def _ring_area(ring):
+    """ Twice the signed area of ring, positive when clockwise in tile
+    coordinates (Y axis pointing down)
+    """
+    return sum([x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1])])
+
+
+class _GeometryEncoder(object):
+    MOVE_TO, LINE_TO, CLOSE_PATH = 1, 2, 7
+
+    def __init__(self):
+        self.commands = []
+        self.cursor = (0, 0)
+
+    def command(self, command, count):
+        self.commands.append((command & 0x7) | (count << 3))
+
+    def points(self, points):
+        for point in points:
+            x, y = int(point[0]), int(point[1])
+            self.commands.append(_zigzag(x - self.cursor[0]))
+            self.commands.append(_zigzag(y - self.cursor[1]))
+            self.cursor = (x, y)
+
+    def multipoint(self, points):
+        self.command(self.MOVE_TO, len(points))
+        self.points(points)
+
+    def linestring(self, points):
+        # Drop repeated points
+        points = [tuple(map(int, p[:2])) for p in points]
+        points = [p for i, p in enumerate(points) if i == 0 or p != points[i - 1]]
+        if len(points) < 2:
+            return False
+        self.command(self.MOVE_TO, 1)
+        self.points(points[:1])
+        self.command(self.LINE_TO, len(points) - 1)
+        self.points(points[1:])
+        return True
+
+    def polygon(self, rings):
+        for i, ring in enumerate(rings):
+            ring = [tuple(map(int, p[:2])) for p in ring]
+            ring = [p for j, p in enumerate(ring) if j == 0 or p != ring[j - 1]]
+            if len(ring) > 1 and ring[0] == ring[-1]:
+                ring = ring[:-1]
+            if len(ring) < 3:
+                if i == 0:
+                    return False
+                continue
+            # Exterior rings are clockwise, interior rings counter-clockwise
+            area = _ring_area(ring)
+            if area == 0:
+                if i == 0:
+                    return False
+                continue
+            if (area > 0) != (i == 0):
+                ring = ring[::-1]
+            self.command(self.MOVE_TO, 1)
+            self.points(ring[:1])
+            self.command(self.LINE_TO, len(ring) - 1)
+            self.points(ring[1:])
+            self.command(self.CLOSE_PATH, 1)
+        return True
+
+
+_GEOMETRY_TYPES = {
+    'Point': 1, 'MultiPoint': 1,
+    'LineString': 2, 'MultiLineString': 2,
+    'Polygon': 3, 'MultiPolygon': 3,
+}
+
+
+def _encode_geometry(geometry):
+    """ Returns MVT type and commands of a GeoJSON geometry in tile coordinates
+    """
+    encoder = _GeometryEncoder()
+    kind, coordinates = geometry['type'], geometry['coordinates']
+    if kind == 'Point':
+        encoder.multipoint([coordinates])
+    elif kind == 'MultiPoint':
+        if not coordinates:
+            return None
+        encoder.multipoint(coordinates)
+    elif kind == 'LineString':
+        encoder.linestring(coordinates)
+    elif kind == 'MultiLineString':
+        for line in coordinates:
+            encoder.linestring(line)
+    elif kind == 'Polygon':
+        encoder.polygon(coordinates)
+    elif kind == 'MultiPolygon':
+        for polygon in coordinates:
+            encoder.polygon(polygon)
+    if not encoder.commands:
+        return None
+    return _GEOMETRY_TYPES[kind], encoder.commands
+
+
+def _flatten(geometry):
+    if geometry['type'] == 'GeometryCollection':
+        for member in geometry['geometries']:
+            for flat in _flatten(member):
+                yield flat
+    else:
+        yield geometry
+
+
+def encode_tile(layers):
+    """
+    Encode layers as a vector tile. Each layer is a dict with ``name``,
+    ``extent`` and ``features``, a list of dicts with ``id``, ``properties``
+    and ``geometry`` (GeoJSON, in tile coordinates).
+    """
+    tile = []
+    for layer in layers:
+        keys, values = [], []
+        key_index, value_index = {}, {}
+        features = []
+        for feature in layer['features']:
+            tags = []
+            for name, value in sorted(feature.get('properties', {}).items()):
+                if value is None:
+                    continue
+                if name not in key_index:
+                    key_index[name] = len(keys)
+                    keys.append(name)
+                encoded = _encode_value(value)
+                if encoded not in value_index:
+                    value_index[encoded] = len(values)
+                    values.append(encoded)
+                tags.extend([key_index[name], value_index[encoded]])
+
+            # Collections give one feature per member
+            for geometry in _flatten(feature['geometry']):
+                encoded = _encode_geometry(geometry)
+                if encoded is None:
+                    continue
+                kind, commands = encoded
+                data = ''
+                # Feature ids are unsigned integers (not cities codes)
+                if isinstance(feature.get('id'), (int, long)) and feature['id'] >= 0:
+                    data += _key(1, 0) + _varint(feature['id'])
+                if tags:
+                    data += _packed(2, tags)
+                data += _key(3, 0) + _varint(kind)
+                data += _packed(4, commands)
+                features.append(data)
+
+        name = layer['name']
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        data = _key(15, 0) + _varint(2) + _message(1, name)
+        data += ''.join([_message(2, feature) for feature in features])
+        data += ''.join([_message(3, key.encode('utf-8') if isinstance(key, unicode) else key) for key in keys])
+        data += ''.join([_message(4, value) for value in values])
+        data += _key(5, 0) + _varint(layer.get('extent', DEFAULT_EXTENT))
+        tile.append(_message(3, data))
+    return ''.join(tile)
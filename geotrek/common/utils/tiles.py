@@ -0,0 +1,173 @@
+import hashlib
+import logging
+import math
+import os
+import thread
+from multiprocessing.pool import ThreadPool
+
+from django.contrib.gis.geos import GeometryCollection, Polygon
+from landez.sources import DownloadError
+
+
+logger = logging.getLogger(__name__)
+
+# Size of tiles, when none is known yet (bytes)
+DEFAULT_TILE_SIZE = 20000
+
+# Latitude limit of Web Mercator tiles grid
+MAX_LATITUDE = 85.0511287798
+
+
+def tile_x(lng, zoom):
+    n = 2 ** zoom
+    return min(n - 1, max(0, int(math.floor((lng + 180.0) / 360.0 * n))))
+
+
+def tile_y(lat, zoom):
+    n = 2 ** zoom
+    lat = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, lat)))
+    y = (1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * n
+    return min(n - 1, max(0, int(math.floor(y))))
+
+
+def tile_lat(y, zoom):
+    """ Latitude of the northern edge of tiles row ``y``
+    """
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2.0 * y / 2 ** zoom))))
+
+
+def corridor_tiles(geom, radius, zoomlevels):
+    """
+    Tiles (z, x, y) covered by the corridor of ``radius`` around ``geom`` (in
+    WGS84 degrees), sorted. The corridor is built once, and intersected with
+    each row of the tiles grid of each zoom level: every column between the
+    extremities of a part of the intersection is covered.
+    """
+    corridor = geom.buffer(radius)
+    xmin, ymin, xmax, ymax = corridor.extent
+    tiles = set()
+    for zoom in zoomlevels:
+        for y in range(tile_y(ymax, zoom), tile_y(ymin, zoom) + 1):
+            band = Polygon.from_bbox((xmin, tile_lat(y + 1, zoom), xmax, tile_lat(y, zoom)))
+            row = corridor.intersection(band)
+            parts = row if isinstance(row, GeometryCollection) else [row]
+            for part in parts:
+                # Skip parts only touching the row
+                if part.empty or part.area == 0:
+                    continue
+                pxmin, pymin, pxmax, pymax = part.extent
+                for x in range(tile_x(pxmin, zoom), tile_x(pxmax, zoom) + 1):
+                    tiles.add((zoom, x, y))
+    return sorted(tiles)
+
+
+class TileStore(object):
+    """
+    Content-addressed on-disk store of tiles, shared by tiles packages (and by
+    synchronizations).
+
+    Each content is saved once in ``objects/<hash[:2]>/<hash>``, whatever the
+    number of tiles it appears in (sea, blank tiles...), and ``tiles/<z>/<x>/<y>``
+    records the content hash of each tile. Files are written atomically, so that
+    a store can be filled by several processes.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        # Tiles which could not be downloaded, not tried again
+        self.failed = set()
+
+    def tile_path(self, (z, x, y)):
+        return os.path.join(self.folder, 'tiles', str(z), str(x), str(y))
+
+    def object_path(self, digest):
+        return os.path.join(self.folder, 'objects', digest[:2], digest)
+
+    def _write(self, path, data):
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # Created meanwhile by another process
+                if not os.path.isdir(dirname):
+                    raise
+        tmp = '%s.%s-%s.tmp' % (path, os.getpid(), thread.get_ident())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.rename(tmp, path)
+
+    def digest(self, tile):
+        try:
+            with open(self.tile_path(tile), 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def __contains__(self, tile):
+        return os.path.exists(self.tile_path(tile))
+
+    def read(self, tile):
+        digest = self.digest(tile)
+        if digest is None:
+            return None
+        with open(self.object_path(digest), 'rb') as f:
+            return f.read()
+
+    def save(self, tile, data):
+        digest = hashlib.sha1(data).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            self._write(path, data)
+        self._write(self.tile_path(tile), digest)
+        return digest
+
+    def size(self, tile):
+        digest = self.digest(tile)
+        if digest is None:
+            return None
+        try:
+            return os.path.getsize(self.object_path(digest))
+        except OSError:
+            return None
+
+    def estimate_size(self, tiles):
+        """
+        Estimated size (bytes) of tiles: size of stored ones, and their average
+        size (or ``DEFAULT_TILE_SIZE``) for the others.
+        """
+        sizes = [self.size(tile) for tile in tiles]
+        known = [size for size in sizes if size is not None]
+        average = sum(known) / len(known) if known else DEFAULT_TILE_SIZE
+        return sum(known) + average * (len(sizes) - len(known))
+
+    def fetch(self, tm, tiles, workers=4):
+        """
+        Download tiles missing from the store with landez ``TilesManager``,
+        with ``workers`` concurrent downloads. Returns the number of downloaded
+        tiles.
+        """
+        missing = [tile for tile in tiles if tile not in self.failed and tile not in self]
+        if not missing:
+            return 0
+
+        def download(tile):
+            try:
+                return tile, tm.tile(tile)
+            except DownloadError:
+                return tile, None
+
+        downloaded = 0
+        pool = ThreadPool(max(1, min(workers, len(missing))))
+        try:
+            # Contents are saved by this thread, as they arrive
+            for tile, data in pool.imap_unordered(download, missing):
+                if data is None:
+                    logger.warning("Failed to download tile %s/%s/%s" % tile)
+                    self.failed.add(tile)
+                else:
+                    self.save(tile, data)
+                    downloaded += 1
+        finally:
+            pool.close()
+            pool.join()
+        return downloaded
@@ -1,21 +1,27 @@
 # -*- coding: utf-8 -*-
+from django.core.cache import get_cache
 from django.core.exceptions import ValidationError, PermissionDenied
 from django.utils.decorators import method_decorator
 from django.conf import settings
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.db.utils import DatabaseError
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse, Http404
+from django.utils import translation
 from django.utils.translation import ugettext as _
+from django.views.generic import View
 
 from mapentity.helpers import api_bbox
 from mapentity import views as mapentity_views
 
 from geotrek.celery import app as celery_app
-from geotrek.common.utils import sql_extent
+from geotrek.common.utils import sql_extent, prefetch_with, prefetch_geojson, queryset_chunks
+from geotrek.common.utils.mvt import vector_tile
 from geotrek import __version__
 
 from rest_framework import permissions as rest_permissions, viewsets
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
 
 # async data imports
 import ast
@@ -25,6 +31,7 @@ import redis
 from zipfile import ZipFile
 from djcelery.models import TaskMeta
 from datetime import datetime, timedelta
+from functools import partial
 
 from .utils.import_celery import create_tmp_destination, discover_available_parsers
 
@@ -76,6 +83,111 @@ class PublicOrReadPermMixin(object):
         return obj
 
 
+class GeoJSONOptionsMixin(object):
+    """
+    Simplify geometries of GeoJSON output for ``zoom`` level, and round their
+    coordinates to ``precision`` decimals, when given as request parameters.
+    """
+    def get_geojson_options(self):
+        options = {}
+        for name in ('zoom', 'precision'):
+            if self.request.GET.get(name):
+                try:
+                    options[name] = int(self.request.GET[name])
+                except ValueError:
+                    raise ParseError(_(u"Invalid %s parameter") % name)
+                if options[name] < 0:
+                    raise ParseError(_(u"Invalid %s parameter") % name)
+        return options
+
+    def filter_queryset(self, queryset):
+        queryset = super(GeoJSONOptionsMixin, self).filter_queryset(queryset)
+        options = self.get_geojson_options()
+        if options:
+            queryset = prefetch_with(queryset, partial(prefetch_geojson, **options))
+        return queryset
+
+
+class StreamingGeoJSONMixin(object):
+    """
+    Stream GeoJSON lists feature after feature. Objects are fetched and
+    serialized by chunks, so that memory use does not depend on the number
+    of features.
+    """
+    chunk_size = 100
+
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if getattr(renderer, 'format', None) != 'geojson' or self.get_paginate_by():
+            return super(StreamingGeoJSONMixin, self).list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        # Response is consumed after the end of view
+        language = translation.get_language()
+
+        def stream():
+            with translation.override(language):
+                yield '{"type": "FeatureCollection", "features": ['
+                separator = ''
+                for objects in queryset_chunks(queryset, self.chunk_size):
+                    data = serializer_class(objects, many=True, context=context).data
+                    for feature in data['features']:
+                        yield separator + json.dumps(feature, cls=JSONEncoder)
+                        separator = ', '
+                yield ']}'
+
+        return StreamingHttpResponse(stream(), content_type='%s; charset=utf-8' % renderer.media_type)
+
+
+class VectorTileView(View):
+    """
+    Mapbox Vector Tiles of a layer (``/api/tiles/<layer>/{z}/{x}/{y}.pbf``).
+    Tiles are kept in ``fat`` cache until objects of the layer are modified
+    (``latest_updated()``), or during ``cache_timeout`` for models without
+    modification date.
+    """
+    model = None
+    queryset = None
+    layer = None
+    properties = []
+    cache_timeout = None
+    max_zoom = 22
+
+    @method_decorator(login_required)
+    def dispatch(self, *args, **kwargs):
+        return super(VectorTileView, self).dispatch(*args, **kwargs)
+
+    def get_queryset(self):
+        if self.queryset is not None:
+            return self.queryset._clone()
+        return self.model._default_manager.all()
+
+    def get_latest_updated(self, model):
+        if hasattr(model, 'latest_updated'):
+            return model.latest_updated()
+        return None
+
+    def get(self, request, z, x, y):
+        z, x, y = int(z), int(x), int(y)
+        if z > self.max_zoom or x >= 2 ** z or y >= 2 ** z:
+            raise Http404
+
+        queryset = self.get_queryset()
+        latest = self.get_latest_updated(queryset.model)
+        key = 'mvt_%s_%s_%s_%s_%s' % (self.layer, z, x, y, latest.isoformat() if latest else '')
+        cache = get_cache('fat')
+        tile = cache.get(key)
+        if tile is None:
+            tile = vector_tile(queryset, self.layer, self.properties, z, x, y)
+            if self.cache_timeout is None:
+                cache.set(key, tile)
+            else:
+                cache.set(key, tile, self.cache_timeout)
+        return HttpResponse(tile, content_type='application/x-protobuf')
+
+
 class DocumentPublic(PublicOrReadPermMixin, mapentity_views.MapEntityDocumentWeasyprint):
     template_name_suffix = "_public"
 
@@ -1,16 +1,297 @@
+import itertools
+import json
 import math
-from collections import defaultdict
+import time
 
+from django.db import connection, transaction
 
-def path_modifier(path):
-    l = 0.0 if math.isnan(path.length) else path.length
-    return {"id": path.pk, "length": l}
+from .models import Path
 
 
-def get_key_optimizer():
-    next_id = iter(xrange(1, 1000000)).next
-    mapping = defaultdict(next_id)
-    return lambda x: mapping[x]
+_cursor_names = itertools.count()
+
+
+def iter_path_edges(pks=None, chunk_size=2000):
+    """
+    Stream ``(id, length, start_point, end_point)`` of visible paths (only
+    those of ``pks`` if specified), using a server-side cursor. Geometries are
+    not transferred, only extremities.
+    """
+    sql = """
+    SELECT id, longueur,
+           ST_X(ST_StartPoint(geom)), ST_Y(ST_StartPoint(geom)),
+           ST_X(ST_EndPoint(geom)), ST_Y(ST_EndPoint(geom))
+    FROM %s
+    WHERE visible
+    """ % Path._meta.db_table
+    params = []
+    if pks is not None:
+        sql += " AND id = ANY(%s)"
+        params.append(list(pks))
+
+    with transaction.atomic():
+        connection.ensure_connection()
+        cursor = connection.connection.cursor('path_graph_%s' % next(_cursor_names))
+        cursor.itersize = chunk_size
+        try:
+            cursor.execute(sql, params)
+            for pk, length, start_x, start_y, end_x, end_y in cursor:
+                yield pk, length, (start_x, start_y), (end_x, end_y)
+        finally:
+            cursor.close()
+
+
+def fetch_path_changes(since):
+    """
+    Returns ``(txid, changed, reset)``: ids of paths changed by transactions
+    finished between ``since`` and ``txid`` transaction ids, as recorded by
+    triggers in ``l_t_troncon_graphe``. Transactions still running are left
+    for next time, even if they began first. ``reset`` is set if some
+    changes were lost (truncated paths or purged changes).
+    """
+    cursor = connection.cursor()
+    cursor.execute("""
+    WITH snapshot AS (SELECT txid_snapshot_xmin(txid_current_snapshot()) AS xmin)
+    SELECT snapshot.xmin, bool_or(changes.txid IS NOT NULL AND changes.troncon IS NULL),
+           array_agg(DISTINCT changes.troncon)
+    FROM snapshot LEFT JOIN l_t_troncon_graphe changes
+        ON changes.txid >= %s AND changes.txid < snapshot.xmin
+    GROUP BY snapshot.xmin
+    """, [since])
+    txid, reset, changed = cursor.fetchone()
+    return txid, bool(reset), set(changed) - set([None])
+
+
+def purge_path_changes(horizon):
+    """
+    Forget paths changes of transactions before ``horizon``: graphs which
+    did not apply them are rebuilt.
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT ft_troncons_graphe_purge(%s)", [horizon])
+
+
+class PathGraph(object):
+    """
+    Paths graph which can be patched with paths changes instead of being
+    rebuilt from scratch.
+
+    Each applied change set increments ``version``. The edges touched by the
+    most recent change sets are kept, in order to serve deltas to clients
+    which already have a previous version of the graph.
+
+    Changes are read by transaction ids (``txid``), not by modification
+    dates, so that long transactions are not missed when they commit.
+    """
+    # Number of change sets kept for deltas
+    history_size = 100
+
+    def __init__(self):
+        # Start from current time, so that versions of a rebuilt store
+        # never collide with the ones of a previous store.
+        self.version = int(time.time() * 1000)
+        self.txid = None  # Changes of transactions before this id are applied
+        self.horizon = None  # Transaction id of the oldest change set kept
+        self.edges = {}
+        self.nodes = {}
+        self.node_keys = {}  # coords -> node id
+        self.history = []  # [(version, touched edges ids, txid), ...]
+
+    def node_id(self, coords):
+        try:
+            return self.node_keys[coords]
+        except KeyError:
+            key = len(self.node_keys) + 1
+            self.node_keys[coords] = key
+            return key
+
+    def add_path(self, path):
+        coords = path.geom.coords
+        self.add_edge(path.pk, path.length, coords[0], coords[-1])
+
+    def add_edge(self, edge_id, length, start_point, end_point):
+        k_start_point, k_end_point = self.node_id(start_point), self.node_id(end_point)
+        length = 0.0 if length is None or math.isnan(length) else length
+        edge = {'id': edge_id, 'length': length, 'nodes_id': [k_start_point, k_end_point]}
+
+        self.nodes.setdefault(k_start_point, {})[k_end_point] = edge_id
+        self.nodes.setdefault(k_end_point, {})[k_start_point] = edge_id
+        self.edges[edge_id] = edge
+
+    def remove_edge(self, edge_id):
+        """
+        Remove edge from graph, and return the pair of nodes it was linking
+        if no other edge was recorded between them.
+        """
+        edge = self.edges.pop(edge_id, None)
+        if edge is None:
+            return None
+        a, b = edge['nodes_id']
+        unlinked = None
+        if self.nodes.get(a, {}).get(b) == edge_id:
+            del self.nodes[a][b]
+            self.nodes.get(b, {}).pop(a, None)
+            unlinked = (a, b)
+        for node in (a, b):
+            if node in self.nodes and not self.nodes[node]:
+                del self.nodes[node]
+        return unlinked
+
+    def apply_changes(self, changed, deleted, txid):
+        """
+        Patch the graph with ``changed`` edges (inserted or updated paths, as
+        yielded by ``iter_path_edges()``) and ``deleted`` paths ids, then
+        bump version.
+        """
+        touched = set(deleted)
+        unlinked = set()
+        for pk in deleted:
+            unlinked.add(self.remove_edge(pk))
+        for pk, length, start_point, end_point in changed:
+            unlinked.add(self.remove_edge(pk))
+            self.add_edge(pk, length, start_point, end_point)
+            touched.add(pk)
+        unlinked.discard(None)
+
+        # Only one edge is recorded between two nodes: restore remaining
+        # parallel edges between nodes that were unlinked.
+        if unlinked:
+            for edge_id, edge in self.edges.items():
+                a, b = edge['nodes_id']
+                if (a, b) in unlinked or (b, a) in unlinked:
+                    self.nodes.setdefault(a, {}).setdefault(b, edge_id)
+                    self.nodes.setdefault(b, {}).setdefault(a, edge_id)
+
+        if touched:
+            self.version += 1
+            self.history.append((self.version, touched, self.txid))
+            if len(self.history) > self.history_size:
+                self.horizon = self.history[-self.history_size - 1][2]
+                self.history = self.history[-self.history_size:]
+        self.txid = txid
+        return touched
+
+    def refresh(self):
+        """
+        Update graph from database, fetching only the paths that were
+        changed since last refresh. Returns True if graph has changed.
+        """
+        if self.txid is not None:
+            txid, reset, changed = fetch_path_changes(self.txid)
+            if not reset:
+                edges = list(iter_path_edges(pks=changed)) if changed else []
+                deleted = changed - set([edge[0] for edge in edges])
+                return bool(self.apply_changes(edges, deleted, txid))
+        self.rebuild()
+        return True
+
+    def rebuild(self):
+        """
+        Load all paths from database. Clients of previous versions get the
+        whole graph.
+        """
+        cursor = connection.cursor()
+        cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        txid = cursor.fetchone()[0]
+        self.edges, self.nodes, self.node_keys, self.history = {}, {}, {}, []
+        for pk, length, start_point, end_point in iter_path_edges():
+            self.add_edge(pk, length, start_point, end_point)
+        self.version += 1
+        self.txid = txid
+        self.horizon = None
+
+    def is_up_to_date(self):
+        """
+        Returns True if no paths changed since last refresh.
+        """
+        if self.txid is None:
+            return False
+        txid, reset, changed = fetch_path_changes(self.txid)
+        return not (reset or changed)
+
+    def delta(self, since):
+        """
+        Return the edges touched since the specified version, along with
+        the ids of deleted edges. If the version is unknown (too old or
+        from another store), all edges are returned and ``reset`` is set.
+        """
+        oldest = self.history[0][0] - 1 if self.history else self.version
+        if since > self.version or since < oldest:
+            return {
+                'version': self.version,
+                'reset': True,
+                'edges': self.edges,
+                'deleted': [],
+            }
+        touched = set()
+        for version, edges_ids, txid in self.history:
+            if version > since:
+                touched.update(edges_ids)
+        return {
+            'version': self.version,
+            'reset': False,
+            'edges': dict([(pk, self.edges[pk]) for pk in touched if pk in self.edges]),
+            'deleted': sorted([pk for pk in touched if pk not in self.edges]),
+        }
+
+    def to_dict(self):
+        return {
+            'edges': dict(self.edges),
+            'nodes': dict(self.nodes),
+        }
+
+    def iter_dump(self, chunk_size=1000):
+        """
+        Yield graph as JSON, by pieces of ``chunk_size`` edges or nodes,
+        instead of encoding the whole structure in memory.
+        """
+        for name, items in (('edges', self.edges), ('nodes', self.nodes)):
+            yield '%s"%s": {' % ('{' if name == 'edges' else ', ', name)
+            chunk = []
+            separator = ''
+            for key, value in items.iteritems():
+                chunk.append('"%s": %s' % (key, json.dumps(value)))
+                if len(chunk) >= chunk_size:
+                    yield separator + ', '.join(chunk)
+                    chunk = []
+                    separator = ', '
+            if chunk:
+                yield separator + ', '.join(chunk)
+            yield '}'
+        yield '}'
+
+    def dump(self, fp):
+        """
+        Write graph as JSON into ``fp``, see ``iter_dump()``.
+        """
+        for piece in self.iter_dump():
+            fp.write(piece)
+
+
+def cached_graph(cache, key='path_graph'):
+    """
+    Returns the paths graph kept in ``cache``, patched with paths changes.
+    Refresh and publication are serialized by a database lock, so that each
+    published version follows the previous one: concurrent processes never
+    publish different graphs under the same version.
+
+    ``(txid, version)`` of the published graph is kept under ``<key>_version``.
+    """
+    graph = cache.get(key)
+    if graph is not None and graph.is_up_to_date():
+        return graph
+    with transaction.atomic():
+        cursor = connection.cursor()
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [key])
+        # Another process may have refreshed it meanwhile
+        graph = cache.get(key) or PathGraph()
+        horizon = graph.horizon
+        if graph.refresh():
+            cache.set(key, graph)
+            cache.set('%s_version' % key, (graph.txid, graph.version))
+            if graph.horizon is not None and graph.horizon != horizon:
+                purge_path_changes(graph.horizon)
+    return graph
 
 
 def graph_edges_nodes_of_qs(qs):
@@ -31,27 +312,7 @@ def graph_edges_nodes_of_qs(qs):
 
     coord_point are tuple of float
     """
-
-    key_modifier = get_key_optimizer()
-    value_modifier = path_modifier
-
-    edges = defaultdict(dict)
-    nodes = defaultdict(dict)
-
+    graph = PathGraph()
     for path in qs:
-        coords = path.geom.coords
-        start_point, end_point = coords[0], coords[-1]
-        k_start_point, k_end_point = key_modifier(start_point), key_modifier(end_point)
-
-        v_path = value_modifier(path)
-        v_path['nodes_id'] = [k_start_point, k_end_point]
-        edge_id = v_path['id']
-
-        nodes[k_start_point][k_end_point] = edge_id
-        nodes[k_end_point][k_start_point] = edge_id
-        edges[edge_id] = v_path
-
-    return {
-        'edges': dict(edges),
-        'nodes': dict(nodes),
-    }
+        graph.add_path(path)
+    return graph.to_dict()
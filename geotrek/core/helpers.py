@@ -1,17 +1,52 @@
 import json
 import logging
+from contextlib import contextmanager
+from StringIO import StringIO
 
 from django.conf import settings
-from django.db import connection
+from django.db import connection, transaction
 from django.contrib.gis.geos import Point
 from django.db.models.query import QuerySet
 
-from geotrek.common.utils import sqlfunction, uniquify
+from geotrek.common.utils import sqlfunction
 
 
 logger = logging.getLogger(__name__)
 
 
+@contextmanager
+def skip_evenement_geometry():
+    """
+    Prevent triggers from computing topologies geometries on each path
+    aggregation change. Geometries have to be computed explicitly with
+    ``update_geometry_of_evenement()``.
+    """
+    with transaction.atomic():
+        cursor = connection.cursor()
+        cursor.execute("SET LOCAL geotrek.skip_evenement_geometry = 'on'")
+        try:
+            yield
+        finally:
+            cursor.execute("SET LOCAL geotrek.skip_evenement_geometry = 'off'")
+
+
+@contextmanager
+def defer_evenement_geometry():
+    """
+    Only record topologies whose geometry has to be computed by triggers,
+    and compute each of them once when leaving the block.
+    """
+    with transaction.atomic():
+        cursor = connection.cursor()
+        cursor.execute("SELECT ft_setting_enabled('geotrek.defer_evenement_geometry')")
+        nested = cursor.fetchone()[0]
+        cursor.execute("SET LOCAL geotrek.defer_evenement_geometry = 'on'")
+        yield
+        if not nested:
+            cursor.execute("SET LOCAL geotrek.defer_evenement_geometry = 'off'")
+            cursor.execute("SELECT ft_evenements_geometry_flush()")
+
+
 class TopologyHelper(object):
     @classmethod
     def deserialize(cls, serialized):
@@ -92,7 +127,14 @@ class TopologyHelper(object):
         PathAggregation.objects.filter(topo_object=topology).delete()
 
         try:
+            # Fetch all paths at once
+            paths_pks = set()
+            for subtopology in objdict:
+                paths_pks.update([int(path_pk) for path_pk in subtopology['paths']])
+            paths_by_pk = Path.objects.in_bulk(paths_pks)
+
             counter = 0
+            aggregations = []
             for j, subtopology in enumerate(objdict):
                 last_topo = j == len(objdict) - 1
                 positions = subtopology.get('positions', {})
@@ -103,8 +145,14 @@ class TopologyHelper(object):
                     # Javascript hash keys are parsed as a string
                     idx = str(i)
                     start_position, end_position = positions.get(idx, (0.0, 1.0))
-                    path = Path.objects.get(pk=path)
-                    topology.add_path(path, start=start_position, end=end_position, order=counter, reload=False)
+                    try:
+                        path = paths_by_pk[int(path)]
+                    except KeyError:
+                        raise Path.DoesNotExist("Path %s does not exist" % path)
+                    aggregations.append(PathAggregation(topo_object=topology, path=path,
+                                                        start_position=start_position,
+                                                        end_position=end_position,
+                                                        order=counter))
                     if not last_topo and last_path:
                         counter += 1
                         # Intermediary marker.
@@ -126,10 +174,19 @@ class TopologyHelper(object):
                         elif len(paths) == 1:
                             pos = end_position
                         assert pos >= 0, "Invalid position (%s, %s)." % (start_position, end_position)
-                        topology.add_path(path, start=pos, end=pos, order=counter, reload=False)
+                        aggregations.append(PathAggregation(topo_object=topology, path=path,
+                                                            start_position=pos,
+                                                            end_position=pos,
+                                                            order=counter))
                     counter += 1
-        except (AssertionError, ValueError, KeyError, Path.DoesNotExist) as e:
+        except (AssertionError, ValueError, KeyError, TypeError, Path.DoesNotExist) as e:
             raise ValueError("Invalid serialized topology : %s" % e)
+
+        # Insert all aggregations in one query, and compute geometry once
+        with skip_evenement_geometry():
+            PathAggregation.objects.bulk_create(aggregations)
+        sqlfunction('SELECT update_geometry_of_evenement', str(topology.pk))
+        topology.deleted = False
         topology.save()
         return topology
 
@@ -201,59 +258,113 @@ class TopologyHelper(object):
         return json.dumps(objdict)
 
     @classmethod
-    def overlapping(cls, klass, queryset):
-        from .models import Path, Topology, PathAggregation
+    def _overlapping_rows(cls, klass, topology_pks):
+        """
+        Returns rows of (topology pk, overlapping pk, rank), ranked by
+        order of progression along the specified topologies.
+        """
+        from .models import Topology, PathAggregation
 
-        all_objects = klass.objects.existing()
         is_generic = klass.KIND == Topology.KIND
-        single_input = isinstance(queryset, QuerySet)
-
-        if single_input:
-            topology_pks = [str(pk) for pk in queryset.values_list('pk', flat=True)]
-        else:
-            topology_pks = [str(queryset.pk)]
-
-        if len(topology_pks) == 0:
-            return all_objects.filter(pk__in=[])
-
         sql = """
-        WITH topologies AS (SELECT id FROM %(topology_table)s WHERE id IN (%(topology_list)s)),
-        -- Concerned aggregations
-             aggregations AS (SELECT * FROM %(aggregations_table)s a, topologies t
-                              WHERE a.evenement = t.id),
-        -- Concerned paths along with (start, end)
-             paths_aggr AS (SELECT a.pk_debut AS start, a.pk_fin AS end, p.id, a.ordre AS order
-                            FROM %(paths_table)s p, aggregations a
-                            WHERE a.troncon = p.id
-                            ORDER BY a.ordre)
+        WITH topologies AS (SELECT unnest(%%s::integer[]) AS id),
+        -- Concerned aggregations, with (start, end)
+             paths_aggr AS (SELECT t.id AS topology, a.pk_debut AS start, a.pk_fin AS end,
+                                   a.troncon AS path, a.ordre AS order
+                            FROM %(aggregations_table)s a
+                            JOIN topologies t ON a.evenement = t.id)
         -- Retrieve primary keys
-        SELECT t.id
-        FROM %(topology_table)s t, %(aggregations_table)s a, paths_aggr pa
-        WHERE a.troncon = pa.id AND a.evenement = t.id
-          AND least(a.pk_debut, a.pk_fin) <= greatest(pa.start, pa.end)
+        SELECT pa.topology, t.id,
+               pa.order + CASE WHEN pa.start > pa.end THEN (1 - a.pk_debut) ELSE a.pk_debut END AS rank
+        FROM %(topology_table)s t
+        JOIN %(aggregations_table)s a ON a.evenement = t.id
+        JOIN paths_aggr pa ON a.troncon = pa.path
+        WHERE least(a.pk_debut, a.pk_fin) <= greatest(pa.start, pa.end)
           AND greatest(a.pk_debut, a.pk_fin) >= least(pa.start, pa.end)
           AND %(extra_condition)s
-        ORDER BY (pa.order + CASE WHEN pa.start > pa.end THEN (1 - a.pk_debut) ELSE a.pk_debut END);
         """ % {
             'topology_table': Topology._meta.db_table,
             'aggregations_table': PathAggregation._meta.db_table,
-            'paths_table': Path._meta.db_table,
-            'topology_list': ','.join(topology_pks),
-            'extra_condition': 'true' if is_generic else "kind = '%s'" % klass.KIND
+            'extra_condition': 'true' if is_generic else "t.kind = %s",
         }
-
+        params = [list(topology_pks)]
+        if not is_generic:
+            params.append(klass.KIND)
         cursor = connection.cursor()
-        cursor.execute(sql)
-        result = cursor.fetchall()
-        pk_list = uniquify([row[0] for row in result])
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+    @classmethod
+    def _ranked_queryset(cls, klass, pk_list, topology_pks):
+        """
+        Return a QuerySet of specified pks, ordered by their first rank
+        along the specified topologies (see ``_overlapping_rows()``).
+        """
+        from .models import Topology, PathAggregation
+
+        # Rank of each object is read from its own aggregations (indexed),
+        # instead of searching its pk in the list
+        ordering = """SELECT min(pa.ordre + CASE WHEN pa.pk_debut > pa.pk_fin THEN (1 - a.pk_debut) ELSE a.pk_debut END)
+                      FROM %(aggregations_table)s a
+                      JOIN %(aggregations_table)s pa ON pa.troncon = a.troncon
+                      WHERE a.evenement = %(topology_table)s.id
+                        AND pa.evenement = ANY(%%s)
+                        AND least(a.pk_debut, a.pk_fin) <= greatest(pa.pk_debut, pa.pk_fin)
+                        AND greatest(a.pk_debut, a.pk_fin) >= least(pa.pk_debut, pa.pk_fin)""" % {
+            'topology_table': Topology._meta.db_table,
+            'aggregations_table': PathAggregation._meta.db_table,
+        }
+        return klass.objects.existing().extra(
+            where=['%s.id = ANY(%%s)' % Topology._meta.db_table], params=[pk_list],
+            select={'ordering': ordering}, select_params=[topology_pks],
+            order_by=('ordering',))
+
+    @classmethod
+    def overlapping(cls, klass, queryset):
+        all_objects = klass.objects.existing()
+        single_input = isinstance(queryset, QuerySet)
+
+        if single_input:
+            topology_pks = list(queryset.values_list('pk', flat=True))
+        else:
+            topology_pks = [queryset.pk]
+
+        if len(topology_pks) == 0:
+            return all_objects.filter(pk__in=[])
+
+        rows = cls._overlapping_rows(klass, topology_pks)
+        pk_list = list(set([pk for topology_pk, pk, rank in rows]))
+        return cls._ranked_queryset(klass, pk_list, topology_pks)
+
+    @classmethod
+    def overlapping_batch(cls, klass, topologies, queryset=None):
+        """
+        Returns the objects of ``klass`` overlapping each of the specified
+        topologies, as a dict of ordered lists keyed by topology pk.
+        ``queryset`` can be given to select related objects or restrict results.
+        """
+        if isinstance(topologies, QuerySet):
+            topology_pks = list(topologies.values_list('pk', flat=True))
+        else:
+            topology_pks = [topology.pk for topology in topologies]
+        result = dict([(pk, []) for pk in topology_pks])
+        if len(topology_pks) == 0:
+            return result
+
+        rows = cls._overlapping_rows(klass, topology_pks)
+        rows.sort(key=lambda row: (row[0], row[2]))
 
-        # Return a QuerySet and preserve pk list order
-        # http://stackoverflow.com/a/1310188/141895
-        ordering = 'CASE %s END' % ' '.join(['WHEN %s.id=%s THEN %s' % (Topology._meta.db_table, id_, i)
-                                             for i, id_ in enumerate(pk_list)])
-        queryset = all_objects.filter(pk__in=pk_list).extra(
-            select={'ordering': ordering}, order_by=('ordering',))
-        return queryset
+        if queryset is None:
+            queryset = klass.objects.existing()
+        objects = queryset.in_bulk(set([row[1] for row in rows]))
+
+        seen = set()
+        for topology_pk, pk, rank in rows:
+            if (topology_pk, pk) in seen or pk not in objects:
+                continue
+            seen.add((topology_pk, pk))
+            result[topology_pk].append(objects[pk])
+        return result
 
 
 class PathHelper(object):
@@ -300,6 +411,89 @@ class PathHelper(object):
         TODO: this could be a constraint at DB-level. But this would mean that
         path never ever overlap, even during trigger computation, like path splitting...
         """
-        wkt = "ST_GeomFromText('%s', %s)" % (geom, settings.SRID)
-        disjoint = sqlfunction('SELECT * FROM check_path_not_overlap', str(pk), wkt)
-        return disjoint[0]
+        cursor = connection.cursor()
+        cursor.execute("SELECT check_path_not_overlap(%s, ST_GeomFromText(%s, %s))",
+                       [pk, geom.wkt, settings.SRID])
+        return cursor.fetchone()[0]
+
+    @classmethod
+    def disjoint_batch(cls, geoms, pks=None):
+        """
+        Returns, for each geometry, True if it overlaps neither existing
+        paths (except the one with corresponding pk) nor other geometries of
+        the batch. Checked in one query.
+        """
+        if not geoms:
+            return []
+        if pks is None:
+            pks = [None] * len(geoms)
+        ewkts = ['SRID=%s;%s' % (settings.SRID, geom.wkt) for geom in geoms]
+        cursor = connection.cursor()
+        cursor.execute("SELECT disjoint FROM check_paths_not_overlap(%s::integer[], %s::geometry[])",
+                       [list(pks), ewkts])
+        return [row[0] for row in cursor.fetchall()]
+
+    # Path fields copied into staging table by bulk_create()
+    bulk_fields = ('structure', 'visible', 'valid', 'name', 'comments', 'source', 'stake',
+                   'comfort', 'departure', 'arrival', 'eid', 'geom')
+
+    @classmethod
+    def bulk_create(cls, paths):
+        """
+        Insert unsaved paths at once, and returns ids of inserted paths (one
+        per segment when imported paths cross each other).
+
+        Instead of triggers running for each path, snapping, splitting, draping
+        and land layers are computed in a few statements by ``ft_troncons_import()``.
+        Only paths crossing existing ones go through split trigger, as usual.
+        The resulting paths are the same, except for the order of snapping
+        between imported paths. Many-to-many relations are not saved.
+        """
+        from .models import Path
+
+        fields = [Path._meta.get_field(name) for name in cls.bulk_fields]
+        columns = [field.column for field in fields]
+        lines = []
+        for path in paths:
+            values = []
+            for field in fields:
+                value = getattr(path, field.attname)
+                if field.name == 'geom':
+                    value = value.clone()
+                    if value.srid and value.srid != settings.SRID:
+                        value.transform(settings.SRID)
+                    value.srid = settings.SRID
+                    value = value.hexewkb
+                values.append(cls._copy_value(value))
+            lines.append(u'\t'.join(values) + u'\n')
+        if not lines:
+            return []
+
+        with transaction.atomic():
+            cursor = connection.cursor()
+            cursor.execute("""
+                CREATE TEMPORARY TABLE l_t_troncon_import ON COMMIT DROP AS
+                    SELECT %s FROM %s WITH NO DATA
+            """ % (', '.join(columns), Path._meta.db_table))
+            cursor.execute("ALTER TABLE l_t_troncon_import ADD COLUMN row_id serial")
+            cursor.copy_from(StringIO(u''.join(lines).encode('utf-8')), 'l_t_troncon_import', columns=columns)
+            cursor.execute("CREATE INDEX ON l_t_troncon_import USING gist(geom)")
+            cursor.execute("ANALYZE l_t_troncon_import")
+            cursor.execute("SELECT ft_troncons_import()")
+            pks = cursor.fetchone()[0]
+            cursor.execute("DROP TABLE l_t_troncon_import")
+        return pks
+
+    @classmethod
+    def _copy_value(cls, value):
+        """
+        Format value for ``COPY`` text format.
+        """
+        if value is None:
+            return u'\\N'
+        if isinstance(value, bool):
+            return u't' if value else u'f'
+        value = unicode(value)
+        for char, escaped in ((u'\\', u'\\\\'), (u'\t', u'\\t'), (u'\n', u'\\n'), (u'\r', u'\\r')):
+            value = value.replace(char, escaped)
+        return value
@@ -0,0 +1,73 @@
+import os.path
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.gis.geos import GEOSGeometry
+
+from geotrek.authent.models import Structure, default_structure
+from geotrek.core.helpers import PathHelper
+from geotrek.core.models import Path
+
+
+class Command(BaseCommand):
+    args = '<line_layer>'
+    help = 'Load a layer with line geometries as paths, in one batch\n'
+    can_import_settings = True
+    field_name = 'name'
+    field_comments = 'comments'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--structure',
+                    default=None,
+                    help='Name of the structure of paths (default: %s).' % settings.DEFAULT_STRUCTURE_NAME),
+    )
+
+    def handle(self, *args, **options):
+
+        try:
+            from osgeo import ogr
+        except ImportError:
+            msg = 'GDAL Python bindings are not available. Can not proceed.'
+            raise CommandError(msg)
+
+        # Validate arguments
+        if len(args) != 1:
+            raise CommandError('Filename missing. See help')
+
+        filename = args[0]
+
+        if not os.path.exists(filename):
+            raise CommandError('File does not exists at: %s' % filename)
+
+        if options['structure']:
+            try:
+                structure = Structure.objects.get(name=options['structure'])
+            except Structure.DoesNotExist:
+                raise CommandError('Structure does not exist: %s' % options['structure'])
+        else:
+            structure = default_structure()
+
+        datasource = ogr.Open(filename)
+        if datasource is None:
+            raise CommandError('Format is not recognized by OGR.')
+        layer = datasource.GetLayer()
+        definition = layer.GetLayerDefn()
+        fields = [definition.GetFieldDefn(i).GetName() for i in range(definition.GetFieldCount())]
+        self.stdout.write('%s objects found' % layer.GetFeatureCount())
+
+        paths = []
+        for feature in layer:
+            featureGeom = feature.GetGeometryRef()
+            geometry = GEOSGeometry(featureGeom.ExportToWkt(), srid=settings.SRID)
+            lines = geometry if geometry.geom_type == 'MultiLineString' else [geometry]
+            attrs = {'structure': structure}
+            if self.field_name in fields:
+                attrs['name'] = feature.GetFieldAsString(self.field_name).decode('utf-8') or None
+            if self.field_comments in fields:
+                attrs['comments'] = feature.GetFieldAsString(self.field_comments).decode('utf-8') or None
+            for line in lines:
+                paths.append(Path(geom=line, **attrs))
+
+        pks = PathHelper.bulk_create(paths)
+        self.stdout.write('%s paths created' % len(pks))
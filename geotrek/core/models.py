@@ -16,7 +16,7 @@ from geotrek.common.utils import classproperty
 from geotrek.common.utils.postgresql import debug_pg_notices
 from geotrek.altimetry.models import AltimetryMixin
 
-from .helpers import PathHelper, TopologyHelper
+from .helpers import PathHelper, TopologyHelper, defer_evenement_geometry
 from django.db import connections, DEFAULT_DB_ALIAS
 
 
@@ -313,6 +313,13 @@ class Topology(AddPropertyMixin, AltimetryMixin, TimeStampedModelMixin, NoDelete
         """
         return TopologyHelper.overlapping(cls, topologies)
 
+    @classmethod
+    def overlapping_batch(cls, topologies, queryset=None):
+        """ Return a dict of lists of topologies overlapping each of specified
+        topologies, keyed by topology pk.
+        """
+        return TopologyHelper.overlapping_batch(cls, topologies, queryset)
+
     def mutate(self, other, delete=True):
         """
         Take alls attributes of the other topology specified and
@@ -333,8 +340,9 @@ class Topology(AddPropertyMixin, AltimetryMixin, TimeStampedModelMixin, NoDelete
         # In this case, the trigger will create them, so ignore them here.
         if other.ispoint():
             aggrs = aggrs[:1]
-        for aggr in aggrs:
-            self.add_path(aggr.path, aggr.start_position, aggr.end_position, aggr.order, reload=False)
+        with defer_evenement_geometry():
+            for aggr in aggrs:
+                self.add_path(aggr.path, aggr.start_position, aggr.end_position, aggr.order, reload=False)
         self.reload()
         if delete:
             other.delete(force=True)  # Really delete it from database
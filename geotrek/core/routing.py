@@ -0,0 +1,182 @@
+import heapq
+import json
+import math
+import threading
+from collections import OrderedDict
+
+from .graph import PathGraph
+
+
+class LRUCache(object):
+    """
+    Small least-recently-used mapping, dropping oldest entries when
+    ``maxsize`` is reached. It can be shared by threads.
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.entries[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class PathRouter(object):
+    """
+    Shortest path computation over the paths graph (A* with an euclidean
+    heuristic). Results are returned as serialized topologies, in the format
+    expected by ``TopologyHelper.deserialize()``.
+    """
+    def __init__(self, graph=None, cache_size=128):
+        self.graph = graph or PathGraph()
+        self.cache = LRUCache(cache_size)
+        self.lock = threading.Lock()
+        self.adjacency = {}
+        self.coords = {}
+        self.version = None
+
+    def refresh(self):
+        with self.lock:
+            self.graph.refresh()
+            if self.version != self.graph.version:
+                self.build()
+
+    def build(self):
+        """
+        Build adjacency lists from graph edges. Unlike graph nodes, they keep
+        every edge between two nodes.
+        """
+        adjacency = {}
+        for edge_id, edge in self.graph.edges.iteritems():
+            a, b = edge['nodes_id']
+            adjacency.setdefault(a, []).append((b, edge_id, edge['length'], True))
+            adjacency.setdefault(b, []).append((a, edge_id, edge['length'], False))
+        self.adjacency = adjacency
+        self.coords = dict([(v, k) for (k, v) in self.graph.node_keys.iteritems()])
+        self.version = self.graph.version
+        self.cache.clear()
+
+    def route(self, start_path, start_position, end_path, end_position):
+        """
+        Returns the serialized topology of the shortest way between two
+        positions snapped on paths, or None if they are not connected.
+        """
+        key = (self.version, start_path, start_position, end_path, end_position)
+        result = self.cache.get(key)
+        if result is None:
+            result = self.compute(start_path, start_position, end_path, end_position)
+            self.cache.set(key, result)
+        return result
+
+    def distance(self, a, b):
+        (xa, ya), (xb, yb) = self.coords[a], self.coords[b]
+        return math.hypot(xb - xa, yb - ya)
+
+    def compute(self, start_path, start_position, end_path, end_position):
+        start_edge = self.graph.edges.get(start_path)
+        end_edge = self.graph.edges.get(end_path)
+        if start_edge is None or end_edge is None:
+            return None
+
+        # Leaving start path through one of its extremities, and reaching
+        # end position from one of the end path extremities.
+        start_length, end_length = start_edge['length'], end_edge['length']
+        (s_first, s_last), (e_first, e_last) = start_edge['nodes_id'], end_edge['nodes_id']
+        sources = [(start_position * start_length, s_first, 0.0),
+                   ((1 - start_position) * start_length, s_last, 1.0)]
+        targets = {}
+        for cost, node, position in [(end_position * end_length, e_first, 0.0),
+                                     ((1 - end_position) * end_length, e_last, 1.0)]:
+            if node not in targets or cost < targets[node][0]:
+                targets[node] = (cost, position)
+
+        def heuristic(node):
+            return min([self.distance(node, target) for target in targets])
+
+        best_cost, best = None, None
+        if start_path == end_path:
+            best_cost = abs(end_position - start_position) * start_length
+            best = [(start_path, start_position, end_position)]
+
+        # A* search from start path extremities
+        costs = {}
+        previous = {}
+        queue = []
+        for cost, node, position in sources:
+            if node not in costs or cost < costs[node]:
+                costs[node] = cost
+                previous[node] = (None, start_path, start_position, position)
+                heapq.heappush(queue, (cost + heuristic(node), cost, node))
+        done = set()
+        while queue:
+            estimate, cost, node = heapq.heappop(queue)
+            if node in done:
+                continue
+            if best_cost is not None and estimate >= best_cost:
+                break
+            done.add(node)
+            if node in targets:
+                total = cost + targets[node][0]
+                if best_cost is None or total < best_cost:
+                    best_cost = total
+                    best = self._legs(previous, node)
+                    best.append((end_path, targets[node][1], end_position))
+            for neighbour, edge_id, length, forward in self.adjacency.get(node, []):
+                new_cost = cost + length
+                if neighbour not in done and (neighbour not in costs or new_cost < costs[neighbour]):
+                    costs[neighbour] = new_cost
+                    positions = (0.0, 1.0) if forward else (1.0, 0.0)
+                    previous[neighbour] = (node, edge_id) + positions
+                    heapq.heappush(queue, (new_cost + heuristic(neighbour), new_cost, neighbour))
+
+        if best is None:
+            return None
+        return self.serialize(best)
+
+    def _legs(self, previous, node):
+        legs = []
+        while node is not None:
+            node, path, start, end = previous[node]
+            legs.insert(0, (path, start, end))
+        return legs
+
+    def serialize(self, legs):
+        # Skip legs of null length (positions on extremities)
+        legs = [leg for leg in legs if leg[1] != leg[2]] or legs[:1]
+        return json.dumps([{
+            'offset': 0,
+            'paths': [path for path, start, end in legs],
+            'positions': dict([(str(i), (start, end)) for i, (path, start, end) in enumerate(legs)]),
+        }])
+
+
+_router = PathRouter()
+
+
+def get_router():
+    """
+    Returns the router of this process, up-to-date with paths in database.
+    """
+    _router.refresh()
+    return _router
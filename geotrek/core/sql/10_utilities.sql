@@ -131,3 +131,16 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+
+
+-------------------------------------------------------------------------------
+-- Read a boolean session setting (False if never set)
+-------------------------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION geotrek.ft_setting_enabled(name text) RETURNS boolean AS $$
+BEGIN
+    RETURN coalesce(current_setting(name), '') IN ('on', 'true', '1');
+EXCEPTION WHEN undefined_object THEN
+    RETURN false;
+END;
+$$ LANGUAGE plpgsql STABLE;
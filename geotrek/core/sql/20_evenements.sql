@@ -54,6 +54,15 @@ AFTER DELETE ON e_t_evenement
 FOR EACH ROW EXECUTE PROCEDURE evenement_latest_updated_d();
 
 
+-------------------------------------------------------------------------------
+-- Topologies waiting for geometry computation (deferred mode)
+-------------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS geotrek.e_t_evenement_dirty (
+    evenement integer NOT NULL
+);
+
+
 -------------------------------------------------------------------------------
 -- Update geometry of an "evenement"
 -------------------------------------------------------------------------------
@@ -80,6 +89,13 @@ BEGIN
         RETURN;
     END IF;
 
+    -- Deferred mode: only record the topology, its geometry will be
+    -- computed once by ft_evenements_geometry_flush()
+    IF ft_setting_enabled('geotrek.defer_evenement_geometry') THEN
+        INSERT INTO e_t_evenement_dirty (evenement) VALUES (eid);
+        RETURN;
+    END IF;
+
     -- See what kind of topology we have
     SELECT bool_and(et.pk_debut != et.pk_fin), bool_and(et.pk_debut = et.pk_fin), count(*)
         INTO lines_only, points_only, t_count
@@ -206,3 +222,49 @@ $$ LANGUAGE plpgsql;
 CREATE TRIGGER e_t_evenement_geom_iu_tgr
 BEFORE INSERT OR UPDATE OF geom ON e_t_evenement
 FOR EACH ROW EXECUTE PROCEDURE evenement_elevation_iu();
+
+
+-------------------------------------------------------------------------------
+-- Compute geometry of topologies recorded in deferred mode
+-------------------------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION geotrek.ft_evenements_geometry_flush() RETURNS integer AS $$
+DECLARE
+    eid integer;
+    deferred boolean;
+    t_count integer;
+BEGIN
+    deferred := ft_setting_enabled('geotrek.defer_evenement_geometry');
+    PERFORM set_config('geotrek.defer_evenement_geometry', 'off', true);
+
+    t_count := 0;
+    FOR eid IN WITH dirty AS (DELETE FROM e_t_evenement_dirty RETURNING evenement)
+               SELECT DISTINCT evenement FROM dirty
+    LOOP
+        PERFORM update_geometry_of_evenement(eid);
+        t_count := t_count + 1;
+    END LOOP;
+
+    PERFORM set_config('geotrek.defer_evenement_geometry', CASE WHEN deferred THEN 'on' ELSE 'off' END, true);
+    RETURN t_count;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-------------------------------------------------------------------------------
+-- Make sure deferred topologies are computed before commit
+-------------------------------------------------------------------------------
+
+DROP TRIGGER IF EXISTS e_t_evenement_dirty_flush_tgr ON e_t_evenement_dirty;
+
+CREATE OR REPLACE FUNCTION geotrek.evenements_geometry_flush_tgr() RETURNS trigger AS $$
+BEGIN
+    PERFORM ft_evenements_geometry_flush();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE CONSTRAINT TRIGGER e_t_evenement_dirty_flush_tgr
+AFTER INSERT ON e_t_evenement_dirty
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE PROCEDURE evenements_geometry_flush_tgr();
@@ -50,6 +50,11 @@ DECLARE
     eid integer;
     eids integer[];
 BEGIN
+    -- Bulk insertions compute geometry once for all (see TopologyHelper.deserialize)
+    IF ft_setting_enabled('geotrek.skip_evenement_geometry') THEN
+        RETURN NULL;
+    END IF;
+
     IF TG_OP = 'INSERT' THEN
         eids := array_append(eids, NEW.evenement);
     ELSE
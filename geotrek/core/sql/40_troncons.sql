@@ -56,32 +56,60 @@ CREATE TRIGGER l_t_troncon_date_update_tgr
 -------------------------------------------------------------------------------
 
 CREATE OR REPLACE FUNCTION geotrek.check_path_not_overlap(pid integer, line geometry) RETURNS BOOL AS $$
-DECLARE
-    t_count integer;
-    tolerance float;
 BEGIN
     -- Note: I gave up with the idea of checking almost overlap/touch.
 
     -- tolerance := 1.0;
     -- Crossing and extremity touching is OK.
     -- Overlapping and --almost overlapping-- is KO.
-    SELECT COUNT(*) INTO t_count
-    FROM l_t_troncon
-    WHERE pid != id
-      AND ST_GeometryType(ST_intersection(geom, line)) IN ('ST_LineString', 'ST_MultiLineString');
-      -- not extremity touching
-      -- AND ST_Touches(geom, line) = false
-      -- not crossing
-      -- AND ST_GeometryType(ST_intersection(geom, line)) NOT IN ('ST_Point', 'ST_MultiPoint')
-      -- overlap is a line
-      -- AND ST_GeometryType(ST_intersection(geom, ST_buffer(line, tolerance))) IN ('ST_LineString', 'ST_MultiLineString')
-      -- not almost touching, at most twice
-      -- AND       ST_Length(ST_intersection(geom, ST_buffer(line, tolerance))) > (4 * tolerance);
-    RETURN t_count = 0;
+    -- Bounding boxes are compared first (using spatial index), and
+    -- search stops at first overlapping path.
+    RETURN NOT EXISTS (
+        SELECT 1
+        FROM l_t_troncon
+        WHERE (pid IS NULL OR pid != id)
+          AND geom && line
+          AND ST_GeometryType(ST_intersection(geom, line)) IN ('ST_LineString', 'ST_MultiLineString')
+          -- not extremity touching
+          -- AND ST_Touches(geom, line) = false
+          -- not crossing
+          -- AND ST_GeometryType(ST_intersection(geom, line)) NOT IN ('ST_Point', 'ST_MultiPoint')
+          -- overlap is a line
+          -- AND ST_GeometryType(ST_intersection(geom, ST_buffer(line, tolerance))) IN ('ST_LineString', 'ST_MultiLineString')
+          -- not almost touching, at most twice
+          -- AND       ST_Length(ST_intersection(geom, ST_buffer(line, tolerance))) > (4 * tolerance);
+    );
 END;
 $$ LANGUAGE plpgsql;
 
 
+CREATE OR REPLACE FUNCTION geotrek.check_paths_not_overlap(pids integer[], lines geometry[])
+RETURNS TABLE (candidate integer, disjoint boolean) AS $$
+    -- Check a batch of candidate geometries against existing paths (except
+    -- the one with same id, if any) and against each other.
+    WITH candidates AS (
+        SELECT i, ($1)[i] AS pid, ($2)[i] AS line
+        FROM generate_subscripts($2, 1) AS i
+    )
+    SELECT c.i,
+           NOT EXISTS (
+               SELECT 1
+               FROM l_t_troncon t
+               WHERE (c.pid IS NULL OR c.pid != t.id)
+                 AND t.geom && c.line
+                 AND ST_GeometryType(ST_intersection(t.geom, c.line)) IN ('ST_LineString', 'ST_MultiLineString')
+           ) AND NOT EXISTS (
+               SELECT 1
+               FROM candidates o
+               WHERE o.i != c.i
+                 AND o.line && c.line
+                 AND ST_GeometryType(ST_intersection(o.line, c.line)) IN ('ST_LineString', 'ST_MultiLineString')
+           )
+    FROM candidates c
+    ORDER BY c.i;
+$$ LANGUAGE sql STABLE;
+
+
 -------------------------------------------------------------------------------
 -- Update geometry of related topologies
 -------------------------------------------------------------------------------
@@ -152,6 +180,10 @@ CREATE OR REPLACE FUNCTION geotrek.elevation_troncon_iu() RETURNS trigger AS $$
 DECLARE
     elevation elevation_infos;
 BEGIN
+    -- Bulk insertions drape paths all at once (see ft_troncons_import())
+    IF ft_setting_enabled('geotrek.skip_path_triggers') THEN
+        RETURN NEW;
+    END IF;
 
     SELECT * FROM ft_elevation_infos(NEW.geom, {{ALTIMETRIC_PROFILE_STEP}}) INTO elevation;
     -- Update path geometry
@@ -217,3 +249,63 @@ $$ LANGUAGE plpgsql;
 CREATE TRIGGER l_t_troncon_latest_updated_d_tgr
 AFTER DELETE ON l_t_troncon
 FOR EACH ROW EXECUTE PROCEDURE troncon_latest_updated_d();
+
+
+-------------------------------------------------------------------------------
+-- Record troncons changes, for the paths graph (see geotrek.core.graph).
+-- Rows are stamped with their transaction id, so that readers only apply
+-- the changes of finished transactions, whatever their commit order.
+-- A NULL troncon means that changes before its transaction are lost
+-- (truncated table or purged changes): graphs older than it are rebuilt.
+-------------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS geotrek.l_t_troncon_graphe (
+    troncon integer,
+    txid bigint NOT NULL DEFAULT txid_current()
+);
+
+DROP INDEX IF EXISTS l_t_troncon_graphe_txid_idx;
+CREATE INDEX l_t_troncon_graphe_txid_idx ON geotrek.l_t_troncon_graphe (txid);
+
+-- Troncons existing before install (or upgrade) are not recorded
+INSERT INTO geotrek.l_t_troncon_graphe (troncon)
+    SELECT NULL WHERE NOT EXISTS (SELECT 1 FROM geotrek.l_t_troncon_graphe);
+
+DROP TRIGGER IF EXISTS l_t_troncon_graphe_iud_tgr ON l_t_troncon;
+DROP TRIGGER IF EXISTS l_t_troncon_graphe_t_tgr ON l_t_troncon;
+
+CREATE OR REPLACE FUNCTION geotrek.troncon_graphe_iud() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO l_t_troncon_graphe (troncon) VALUES (OLD.id);
+    ELSIF TG_OP = 'INSERT' OR NEW.geom IS DISTINCT FROM OLD.geom
+          OR NEW.longueur IS DISTINCT FROM OLD.longueur OR NEW.visible IS DISTINCT FROM OLD.visible THEN
+        INSERT INTO l_t_troncon_graphe (troncon) VALUES (NEW.id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER l_t_troncon_graphe_iud_tgr
+AFTER INSERT OR UPDATE OR DELETE ON l_t_troncon
+FOR EACH ROW EXECUTE PROCEDURE troncon_graphe_iud();
+
+CREATE OR REPLACE FUNCTION geotrek.troncon_graphe_t() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO l_t_troncon_graphe (troncon) VALUES (NULL);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER l_t_troncon_graphe_t_tgr
+AFTER TRUNCATE ON l_t_troncon
+FOR EACH STATEMENT EXECUTE PROCEDURE troncon_graphe_t();
+
+
+-- Forget changes of transactions before ``horizon``
+CREATE OR REPLACE FUNCTION geotrek.ft_troncons_graphe_purge(horizon bigint) RETURNS void AS $$
+BEGIN
+    DELETE FROM l_t_troncon_graphe WHERE txid < horizon;
+    INSERT INTO l_t_troncon_graphe (troncon, txid) VALUES (NULL, horizon);
+END;
+$$ LANGUAGE plpgsql;
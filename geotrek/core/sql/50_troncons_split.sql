@@ -1,3 +1,31 @@
+-------------------------------------------------------------------------------
+-- Snap a point on another path, preferring its vertices within distance
+-------------------------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION geotrek.ft_snap_point(point geometry, other geometry, distance float8) RETURNS geometry AS $$
+DECLARE
+    closest geometry;
+    result geometry;
+    d float8;
+BEGIN
+    closest := ST_ClosestPoint(other, point);
+    result := closest;
+    d := distance;
+    FOR i IN 1..ST_NPoints(other) LOOP
+        IF ST_Distance(closest, ST_PointN(other, i)) < d THEN
+            d := ST_Distance(closest, ST_PointN(other, i));
+            result := ST_PointN(other, i);
+        END IF;
+    END LOOP;
+    RETURN result;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+
+-------------------------------------------------------------------------------
+-- Snap paths extremities
+-------------------------------------------------------------------------------
+
 DROP TRIGGER IF EXISTS l_t_troncon_00_snap_geom_iu_tgr ON l_t_troncon;
 
 CREATE OR REPLACE FUNCTION geotrek.troncons_snap_extremities() RETURNS trigger AS $$
@@ -8,10 +36,14 @@ DECLARE
     closest geometry;
     result geometry;
     newline geometry[];
-    d float8;
 
     DISTANCE float8;
 BEGIN
+    -- Bulk insertions snap paths all at once (see ft_troncons_import())
+    IF ft_setting_enabled('geotrek.skip_path_triggers') THEN
+        RETURN NEW;
+    END IF;
+
     DISTANCE := {{PATH_SNAPPING_DISTANCE}};
 
     linestart := ST_StartPoint(NEW.geom);
@@ -29,14 +61,7 @@ BEGIN
     IF closest IS NULL THEN
         result := linestart;
     ELSE
-        result := closest;
-        d := DISTANCE;
-        FOR i IN 1..ST_NPoints(other) LOOP
-            IF ST_Distance(closest, ST_PointN(other, i)) < DISTANCE AND ST_Distance(closest, ST_PointN(other, i)) < d THEN
-                d := ST_Distance(closest, ST_PointN(other, i));
-                result := ST_PointN(other, i);
-            END IF;
-        END LOOP;
+        result := ft_snap_point(linestart, other, DISTANCE);
         IF NOT ST_Equals(linestart, result) THEN
             RAISE NOTICE 'Snapped start % to %, from %', ST_AsText(linestart), ST_AsText(result), ST_AsText(other);
         END IF;
@@ -59,14 +84,7 @@ BEGIN
     IF closest IS NULL THEN
         result := lineend;
     ELSE
-        result := closest;
-        d := DISTANCE;
-        FOR i IN 1..ST_NPoints(other) LOOP
-            IF ST_Distance(closest, ST_PointN(other, i)) < DISTANCE AND ST_Distance(closest, ST_PointN(other, i)) < d THEN
-                d := ST_Distance(closest, ST_PointN(other, i));
-                result := ST_PointN(other, i);
-            END IF;
-        END LOOP;
+        result := ft_snap_point(lineend, other, DISTANCE);
         IF NOT ST_Equals(lineend, result) THEN
             RAISE NOTICE 'Snapped end % to %, from %', ST_AsText(lineend), ST_AsText(result), ST_AsText(other);
         END IF;
@@ -108,6 +126,10 @@ DECLARE
     intersections_on_new float8[];
     intersections_on_current float8[];
 BEGIN
+    -- Bulk insertions split paths all at once (see ft_troncons_import())
+    IF ft_setting_enabled('geotrek.skip_path_triggers') THEN
+        RETURN NULL;
+    END IF;
 
     -- Copy original geometry
     newgeom := NEW.geom;
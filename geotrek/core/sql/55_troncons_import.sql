@@ -0,0 +1,161 @@
+-------------------------------------------------------------------------------
+-- Split a line at fractions, skipping segments shorter than 1 (as in split trigger)
+-------------------------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION geotrek.ft_split_line(line geometry, fractions float8[]) RETURNS geometry[] AS $$
+DECLARE
+    a float8;
+    b float8;
+    segment geometry;
+    segments geometry[];
+BEGIN
+    -- Sort fractions and remove duplicates, with extremities
+    SELECT array_agg(DISTINCT f ORDER BY f) INTO fractions
+        FROM unnest(fractions || ARRAY[0::float8, 1::float8]) AS f;
+
+    segments := ARRAY[]::geometry[];
+    FOR i IN 1..(array_length(fractions, 1) - 1)
+    LOOP
+        a := fractions[i];
+        b := fractions[i+1];
+
+        segment := ST_Line_Substring(line, a, b);
+
+        IF coalesce(ST_Length(segment), 0) < 1 THEN
+             fractions[i+1] := a;
+             CONTINUE;
+        END IF;
+        segments := array_append(segments, segment);
+    END LOOP;
+    RETURN segments;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+
+-------------------------------------------------------------------------------
+-- Snap a staged path extremity on existing paths, or on paths staged before
+-------------------------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION geotrek.ft_troncons_import_snap(point geometry, rid integer, distance float8) RETURNS geometry AS $$
+DECLARE
+    other geometry;
+BEGIN
+    SELECT geom INTO other
+        FROM (SELECT geom FROM l_t_troncon
+               WHERE geom && ST_Expand(point, distance)
+              UNION ALL
+              SELECT geom FROM l_t_troncon_import
+               WHERE row_id < rid
+                 AND geom && ST_Expand(point, distance)) AS candidates
+        WHERE ST_Distance(geom, point) < distance
+        ORDER BY ST_Distance(geom, point)
+        LIMIT 1;
+
+    IF other IS NULL THEN
+        RETURN point;
+    END IF;
+    RETURN ft_snap_point(point, other, distance);
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+
+-------------------------------------------------------------------------------
+-- Insert paths staged in temporary table l_t_troncon_import (see
+-- PathHelper.bulk_create()), with the result of per-row triggers:
+--
+-- * extremities are snapped and staged paths are split where they cross each
+--   other, with a few statements instead of recursive triggers ;
+-- * paths are draped and linked to land layers in the same batch ;
+-- * only the paths crossing existing ones go through split trigger, since
+--   existing topologies have to follow the split.
+--
+-- Returns the ids of inserted paths.
+-------------------------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION geotrek.ft_troncons_import() RETURNS integer[] AS $$
+DECLARE
+    DISTANCE float8;
+    new_ids integer[];
+    crossing_ids integer[];
+    tid integer;
+BEGIN
+    DISTANCE := {{PATH_SNAPPING_DISTANCE}};
+
+    PERFORM set_config('geotrek.skip_path_triggers', 'on', true);
+
+    -- Snap extremities, on paths as they were before the import
+    UPDATE l_t_troncon_import
+        SET geom = ST_SetPoint(ST_SetPoint(geom, 0, ft_troncons_import_snap(ST_StartPoint(geom), row_id, DISTANCE)),
+                               ST_NPoints(geom) - 1, ft_troncons_import_snap(ST_EndPoint(geom), row_id, DISTANCE));
+
+    -- Split staged paths where they cross each other, then drape and insert
+    -- segments in staging order
+    WITH crossings AS (
+        SELECT s.row_id, ST_Line_Locate_Point(s.geom, (ST_Dump(ST_Intersection(o.geom, s.geom))).geom) AS fraction
+        FROM l_t_troncon_import s, l_t_troncon_import o
+        WHERE o.row_id != s.row_id
+          AND o.geom && s.geom
+          AND ST_DWithin(o.geom, s.geom, 0)
+          AND GeometryType(ST_Intersection(o.geom, s.geom)) IN ('POINT', 'MULTIPOINT')
+    ),
+    splits AS (
+        SELECT s.row_id, ft_split_line(s.geom, coalesce(c.fractions, ARRAY[]::float8[])) AS segments
+        FROM l_t_troncon_import s
+        LEFT JOIN (SELECT row_id, array_agg(fraction) AS fractions
+                   FROM crossings GROUP BY row_id) AS c ON (c.row_id = s.row_id)
+    ),
+    segments AS (
+        SELECT row_id, ordinal, segments[ordinal] AS geom,
+               ft_elevation_infos(segments[ordinal], {{ALTIMETRIC_PROFILE_STEP}}) AS elevation
+        FROM (SELECT row_id, segments, generate_subscripts(segments, 1) AS ordinal FROM splits) AS sub
+    ),
+    inserted AS (
+        INSERT INTO l_t_troncon (structure, visible, valide, nom, remarques, source, enjeu, confort,
+                                 depart, arrivee, id_externe, geom, geom_3d, longueur, pente,
+                                 altitude_minimum, altitude_maximum, denivelee_positive, denivelee_negative)
+            SELECT s.structure, s.visible, s.valide, s.nom, s.remarques, s.source, s.enjeu, s.confort,
+                   s.depart, s.arrivee, s.id_externe, seg.geom, (seg.elevation).draped,
+                   ST_3DLength((seg.elevation).draped), (seg.elevation).slope,
+                   (seg.elevation).min_elevation, (seg.elevation).max_elevation,
+                   (seg.elevation).positive_gain, (seg.elevation).negative_gain
+            FROM segments seg
+            JOIN l_t_troncon_import s ON (s.row_id = seg.row_id)
+            ORDER BY seg.row_id, seg.ordinal
+            RETURNING id
+    )
+    SELECT array_agg(id ORDER BY id) INTO new_ids FROM inserted;
+
+    IF new_ids IS NULL THEN
+        PERFORM set_config('geotrek.skip_path_triggers', 'off', true);
+        RETURN ARRAY[]::integer[];
+    END IF;
+
+    -- Link to land layers (zoning application)
+    PERFORM 1 FROM pg_proc WHERE proname = 'lien_auto_troncons_couches_sig';
+    IF FOUND THEN
+        EXECUTE 'SELECT lien_auto_troncons_couches_sig($1)' USING new_ids;
+    END IF;
+
+    PERFORM set_config('geotrek.skip_path_triggers', 'off', true);
+
+    -- Paths crossing existing ones, excluding those touching only by extremities
+    SELECT array_agg(DISTINCT t.id) INTO crossing_ids
+        FROM l_t_troncon t, l_t_troncon e
+        WHERE t.id = ANY(new_ids)
+          AND NOT e.id = ANY(new_ids)
+          AND e.geom && t.geom
+          AND ST_DWithin(e.geom, t.geom, 0)
+          AND GeometryType(ST_Intersection(e.geom, t.geom)) IN ('POINT', 'MULTIPOINT')
+          AND NOT ST_CoveredBy(ST_Intersection(e.geom, t.geom),
+                               ST_Intersection(ST_Boundary(e.geom), ST_Boundary(t.geom)));
+
+    -- One by one, since split trigger may modify the next ones
+    IF crossing_ids IS NOT NULL THEN
+        FOREACH tid IN ARRAY crossing_ids LOOP
+            UPDATE l_t_troncon SET geom = geom WHERE id = tid;
+        END LOOP;
+    END IF;
+
+    RETURN new_ids;
+END;
+$$ LANGUAGE plpgsql;
@@ -9,6 +9,7 @@ DECLARE
     reverse_update boolean;
     reverse_merged boolean;
     max_snap_distance float;
+    deferred boolean;
     
 BEGIN
     reverse_update := FALSE;
@@ -73,6 +74,10 @@ BEGIN
 
     END IF;
 
+    -- Compute geometry of modified topologies only once, at the end
+    deferred := ft_setting_enabled('geotrek.defer_evenement_geometry');
+    PERFORM set_config('geotrek.defer_evenement_geometry', 'on', true);
+
     -- update events on updated path
     FOR element IN
         SELECT * FROM e_r_evenement_troncon et
@@ -162,6 +167,11 @@ BEGIN
     -- Delete merged Path
     DELETE FROM l_t_troncon WHERE id = merged;
 
+    PERFORM set_config('geotrek.defer_evenement_geometry', CASE WHEN deferred THEN 'on' ELSE 'off' END, true);
+    IF NOT deferred THEN
+        PERFORM ft_evenements_geometry_flush();
+    END IF;
+
     RETURN TRUE;
 
 END;
@@ -120,9 +120,9 @@ MapEntity.GeometryField.TopologyField = MapEntity.GeometryField.extend({
 
         // Path layer is ready, load graph !
         this._pathsLayer.fire('data:loading');
-        var url = window.SETTINGS.urls.path_graph + '?_u=' + (new Date().getTime());
-        $.getJSON(url, this._onGraphLoaded.bind(this))
-         .error(graphError.bind(this));
+        Geotrek.GraphCache.load(window.SETTINGS.urls.path_graph,
+                                this._onGraphLoaded.bind(this),
+                                graphError.bind(this));
 
         function graphError(jqXHR, textStatus, errorThrown) {
             this._pathsLayer.fire('data:loaded');
@@ -183,3 +183,72 @@ MapEntity.GeometryField.TopologyField = MapEntity.GeometryField.extend({
         return bounds;
     }
 });
+
+
+var Geotrek = Geotrek || {};
+
+/**
+ * Keep paths graph in browser storage, and only download the
+ * edges that changed since the cached version.
+ */
+Geotrek.GraphCache = (function () {
+    var KEY = 'geotrek-path-graph';
+
+    function read() {
+        try {
+            return JSON.parse(window.localStorage.getItem(KEY));
+        }
+        catch (e) {
+            return null;
+        }
+    }
+
+    function write(version, edges) {
+        try {
+            window.localStorage.setItem(KEY, JSON.stringify({version: version, edges: edges}));
+        }
+        catch (e) {
+            // Storage quota exceeded or disabled : graph will be downloaded again.
+        }
+    }
+
+    function buildNodes(edges) {
+        var nodes = {};
+        $.each(edges, function (edge_id, edge) {
+            var a = edge.nodes_id[0],
+                b = edge.nodes_id[1];
+            nodes[a] = nodes[a] || {};
+            nodes[b] = nodes[b] || {};
+            nodes[a][b] = edge.id;
+            nodes[b][a] = edge.id;
+        });
+        return nodes;
+    }
+
+    function load(url, success, error) {
+        var cached = read(),
+            nocache = '_u=' + (new Date().getTime());
+
+        if (!cached) {
+            $.getJSON(url + '?' + nocache, function (graph, textStatus, jqXHR) {
+                write(parseInt(jqXHR.getResponseHeader('X-Graph-Version'), 10), graph.edges);
+                success(graph);
+            }).error(error);
+            return;
+        }
+
+        $.getJSON(url + '?since=' + cached.version + '&' + nocache, function (delta) {
+            var edges = delta.reset ? {} : cached.edges;
+            $.each(delta.deleted, function (i, edge_id) {
+                delete edges[edge_id];
+            });
+            $.extend(edges, delta.edges);
+            write(delta.version, edges);
+            success({edges: edges, nodes: buildNodes(edges)});
+        }).error(error);
+    }
+
+    return {
+        load: load
+    };
+})();
@@ -1,18 +1,28 @@
 import json
+import mock
+from StringIO import StringIO
 
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
 from django.contrib.auth.models import User
 from django.contrib.gis.geos import LineString
+from django.core.cache import get_cache
 from django.core.urlresolvers import reverse
+from django.db import connection
 
 from geotrek.core.factories import PathFactory
-from geotrek.core.graph import graph_edges_nodes_of_qs
+from geotrek.core.graph import graph_edges_nodes_of_qs, iter_path_edges, fetch_path_changes, PathGraph
 from geotrek.core.models import Path
 
 
-class SimpleGraph(TestCase):
-
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    'fat': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'graph-tests'},
+})
+class SimpleGraph(TransactionTestCase):
+    """ Paths changes are read once committed """
     def setUp(self):
+        get_cache('fat').clear()
         user = User.objects.create_user('homer', 'h@s.com', 'dooh')
         success = self.client.login(username=user.username, password='dooh')
         self.assertTrue(success)
@@ -80,3 +90,182 @@ class SimpleGraph(TestCase):
         expires = response['Expires']
         self.assertNotEqual(expires, None)
         self.assertEqual(expires, last_modified)
+
+    def test_json_graph_version_header(self):
+        PathFactory(geom=LineString((0, 0), (1, 1)))
+        response = self.client.get(self.url)
+        version = int(response['X-Graph-Version'])
+        response = self.client.get(self.url)
+        self.assertEqual(int(response['X-Graph-Version']), version)
+
+    def test_json_graph_delta(self):
+        path = PathFactory(geom=LineString((0, 0), (1, 1)))
+        response = self.client.get(self.url)
+        version = int(response['X-Graph-Version'])
+
+        new_path = PathFactory(geom=LineString((1, 1), (2, 0)))
+        path.delete()
+        response = self.client.get(self.url, {'since': version})
+        self.assertEqual(response.status_code, 200)
+        delta = json.loads(response.content)
+        self.assertFalse(delta['reset'])
+        self.assertTrue(delta['version'] > version)
+        self.assertEqual(delta['deleted'], [path.pk])
+        self.assertEqual(delta['edges'].keys(), [str(new_path.pk)])
+        self.assertEqual(delta['edges'][str(new_path.pk)]['nodes_id'], [2, 3])
+
+    def test_json_graph_delta_up_to_date(self):
+        PathFactory(geom=LineString((0, 0), (1, 1)))
+        response = self.client.get(self.url)
+        version = int(response['X-Graph-Version'])
+        # Graph is not loaded from cache
+        with mock.patch.object(PathGraph, 'refresh') as refresh:
+            response = self.client.get(self.url, {'since': version})
+            self.assertFalse(refresh.called)
+        self.assertEqual(json.loads(response.content),
+                         {'version': version, 'reset': False, 'edges': {}, 'deleted': []})
+        self.assertEqual(int(response['X-Graph-Version']), version)
+        PathFactory(geom=LineString((1, 1), (2, 2)))
+        delta = json.loads(self.client.get(self.url, {'since': version}).content)
+        self.assertEqual(len(delta['edges']), 1)
+
+    def test_json_graph_versions_are_published_once(self):
+        PathFactory(geom=LineString((0, 0), (1, 1)))
+        version = int(self.client.get(self.url)['X-Graph-Version'])
+        PathFactory(geom=LineString((1, 1), (2, 2)))
+        self.assertEqual(int(self.client.get(self.url)['X-Graph-Version']), version + 1)
+        # Graph refreshed by another process is not patched again
+        with mock.patch.object(PathGraph, 'apply_changes') as apply_changes:
+            self.assertEqual(int(self.client.get(self.url)['X-Graph-Version']), version + 1)
+            self.assertFalse(apply_changes.called)
+
+    def test_json_graph_encoded_once_per_version(self):
+        PathFactory(geom=LineString((0, 0), (1, 1)))
+        content = self.client.get(self.url).content
+        with mock.patch.object(PathGraph, 'iter_dump') as iter_dump:
+            response = self.client.get(self.url)
+            self.assertFalse(iter_dump.called)
+        self.assertEqual(response.content, content)
+        PathFactory(geom=LineString((1, 1), (2, 2)))
+        graph = json.loads(self.client.get(self.url).content)
+        self.assertEqual(len(graph['edges']), 2)
+
+    def test_json_graph_delta_unknown_version(self):
+        path = PathFactory(geom=LineString((0, 0), (1, 1)))
+        response = self.client.get(self.url, {'since': 0})
+        delta = json.loads(response.content)
+        self.assertTrue(delta['reset'])
+        self.assertEqual(delta['edges'].keys(), [str(path.pk)])
+
+    def test_json_graph_delta_invalid_version(self):
+        response = self.client.get(self.url, {'since': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PathGraphTest(TestCase):
+    def setUp(self):
+        self.graph = PathGraph()
+        self.graph.apply_changes([(1, 1.0, (0, 0), (1, 1)),
+                                  (2, 1.0, (1, 1), (2, 2))], [], 10)
+        self.version = self.graph.version
+
+    def test_update_path(self):
+        self.graph.apply_changes([(2, 1.0, (1, 1), (3, 3))], [], None)
+        self.assertEqual(self.graph.to_dict()['nodes'], {1: {2: 1}, 2: {1: 1, 4: 2}, 4: {2: 2}})
+
+    def test_delete_path(self):
+        self.graph.apply_changes([], [1], None)
+        self.assertEqual(self.graph.to_dict()['nodes'], {2: {3: 2}, 3: {2: 2}})
+        self.assertEqual(self.graph.edges.keys(), [2])
+
+    def test_parallel_edge_restored(self):
+        self.graph.apply_changes([(3, 1.0, (0, 0), (1, 1))], [], None)
+        self.graph.apply_changes([], [3], None)
+        self.assertEqual(self.graph.nodes[1], {2: 1})
+
+    def test_delta(self):
+        self.graph.apply_changes([(3, 1.0, (2, 2), (3, 3))], [1], 11)
+        delta = self.graph.delta(self.version)
+        self.assertEqual(delta['version'], self.version + 1)
+        self.assertEqual(delta['deleted'], [1])
+        self.assertEqual(delta['edges'].keys(), [3])
+        self.assertEqual(self.graph.delta(self.version + 1)['edges'], {})
+
+    def test_horizon(self):
+        self.graph.history_size = 1
+        self.graph.apply_changes([(3, 1.0, (2, 2), (3, 3))], [], 11)
+        self.graph.apply_changes([(4, 1.0, (3, 3), (4, 4))], [], 12)
+        # Changes before the oldest change set kept can be forgotten
+        self.assertEqual(self.graph.horizon, 10)
+        self.assertEqual(self.graph.txid, 12)
+
+    def test_dump(self):
+        output = StringIO()
+        self.graph.dump(output)
+        self.assertEqual(json.loads(output.getvalue()),
+                         json.loads(json.dumps(self.graph.to_dict())))
+
+    def test_dump_by_chunks(self):
+        self.graph.apply_changes([(3, 1.0, (2, 2), (3, 3))], [], None)
+        pieces = list(self.graph.iter_dump(chunk_size=2))
+        self.assertEqual(json.loads(''.join(pieces)),
+                         json.loads(json.dumps(self.graph.to_dict())))
+
+
+class PathEdgesStreamTest(TestCase):
+    def test_edges_extremities(self):
+        path = PathFactory(geom=LineString((0, 0), (0, 5), (1, 1)))
+        PathFactory(geom=LineString((2, 2), (3, 3)), visible=False)
+        edges = list(iter_path_edges())
+        self.assertEqual(edges, [(path.pk, path.length, (0, 0), (1, 1))])
+
+    def test_edges_of_paths(self):
+        PathFactory(geom=LineString((0, 0), (1, 1)))
+        other = PathFactory(geom=LineString((2, 2), (3, 3)))
+        self.assertEqual([e[0] for e in iter_path_edges(pks=[other.pk])], [other.pk])
+
+    def test_running_transactions_are_left(self):
+        cursor = connection.cursor()
+        cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot()), txid_current()")
+        since, current = cursor.fetchone()
+        path = PathFactory(geom=LineString((0, 0), (1, 1)))
+        txid, reset, changed = fetch_path_changes(since)
+        # Test transaction is still running: its changes are read after it
+        self.assertNotIn(path.pk, changed)
+        self.assertTrue(txid <= current)
+
+
+class PathGraphRefreshTest(TransactionTestCase):
+    def setUp(self):
+        self.path = PathFactory(geom=LineString((0, 0), (1, 1)))
+        self.graph = PathGraph()
+        self.graph.refresh()
+        self.version = self.graph.version
+
+    def test_unchanged(self):
+        self.assertFalse(self.graph.refresh())
+        self.assertEqual(self.graph.version, self.version)
+
+    def test_changed_paths(self):
+        other = PathFactory(geom=LineString((1, 1), (2, 2)))
+        self.path.geom = LineString((0, 0), (0, 1), (1, 1))
+        self.path.save()
+        self.assertTrue(self.graph.refresh())
+        self.assertEqual(self.graph.version, self.version + 1)
+        self.assertEqual(self.graph.history[-1][1], set([self.path.pk, other.pk]))
+        self.assertEqual(sorted(self.graph.edges.keys()), sorted([self.path.pk, other.pk]))
+
+    def test_deleted_and_hidden_paths(self):
+        other = PathFactory(geom=LineString((1, 1), (2, 2)))
+        self.graph.refresh()
+        self.path.delete()
+        other.visible = False
+        other.save()
+        self.graph.refresh()
+        self.assertEqual(self.graph.edges, {})
+
+    def test_truncated_paths(self):
+        cursor = connection.cursor()
+        cursor.execute("TRUNCATE l_t_troncon CASCADE")
+        self.assertTrue(self.graph.refresh())
+        self.assertEqual(self.graph.edges, {})
@@ -9,6 +9,7 @@ from geotrek.common.utils import dbnow
 from geotrek.authent.factories import UserFactory
 from geotrek.authent.models import Structure
 from geotrek.core.factories import (PathFactory, StakeFactory)
+from geotrek.core.helpers import PathHelper
 from geotrek.core.models import Path
 
 
@@ -139,6 +140,17 @@ class PathGeometryTest(TestCase):
         p = PathFactory.create(geom=LineString((2.5, 0), (3, 1), (3.5, 0)))
         self.assertFalse(p.is_overlap())
 
+    def test_overlap_geometry_batch(self):
+        p = PathFactory.create(geom=LineString((0, 0), (60, 0)))
+        geoms = [LineString((40, 0), (50, 0)),     # overlaps existing path
+                 LineString((6, 1), (6, 3)),       # crosses nothing
+                 LineString((10, 10), (20, 10)),   # overlaps next one
+                 LineString((15, 10), (30, 10)),
+                 LineString((0, 0), (30, 0))]      # overlaps itself only
+        self.assertEqual(PathHelper.disjoint_batch(geoms, [None, None, None, None, p.pk]),
+                         [False, True, False, False, True])
+        self.assertEqual(PathHelper.disjoint_batch([]), [])
+
     def test_snapping(self):
         # Sinosoid line
         coords = [(x, math.sin(x)) for x in range(10)]
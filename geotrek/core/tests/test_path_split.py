@@ -6,6 +6,7 @@ from django.conf import settings
 from geotrek.common.utils import almostequal
 
 from geotrek.core.factories import PathFactory, TopologyFactory, NetworkFactory, UsageFactory
+from geotrek.core.helpers import PathHelper
 from geotrek.core.models import Path, Topology
 
 
@@ -352,6 +353,59 @@ class SplitPathTest(TestCase):
         self.assertEqual(len(Path.objects.filter(name="EF")), 3)
 
 
+class BulkCreatePathTest(TestCase):
+    def test_imported_paths_are_split(self):
+        """
+               C
+               +
+               |
+        A +----+----+ B
+               |
+               +      AB and CD are imported together.
+               D
+        """
+        pks = PathHelper.bulk_create([Path(name="AB", geom=LineString((0, 0), (4, 0))),
+                                      Path(name="CD", geom=LineString((2, -2), (2, 2)))])
+        self.assertEqual(len(pks), 4)
+        paths = Path.objects.filter(pk__in=pks).order_by('pk')
+        self.assertEqual([(p.name, p.geom) for p in paths],
+                         [("AB", LineString((0, 0), (2, 0))),
+                          ("AB", LineString((2, 0), (4, 0))),
+                          ("CD", LineString((2, -2), (2, 0))),
+                          ("CD", LineString((2, 0), (2, 2)))])
+        self.assertEqual([p.length for p in paths], [2, 2, 2, 2])
+
+    def test_extremities_are_snapped(self):
+        PathFactory.create(geom=LineString((0, 0), (4, 0)))
+        pks = PathHelper.bulk_create([Path(geom=LineString((2, 5), (2, 0.5))),
+                                      Path(geom=LineString((10, 0), (4.5, 0)))])
+        self.assertEqual(Path.objects.get(pk=pks[0]).geom, LineString((2, 5), (2, 0)))
+        self.assertEqual(Path.objects.get(pk=pks[1]).geom, LineString((10, 0), (4, 0)))
+
+    def test_same_result_as_triggers(self):
+        ab = PathFactory.create(name="AB", geom=LineString((0, 0), (4, 0)))
+        topology = TopologyFactory.create(no_path=True)
+        topology.add_path(ab, start=0.25, end=0.75)
+        pks = PathHelper.bulk_create([Path(name="CD", geom=LineString((2, -2), (2, 2))),
+                                      Path(name="EF", geom=LineString((3, 5), (3, 1)))])
+        self.assertEqual(Path.objects.count(), 5)
+
+        ab.reload()
+        ab_2 = Path.objects.filter(name="AB").exclude(pk=ab.pk)[0]
+        self.assertEqual(ab.geom, LineString((0, 0), (2, 0)))
+        self.assertEqual(ab_2.geom, LineString((2, 0), (4, 0)))
+        self.assertEqual(Path.objects.filter(name="CD").count(), 2)
+        self.assertEqual(Path.objects.get(pk=pks[-1]).geom, LineString((3, 5), (3, 1)))
+
+        # Topology follows split
+        topology.reload()
+        self.assertEqual(len(topology.paths.all()), 2)
+        self.assertEqual(topology.geom, LineString((1, 0), (2, 0), (3, 0)))
+
+    def test_nothing_to_import(self):
+        self.assertEqual(PathHelper.bulk_create([]), [])
+
+
 class SplitPathLineTopologyTest(TestCase):
 
     def test_split_tee_1(self):
@@ -0,0 +1,124 @@
+import json
+import threading
+
+from django.test import TestCase, TransactionTestCase
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import LineString
+from django.core.urlresolvers import reverse
+
+from geotrek.core.factories import PathFactory
+from geotrek.core.graph import PathGraph
+from geotrek.core.models import Topology
+from geotrek.core.routing import LRUCache, PathRouter
+
+
+class LRUCacheTest(TestCase):
+    def test_oldest_entries_are_dropped(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_shared_by_threads(self):
+        cache = LRUCache(maxsize=10)
+        errors = []
+
+        def use():
+            try:
+                for i in range(2000):
+                    cache.set(i % 20, i)
+                    cache.get((i + 7) % 20)
+                    if i % 500 == 0:
+                        cache.clear()
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=use) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(cache.hits + cache.misses, 8000)
+        self.assertTrue(len(cache.entries) <= 10)
+
+
+class PathRouterTest(TestCase):
+    """
+        1     2     3
+      +-----+-----+-----+
+      A     B     C     D
+             \\        /
+              +-------+
+                  4
+    """
+    def setUp(self):
+        graph = PathGraph()
+        graph.apply_changes([(1, 10.0, (0, 0), (10, 0)),
+                             (2, 10.0, (10, 0), (20, 0)),
+                             (3, 10.0, (20, 0), (30, 0)),
+                             (4, 40.0, (10, 0), (30, 0)),
+                             (5, 10.0, (100, 100), (110, 100))], [], None)
+        self.router = PathRouter(graph)
+        self.router.build()
+
+    def route(self, *args):
+        result = self.router.route(*args)
+        return json.loads(result) if result else result
+
+    def test_same_path(self):
+        self.assertEqual(self.route(1, 0.2, 1, 0.8),
+                         [{'offset': 0, 'paths': [1], 'positions': {'0': [0.2, 0.8]}}])
+
+    def test_shortest_way(self):
+        self.assertEqual(self.route(1, 0.5, 3, 0.5),
+                         [{'offset': 0, 'paths': [1, 2, 3],
+                           'positions': {'0': [0.5, 1.0], '1': [0.0, 1.0], '2': [0.0, 0.5]}}])
+
+    def test_reversed_way(self):
+        self.assertEqual(self.route(3, 0.5, 1, 0.5),
+                         [{'offset': 0, 'paths': [3, 2, 1],
+                           'positions': {'0': [0.5, 0.0], '1': [1.0, 0.0], '2': [1.0, 0.5]}}])
+
+    def test_from_extremity(self):
+        self.assertEqual(self.route(1, 1.0, 2, 1.0),
+                         [{'offset': 0, 'paths': [2], 'positions': {'0': [0.0, 1.0]}}])
+
+    def test_not_connected(self):
+        self.assertEqual(self.route(1, 0.5, 5, 0.5), None)
+
+    def test_unknown_path(self):
+        self.assertEqual(self.route(1, 0.5, 42, 0.5), None)
+
+    def test_results_are_cached(self):
+        self.route(1, 0.5, 3, 0.5)
+        self.route(1, 0.5, 3, 0.5)
+        self.assertEqual(self.router.cache.hits, 1)
+
+
+class RouteViewTest(TransactionTestCase):
+    """ Router reads paths changes once committed """
+    def setUp(self):
+        user = User.objects.create_user('homer', 'h@s.com', 'dooh')
+        success = self.client.login(username=user.username, password='dooh')
+        self.assertTrue(success)
+        self.url = reverse('core:path_json_route')
+
+    def test_invalid_parameters(self):
+        response = self.client.get(self.url, {'start_path': 1, 'start_position': 2,
+                                              'end_path': 1, 'end_position': 0})
+        self.assertEqual(response.status_code, 400)
+
+    def test_route_can_be_deserialized(self):
+        p1 = PathFactory(geom=LineString((0, 0), (10, 0)))
+        p2 = PathFactory(geom=LineString((10, 0), (20, 0)))
+        response = self.client.get(self.url, {'start_path': p1.pk, 'start_position': 0.5,
+                                              'end_path': p2.pk, 'end_position': 0.5})
+        self.assertEqual(response.status_code, 200)
+        topology = Topology.deserialize(response.content)
+        self.assertEqual(topology.length, 10)
+        self.assertEqual([a.path for a in topology.aggregations.all()], [p1, p2])
@@ -10,7 +10,7 @@ from geotrek.common.utils import dbnow, almostequal
 from geotrek.core.factories import (PathFactory, PathAggregationFactory,
                                     TopologyFactory)
 from geotrek.core.models import Path, Topology, PathAggregation
-from geotrek.core.helpers import TopologyHelper
+from geotrek.core.helpers import TopologyHelper, defer_evenement_geometry
 
 
 def dictfetchall(cursor):
@@ -206,6 +206,47 @@ class TopologyMutateTest(TestCase):
         self.assertEqual(len(topology2.paths.all()), 3)
 
 
+class TopologyDeferredGeometryTest(TestCase):
+
+    def dirty(self, topology):
+        cursor = connections[DEFAULT_DB_ALIAS].cursor()
+        cursor.execute("SELECT COUNT(*) FROM e_t_evenement_dirty WHERE evenement = %s", [topology.pk])
+        return cursor.fetchone()[0]
+
+    def test_geometry_computed_once_when_leaving_block(self):
+        p1 = PathFactory.create(geom=LineString((0, 0), (10, 0)))
+        p2 = PathFactory.create(geom=LineString((10, 0), (10, 10)))
+        topology = TopologyFactory.create(no_path=True)
+        with defer_evenement_geometry():
+            topology.add_path(p1, start=0.5, end=1.0, order=0, reload=False)
+            topology.add_path(p2, start=0.0, end=0.5, order=1, reload=False)
+            self.assertEqual(self.dirty(topology), 2)
+        self.assertEqual(self.dirty(topology), 0)
+        topology.reload()
+        self.assertEqual(topology.geom.coords, ((5, 0), (10, 0), (10, 5)))
+
+    def test_nested_blocks_compute_geometry_at_the_end(self):
+        path = PathFactory.create(geom=LineString((0, 0), (10, 0)))
+        topology = TopologyFactory.create(no_path=True)
+        with defer_evenement_geometry():
+            with defer_evenement_geometry():
+                topology.add_path(path, start=0.0, end=0.5, reload=False)
+            self.assertEqual(self.dirty(topology), 1)
+        topology.reload()
+        self.assertEqual(topology.geom.coords, ((0, 0), (5, 0)))
+
+    def test_merge_path_computes_geometry(self):
+        p1 = PathFactory.create(geom=LineString((0, 0), (10, 0)))
+        p2 = PathFactory.create(geom=LineString((10, 0), (20, 0)))
+        topology = TopologyFactory.create(no_path=True)
+        topology.add_path(p1, start=0.5, end=1.0, order=0, reload=False)
+        topology.add_path(p2, start=0.0, end=0.5, order=1)
+        self.assertTrue(p1.merge_path(p2))
+        self.assertEqual(self.dirty(topology), 0)
+        topology.reload()
+        self.assertEqual(topology.geom.coords, ((5, 0), (10, 0), (15, 0)))
+
+
 class TopologyPointTest(TestCase):
 
     def test_point_geom_3d(self):
@@ -850,6 +891,19 @@ class TopologyDerialization(TestCase):
         self.assertEqual(topology.aggregations.all()[2].start_position, 0.0)
         self.assertEqual(topology.aggregations.all()[2].end_position, 0.7)
 
+    def test_deserialize_lines_geometry(self):
+        p1 = PathFactory.create(geom=LineString((0, 0), (2, 0)))
+        p2 = PathFactory.create(geom=LineString((2, 0), (2, 2)))
+        topology = Topology.deserialize('{"paths": [%s, %s], "positions": {"0": [0.5, 1.0], "1": [0.0, 0.5]}}' % (p1.pk, p2.pk))
+        self.assertFalse(topology.deleted)
+        self.assertEqual(topology.geom.coords, ((1, 0), (2, 0), (2, 1)))
+        self.assertEqual(topology.length, 2)
+
+    def test_deserialize_unknown_path(self):
+        path = PathFactory.create()
+        self.assertRaises(ValueError, Topology.deserialize,
+                          '{"paths": [%s, %s], "offset": 1}' % (path.pk, path.pk + 1))
+
     def test_deserialize_point(self):
         PathFactory.create()
         # Take a point
@@ -937,3 +991,22 @@ class TopologyOverlappingTest(TestCase):
         from geotrek.trekking.models import Trek
         overlaps = Topology.overlapping(Trek.objects.all())
         self.assertEqual(list(overlaps), [])
+
+    def test_overlapping_of_several_topologies(self):
+        overlaps = Topology.overlapping(Topology.objects.filter(pk__in=[self.topo2.pk, self.point1.pk]))
+        self.assertEqual(list(overlaps), [self.topo2, self.point1, self.point3, self.point2, self.topo1])
+
+    def test_overlapping_batch(self):
+        overlaps = Topology.overlapping_batch([self.topo2, self.point2])
+        self.assertEqual(overlaps, {
+            self.topo2.pk: [self.topo2, self.point1, self.point3, self.point2, self.topo1],
+            self.point2.pk: [self.topo2, self.point2, self.topo1],
+        })
+
+    def test_overlapping_batch_with_queryset(self):
+        overlaps = Topology.overlapping_batch(Topology.objects.filter(pk=self.topo1.pk),
+                                              Topology.objects.exclude(pk=self.topo1.pk))
+        self.assertEqual(overlaps, {self.topo1.pk: [self.point2, self.point3, self.point1, self.topo2]})
+
+    def test_overlapping_batch_does_not_fail_if_no_records(self):
+        self.assertEqual(Topology.overlapping_batch([]), {})
@@ -3,12 +3,15 @@ import json
 import re
 
 import mock
+from django.db import connection
+from django.test.utils import override_settings
 from django.utils.translation import ugettext_lazy as _
 from django.core.urlresolvers import reverse
 
 from geotrek.authent.tests import AuthentFixturesTest
 from geotrek.common.tests import CommonTest
 from geotrek.common.utils import LTE
+from geotrek.common.utils.mvt import ORIGIN_SHIFT
 
 from geotrek.authent.factories import PathManagerFactory, StructureFactory
 from geotrek.authent.models import default_structure
@@ -105,6 +108,54 @@ class PathViewsTest(CommonTest):
         self.assertEqual(response['Content-Type'], 'application/json')
 
 
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    'fat': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'mvt-tests'},
+})
+class PathVectorTileTest(AuthentFixturesTest):
+    def setUp(self):
+        self.path = PathFactory.create(name=u"Chemin des tuiles")
+        user = PathManagerFactory(password='booh')
+        self.assertTrue(self.client.login(username=user.username, password='booh'))
+
+    def tile_url(self, z, offset=0):
+        cursor = connection.cursor()
+        cursor.execute("SELECT ST_X(p), ST_Y(p) FROM (SELECT ST_Transform(ST_Line_Interpolate_Point(geom, 0.5), 3857) AS p "
+                       "FROM l_t_troncon WHERE id = %s) AS sub", [self.path.pk])
+        x, y = cursor.fetchone()
+        size = 2 * ORIGIN_SHIFT / 2 ** z
+        return '/api/tiles/paths/%s/%s/%s.pbf' % (z, int((x + ORIGIN_SHIFT) / size) + offset,
+                                                  int((ORIGIN_SHIFT - y) / size))
+
+    def test_tile_contains_paths_in_view(self):
+        response = self.client.get(self.tile_url(16))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-protobuf')
+        self.assertIn('paths', response.content)
+        self.assertIn('Chemin des tuiles', response.content)
+
+    def test_tile_excludes_paths_out_of_view(self):
+        response = self.client.get(self.tile_url(16, offset=2))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Chemin des tuiles', response.content)
+
+    def test_tile_is_refreshed_when_paths_change(self):
+        self.client.get(self.tile_url(16))
+        self.path.name = u"Chemin renommé"
+        self.path.save()
+        response = self.client.get(self.tile_url(16))
+        self.assertIn(u"Chemin renommé".encode('utf-8'), response.content)
+
+    def test_tile_out_of_grid(self):
+        response = self.client.get('/api/tiles/paths/1/2/0.pbf')
+        self.assertEqual(response.status_code, 404)
+
+    def test_tile_requires_login(self):
+        self.client.logout()
+        response = self.client.get(self.tile_url(16))
+        self.assertEqual(response.status_code, 302)
+
+
 class DenormalizedTrailTest(AuthentFixturesTest):
     def setUp(self):
         self.trail1 = TrailFactory(no_path=True)
@@ -5,14 +5,18 @@ from mapentity import registry
 
 from geotrek.altimetry.urls import AltimetryEntityOptions
 from geotrek.core.models import Path, Trail
-from geotrek.core.views import get_graph_json, merge_path, ParametersView
+from geotrek.core.views import (get_graph_json, get_route_json, merge_path, ParametersView,
+                                PathVectorTile, TrailVectorTile)
 
 
 urlpatterns = patterns(
     '',
     url(r'^api/graph.json$', get_graph_json, name="path_json_graph"),
+    url(r'^api/route.json$', get_route_json, name="path_json_route"),
     url(r'^api/(?P<lang>\w\w)/parameters.json$', ParametersView.as_view(), name='parameters_json'),
     url(r'^mergepath/$', merge_path, name="merge_path"),
+    url(r'^api/tiles/paths/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.pbf$', PathVectorTile.as_view(), name="path_tiles"),
+    url(r'^api/tiles/trails/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.pbf$', TrailVectorTile.as_view(), name="trail_tiles"),
 )
 
 
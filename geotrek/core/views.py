@@ -21,13 +21,15 @@ from mapentity.views import (MapEntityLayer, MapEntityList, MapEntityJsonList,
 
 from geotrek.authent.decorators import same_structure_required
 from geotrek.common.utils import classproperty
+from geotrek.common.views import VectorTileView
 from geotrek.core.models import AltimetryMixin
 
 from .models import Path, Trail, Topology
 from .forms import PathForm, TrailForm
 from .filters import PathFilterSet, TrailFilterSet
 from . import graph as graph_lib
-from django.http.response import HttpResponse
+from . import routing
+from django.http.response import HttpResponse, HttpResponseBadRequest, HttpResponseNotFound
 from django.contrib import messages
 
 
@@ -73,6 +75,12 @@ class PathLayer(MapEntityLayer):
     properties = ['name']
 
 
+class PathVectorTile(VectorTileView):
+    model = Path
+    layer = 'paths'
+    properties = ['name']
+
+
 class PathList(MapEntityList):
     queryset = Path.objects.prefetch_related('networks').select_related('stake')
     filterform = PathFilterSet
@@ -165,29 +173,83 @@ class PathDelete(MapEntityDelete):
 @cache_last_modified(lambda x: Path.latest_updated())
 @force_cache_validation
 def get_graph_json(request):
+    """
+    Returns the paths graph. If a ``since`` version is specified, only the
+    edges changed since this version are returned, along with the ids of the
+    deleted ones.
+    """
+    since = request.GET.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return HttpResponseBadRequest(json.dumps({'error': _(u"Invalid graph version")}),
+                                          mimetype="application/json")
+
     cache = get_cache('fat')
-    key = 'path_graph_json'
+    # Up-to-date graph is answered without loading it
+    state = cache.get('path_graph_version')
+    up_to_date = False
+    if state is not None and since in (None, state[1]):
+        txid, reset, changed = graph_lib.fetch_path_changes(state[0])
+        up_to_date = not (reset or changed)
+    if up_to_date and since is not None:
+        response = HttpJSONResponse(json.dumps({'version': since, 'reset': False, 'edges': {}, 'deleted': []}))
+        response['X-Graph-Version'] = since
+        return response
+    # Whole graph is encoded once per version, and kept next to the graph
+    dumped = cache.get('path_graph_json')
+    if up_to_date and dumped is not None and dumped[0] == state[1]:
+        response = HttpJSONResponse(dumped[1])
+        response['X-Graph-Version'] = state[1]
+        return response
+
+    graph = graph_lib.cached_graph(cache)
+
+    if since is not None:
+        response = HttpJSONResponse(json.dumps(graph.delta(since)))
+    else:
+        if dumped is None or dumped[0] != graph.version:
+            dumped = (graph.version, ''.join(graph.iter_dump()))
+            cache.set('path_graph_json', dumped)
+        response = HttpJSONResponse(dumped[1])
+    response['X-Graph-Version'] = graph.version
+    return response
 
-    result = cache.get(key)
-    latest = Path.latest_updated()
 
-    if result and latest:
-        cache_latest, json_graph = result
-        # Not empty and still valid
-        if cache_latest and cache_latest >= latest:
-            return HttpJSONResponse(json_graph)
+@login_required
+def get_route_json(request):
+    """
+    Returns the shortest way between two positions snapped on paths, as a
+    serialized topology.
+    """
+    try:
+        start_path = int(request.GET['start_path'])
+        start_position = float(request.GET['start_position'])
+        end_path = int(request.GET['end_path'])
+        end_position = float(request.GET['end_position'])
+        if not (0.0 <= start_position <= 1.0 and 0.0 <= end_position <= 1.0):
+            raise ValueError
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest(json.dumps({'error': _(u"Invalid route positions")}),
+                                      mimetype="application/json")
+
+    router = routing.get_router()
+    serialized = router.route(start_path, start_position, end_path, end_position)
+    if serialized is None:
+        return HttpResponseNotFound(json.dumps({'error': _(u"No route found")}),
+                                    mimetype="application/json")
+    return HttpJSONResponse(serialized)
 
-    # cache does not exist or is not up to date
-    # rebuild the graph and cache the json
-    graph = graph_lib.graph_edges_nodes_of_qs(Path.objects.all())
-    json_graph = json.dumps(graph)
 
-    cache.set(key, (latest, json_graph))
-    return HttpJSONResponse(json_graph)
+class TrailLayer(MapEntityLayer):
+    queryset = Trail.objects.existing()
+    properties = ['name']
 
 
-class TrailLayer(MapEntityLayer):
+class TrailVectorTile(VectorTileView):
     queryset = Trail.objects.existing()
+    layer = 'trails'
     properties = ['name']
 
 
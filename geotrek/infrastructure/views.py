@@ -2,8 +2,10 @@ from mapentity.views import (MapEntityLayer, MapEntityList, MapEntityJsonList, M
                              MapEntityDetail, MapEntityDocument, MapEntityCreate, MapEntityUpdate, MapEntityDelete)
 
 from geotrek.authent.decorators import same_structure_required
+from geotrek.common.utils import prefetch_with
 from geotrek.core.models import AltimetryMixin
 from geotrek.core.views import CreateFromTopologyMixin
+from geotrek.zoning.helpers import prefetch_zoning
 
 from .filters import InfrastructureFilterSet, SignageFilterSet
 from .forms import InfrastructureForm, SignageForm
@@ -16,7 +18,7 @@ class InfrastructureLayer(MapEntityLayer):
 
 
 class InfrastructureList(MapEntityList):
-    queryset = Infrastructure.objects.existing()
+    queryset = prefetch_with(Infrastructure.objects.existing(), prefetch_zoning)
     filterform = InfrastructureFilterSet
     columns = ['id', 'name', 'type', 'condition', 'cities']
 
@@ -74,7 +76,7 @@ class SignageLayer(MapEntityLayer):
 
 
 class SignageList(MapEntityList):
-    queryset = Signage.objects.existing()
+    queryset = prefetch_with(Signage.objects.existing(), prefetch_zoning)
     filterform = SignageFilterSet
     columns = ['id', 'name', 'type', 'condition', 'cities']
 
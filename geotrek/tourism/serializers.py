@@ -6,7 +6,7 @@ from django.utils.translation import ugettext as _
 from geotrek.common.serializers import (ThemeSerializer, PublishableSerializerMixin,
                                         PictogramSerializerMixin, RecordSourceSerializer,
                                         PicturesSerializerMixin, TranslatedModelSerializer,
-                                        TargetPortalSerializer)
+                                        TargetPortalSerializer, GeoJSONSerializerMixin)
 from geotrek.zoning.serializers import ZoningSerializerMixin
 from geotrek.trekking import serializers as trekking_serializers
 from geotrek.tourism import models as tourism_models
@@ -69,7 +69,7 @@ class TouristicContentCategorySerializer(PictogramSerializerMixin, TranslatedMod
 
 
 class TouristicContentSerializer(PicturesSerializerMixin, PublishableSerializerMixin,
-                                 ZoningSerializerMixin, TranslatedModelSerializer):
+                                 ZoningSerializerMixin, GeoJSONSerializerMixin, TranslatedModelSerializer):
     themes = ThemeSerializer(many=True)
     category = TouristicContentCategorySerializer()
     type1 = TouristicContentTypeSerializer(many=True)
@@ -106,7 +106,7 @@ class TouristicEventTypeSerializer(PictogramSerializerMixin, TranslatedModelSeri
 
 
 class TouristicEventSerializer(PicturesSerializerMixin, PublishableSerializerMixin,
-                               ZoningSerializerMixin, TranslatedModelSerializer):
+                               ZoningSerializerMixin, GeoJSONSerializerMixin, TranslatedModelSerializer):
     themes = ThemeSerializer(many=True)
     type = TouristicEventTypeSerializer()
     source = RecordSourceSerializer()
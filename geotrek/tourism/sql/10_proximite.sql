@@ -0,0 +1,29 @@
+-------------------------------------------------------------------------------
+-- Keep treks close objects (see rando.o_r_itineraire_proximite) up-to-date
+-------------------------------------------------------------------------------
+
+-- Touristic contents and events: kind given as trigger argument
+CREATE OR REPLACE FUNCTION tourisme.proximite_iud() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM o_r_itineraire_proximite WHERE kind = TG_ARGV[0] AND objet = OLD.id;
+    ELSE
+        PERFORM ft_itineraire_proximite_refresh(NULL, TG_ARGV[0], ARRAY[NEW.id]);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS t_t_contenu_touristique_proximite_iud_tgr ON t_t_contenu_touristique;
+CREATE TRIGGER t_t_contenu_touristique_proximite_iud_tgr
+AFTER INSERT OR UPDATE OF geom OR DELETE ON t_t_contenu_touristique
+FOR EACH ROW EXECUTE PROCEDURE proximite_iud('TOURISTICCONTENT');
+
+DROP TRIGGER IF EXISTS t_t_evenement_touristique_proximite_iud_tgr ON t_t_evenement_touristique;
+CREATE TRIGGER t_t_evenement_touristique_proximite_iud_tgr
+AFTER INSERT OR UPDATE OF geom OR DELETE ON t_t_evenement_touristique
+FOR EACH ROW EXECUTE PROCEDURE proximite_iud('TOURISTICEVENT');
+
+
+-- Initial computation (or after upgrade)
+SELECT rando.ft_itineraire_proximite_refresh(NULL, NULL, NULL);
@@ -22,7 +22,7 @@ from geotrek.zoning import factories as zoning_factories
 from geotrek.common import factories as common_factories
 from geotrek.common.tests import TranslationResetMixin
 from geotrek.common.utils.testdata import get_dummy_uploaded_image, get_dummy_uploaded_document
-from geotrek.tourism.models import DATA_SOURCE_TYPES
+from geotrek.tourism.models import DATA_SOURCE_TYPES, TouristicEvent
 from geotrek.tourism.factories import (DataSourceFactory,
                                        InformationDeskFactory,
                                        TouristicContentFactory,
@@ -604,7 +604,7 @@ class TouristicEventViewSetTest(TestCase):
     def test_touristic_events_without_enddate_filter(self):
         TouristicEventFactory.create_batch(10, published=True)
         response = self.client.get('/api/en/touristicevents.geojson')
-        geojson = json.loads(response.content)
+        geojson = json.loads(''.join(response.streaming_content))
         self.assertEqual(len(geojson['features']), 10)
 
     def test_touristic_events_with_enddate_filter(self):
@@ -620,10 +620,19 @@ class TouristicEventViewSetTest(TestCase):
         TouristicEventFactory.create_batch(5, end_date=datetime.strptime('2020-05-10', '%Y-%m-%d'), published=True)
         TouristicEventFactory.create_batch(7, end_date=datetime.strptime('2010-05-10', '%Y-%m-%d'), published=True)
         response = self.client.get('/api/en/touristicevents.geojson', data={'ends_after': '2020-01-01'})
-        geojson = json.loads(response.content)
+        geojson = json.loads(''.join(response.streaming_content))
 
         self.assertEqual(len(geojson['features']), 10)
 
+    def test_touristic_events_ordered_by_begin_date(self):
+        for day in (3, 1, 5, 2, 4):
+            TouristicEventFactory.create(begin_date=datetime(2020, 5, day), published=True)
+        with mock.patch('geotrek.tourism.views.TouristicEventViewSet.chunk_size', 2):
+            response = self.client.get('/api/en/touristicevents.geojson')
+            geojson = json.loads(''.join(response.streaming_content))
+        days = [TouristicEvent.objects.get(pk=feature['id']).begin_date.day for feature in geojson['features']]
+        self.assertEqual(days, [5, 4, 3, 2, 1])
+
 
 class TouristicContentCategoryViewSetTest(TestCase):
     def test_get_categories(self):
@@ -26,7 +26,7 @@ from rest_framework_gis.serializers import GeoFeatureModelSerializer
 
 from geotrek.authent.decorators import same_structure_required
 from geotrek.common.models import RecordSource, TargetPortal
-from geotrek.common.views import DocumentPublic
+from geotrek.common.views import DocumentPublic, GeoJSONOptionsMixin, StreamingGeoJSONMixin
 from geotrek.tourism.serializers import TouristicContentCategorySerializer
 from geotrek.trekking.models import Trek
 from geotrek.trekking.serializers import POISerializer
@@ -276,7 +276,7 @@ class TouristicEventDocumentPublic(DocumentPublic):
         return context
 
 
-class TouristicContentViewSet(MapEntityViewSet):
+class TouristicContentViewSet(StreamingGeoJSONMixin, GeoJSONOptionsMixin, MapEntityViewSet):
     model = TouristicContent
     serializer_class = TouristicContentSerializer
     permission_classes = [rest_permissions.DjangoModelPermissionsOrAnonReadOnly]
@@ -309,7 +309,7 @@ class TouristicContentCategoryViewSet(MapEntityViewSet):
         return queryset
 
 
-class TouristicEventViewSet(MapEntityViewSet):
+class TouristicEventViewSet(StreamingGeoJSONMixin, GeoJSONOptionsMixin, MapEntityViewSet):
     model = TouristicEvent
     serializer_class = TouristicEventSerializer
     permission_classes = [rest_permissions.DjangoModelPermissionsOrAnonReadOnly]
@@ -385,7 +385,7 @@ class TrekTouristicContentAndPOIViewSet(viewsets.ModelViewSet):
         return chain(qs1, qs2)
 
 
-class TrekTouristicContentViewSet(viewsets.ModelViewSet):
+class TrekTouristicContentViewSet(GeoJSONOptionsMixin, viewsets.ModelViewSet):
     model = TouristicContent
     permission_classes = [rest_permissions.DjangoModelPermissionsOrAnonReadOnly]
 
@@ -416,7 +416,7 @@ class TrekTouristicContentViewSet(viewsets.ModelViewSet):
                                   field_name='geom')
 
 
-class TrekTouristicEventViewSet(viewsets.ModelViewSet):
+class TrekTouristicEventViewSet(GeoJSONOptionsMixin, viewsets.ModelViewSet):
     model = TouristicEvent
     permission_classes = [rest_permissions.DjangoModelPermissionsOrAnonReadOnly]
 
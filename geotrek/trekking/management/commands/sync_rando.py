@@ -1,6 +1,9 @@
 # -*- encoding: UTF-8 -
 
+import hashlib
+import json
 import logging
+import multiprocessing
 from optparse import make_option
 import os
 import re
@@ -12,15 +15,18 @@ from zipfile import ZipFile
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
 from django.db.models import Q
 from django.test.client import RequestFactory
 from django.utils import translation, timezone
 from django.utils.translation import ugettext as _
 from landez import TilesManager
-from landez.sources import DownloadError
+from paperclip.models import Attachment
 from geotrek.common.models import FileType  # NOQA
+from geotrek.altimetry import dem
 from geotrek.altimetry.views import ElevationProfile, ElevationArea, serve_elevation_chart
 from geotrek.common import models as common_models
+from geotrek.common.utils.tiles import TileStore, corridor_tiles
 from geotrek.common.views import ThemeViewSet
 from geotrek.core.views import ParametersView
 from geotrek.feedback.views import CategoryList as FeedbackCategoryList
@@ -39,15 +45,62 @@ from geotrek.tourism import urls  # NOQA
 
 logger = logging.getLogger(__name__)
 
+# Finished treks, kept in temporary directory to resume an interrupted sync
+CHECKPOINT_NAME = 'sync_rando.checkpoint'
+
+# Fingerprints of objects inputs and their files, kept in destination directory
+MANIFEST_NAME = 'sync_rando.manifest'
+
+# Settings which alter synced files
+FINGERPRINT_SETTINGS = ('VERSION', 'SRID', 'API_SRID', 'MEDIA_URL', 'STATIC_URL',
+                        'ALTIMETRIC_', 'EXPORT_', 'TREK_', 'TOURISM_', 'TOURISTIC_',
+                        'ZIP_', 'SPLIT_', 'PUBLISHED_BY_LANG', 'THUMBNAIL_ALIASES',
+                        'PAPERCLIP_CONFIG', 'MAPENTITY_CONFIG', 'LEAFLET_CONFIG')
+
+# Command run by pool workers (inherited from parent process)
+_command = None
+
+
+def _sync_trek_worker(args):
+    lang, pk = args
+    translation.activate(lang)
+    trek = trekking_models.Trek.objects.get(pk=pk)
+    return _command.sync_unit(lang, trek, _command.sync_trek)
+
+
+class ZipEntries(object):
+    """
+    Records files to be added to a zip file, to merge outputs of workers
+    into the zip file of the main process.
+    """
+    def __init__(self):
+        self.entries = []
+
+    def write(self, filename, arcname):
+        self.entries.append((filename, arcname))
+
 
 class ZipTilesBuilder(object):
-    def __init__(self, filepath, close_zip, **builder_args):
+    """
+    Builds a zip file of tiles. Tiles are downloaded concurrently into a
+    ``TileStore`` shared by all builders, and zipped from it.
+    """
+    def __init__(self, filepath, close_zip, store=None, workers=1, **builder_args):
         builder_args['tile_format'] = self.format_from_url(builder_args['tiles_url'])
         self.close_zip = close_zip
         self.zipfile = ZipFile(filepath, 'w')
-        self.tm = TilesManager(**builder_args)
+        if store is None:
+            store = TileStore(self.store_folder(builder_args['tiles_dir'], builder_args['tiles_url']))
+        self.store = store
+        self.workers = workers
+        # Tiles are cached by the store
+        self.tm = TilesManager(cache=False, **builder_args)
         self.tiles = set()
 
+    @classmethod
+    def store_folder(cls, tiles_dir, tiles_url):
+        return os.path.join(tiles_dir, 'store', hashlib.md5(tiles_url).hexdigest())
+
     def format_from_url(self, url):
         """
         Try to guess the tile mime type from the tiles URL.
@@ -62,15 +115,18 @@ class ZipTilesBuilder(object):
     def add_coverage(self, bbox, zoomlevels):
         self.tiles |= set(self.tm.tileslist(bbox, zoomlevels))
 
+    def add_corridor(self, geom, radius, zoomlevels):
+        self.tiles |= set(corridor_tiles(geom, radius, zoomlevels))
+
+    def estimate_size(self):
+        return self.store.estimate_size(self.tiles)
+
     def run(self):
-        for tile in self.tiles:
-            name = '{0}/{1}/{2}.png'.format(*tile)
-            try:
-                data = self.tm.tile(tile)
-            except DownloadError:
-                logger.warning("Failed to download tile %s" % name)
-            else:
-                self.zipfile.writestr(name, data)
+        self.store.fetch(self.tm, self.tiles, self.workers)
+        for tile in sorted(self.tiles):
+            data = self.store.read(tile)
+            if data is not None:
+                self.zipfile.writestr('{0}/{1}/{2}.png'.format(*tile), data)
         self.close_zip(self.zipfile)
 
 
@@ -96,12 +152,44 @@ class Command(BaseCommand):
                     default=False, help='include touristic events by trek in global.zip'),
         make_option('--with-touristiccontent-categories', '-c', action='store', dest='content_categories',
                     default=None, help='include touristic contents by trek in global.zip (filtered by category ID ex: --with-touristiccontent-categories="1,2,3")'),
+        make_option('--jobs', '-j', action='store', dest='jobs', type='int',
+                    default=1, help='Number of processes syncing treks in parallel'),
+        make_option('--resume', '-r', action='store_true', dest='resume',
+                    default=False, help='Keep temporary files on failure, and resume interrupted sync'),
+        make_option('--zoom', action='store', dest='zoom', type='int',
+                    default=None, help='Simplify geometries of GeoJSON files for this zoom level'),
+        make_option('--precision', action='store', dest='precision', type='int',
+                    default=None, help='Number of decimals of GeoJSON coordinates'),
+        make_option('--download-jobs', action='store', dest='download_jobs', type='int',
+                    default=4, help='Number of concurrent tiles downloads'),
     )
 
     def mkdirs(self, name):
         dirname = os.path.dirname(name)
         if not os.path.exists(dirname):
-            os.makedirs(dirname)
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # Created meanwhile by another worker
+                if not os.path.isdir(dirname):
+                    raise
+
+    def copy_file(self, src, dst, link=False):
+        """
+        Copy (or hard link) src to dst atomically: with --jobs, several workers
+        copy shared files (pictograms, POIs pictures...) while others may read
+        them to zip them.
+        """
+        self.mkdirs(dst)
+        tmp = '{dst}.{pid}.tmp'.format(dst=dst, pid=os.getpid())
+        if link:
+            try:
+                os.link(src, tmp)
+            except OSError:
+                shutil.copy2(src, tmp)
+        else:
+            shutil.copyfile(src, tmp)
+        os.rename(tmp, dst)
 
     def sync_global_tiles(self):
         """ Creates a tiles file on the global extent.
@@ -139,10 +227,6 @@ class Command(BaseCommand):
 
         trek_file = os.path.join(self.tmp_root, zipname)
 
-        def _radius2bbox(lng, lat, radius):
-            return (lng - radius, lat - radius,
-                    lng + radius, lat + radius)
-
         self.mkdirs(trek_file)
 
         def close_zip(zipfile):
@@ -150,16 +234,11 @@ class Command(BaseCommand):
 
         tiles = ZipTilesBuilder(trek_file, close_zip, **self.builder_args)
 
-        geom = trek.geom
-        if geom.geom_type == 'MultiLineString':
-            geom = geom[0]  # FIXME
-        geom.transform(4326)
-
-        for (lng, lat) in geom.coords:
-            large = _radius2bbox(lng, lat, settings.MOBILE_TILES_RADIUS_LARGE)
-            small = _radius2bbox(lng, lat, settings.MOBILE_TILES_RADIUS_SMALL)
-            tiles.add_coverage(bbox=large, zoomlevels=settings.MOBILE_TILES_LOW_ZOOMS)
-            tiles.add_coverage(bbox=small, zoomlevels=settings.MOBILE_TILES_HIGH_ZOOMS)
+        geom = trek.geom.transform(4326, clone=True)
+        tiles.add_corridor(geom, settings.MOBILE_TILES_RADIUS_LARGE, settings.MOBILE_TILES_LOW_ZOOMS)
+        tiles.add_corridor(geom, settings.MOBILE_TILES_RADIUS_SMALL, settings.MOBILE_TILES_HIGH_ZOOMS)
+        logger.info("Trek %s tiles: %s tiles, about %s kB"
+                    % (trek.pk, len(tiles.tiles), tiles.estimate_size() / 1024))
 
         tiles.run()
 
@@ -187,8 +266,14 @@ class Command(BaseCommand):
                 self.stdout.write(u"\x1b[3D\x1b[31;1mfailed (HTTP {code})\x1b[0m".format(code=response.status_code))
             return
         f = open(fullname, 'w')
-        f.write(response.content)
+        if getattr(response, 'streaming', False):
+            for chunk in response.streaming_content:
+                f.write(chunk)
+        else:
+            f.write(response.content)
         f.close()
+        if self.written is not None:
+            self.written.append(name)
         if zipfile:
             zipfile.write(fullname, name)
         if self.verbosity == '2':
@@ -207,6 +292,7 @@ class Command(BaseCommand):
         view = viewset.as_view({'get': 'list'})
         name = os.path.join('api', lang, name)
         params.update({'format': 'geojson'})
+        params.update(self.geojson_options)
 
         if self.source:
             params['source'] = ','.join(self.source)
@@ -224,7 +310,7 @@ class Command(BaseCommand):
         self.sync_view(lang, view, name, params=params, zipfile=zipfile, **kwargs)
 
     def sync_trek_pois(self, lang, trek, zipfile=None):
-        params = {'format': 'geojson'}
+        params = dict(self.geojson_options, format='geojson')
         if settings.ZIP_TOURISTIC_CONTENTS_AS_POI:
             view = tourism_views.TrekTouristicContentAndPOIViewSet.as_view({'get': 'list'})
             name = os.path.join('api', lang, 'treks', str(trek.pk), 'pois.geojson')
@@ -239,7 +325,8 @@ class Command(BaseCommand):
     def sync_trek_services(self, lang, trek, zipfile=None):
         view = TrekServiceViewSet.as_view({'get': 'list'})
         name = os.path.join('api', lang, 'treks', str(trek.pk), 'services.geojson')
-        self.sync_view(lang, view, name, params={'format': 'geojson'}, zipfile=zipfile, pk=trek.pk)
+        params = dict(self.geojson_options, format='geojson')
+        self.sync_view(lang, view, name, params=params, zipfile=zipfile, pk=trek.pk)
 
     def sync_object_view(self, lang, obj, view, basename_fmt, zipfile=None, params={}, **kwargs):
         modelname = obj._meta.model_name
@@ -282,8 +369,9 @@ class Command(BaseCommand):
         url = url.strip('/')
         src = os.path.join(src_root, name)
         dst = os.path.join(self.tmp_root, url, name)
-        self.mkdirs(dst)
-        shutil.copyfile(src, dst)
+        self.copy_file(src, dst)
+        if self.written is not None:
+            self.written.append(os.path.join(url, name))
         if zipfile:
             zipfile.write(dst, os.path.join(url, name))
         if self.verbosity == '2':
@@ -312,8 +400,6 @@ class Command(BaseCommand):
         self.mkdirs(zipfullname)
         self.trek_zipfile = ZipFile(zipfullname, 'w')
 
-        self.sync_json(lang, ParametersView, 'parameters', zipfile=self.zipfile)
-        self.sync_json(lang, ThemeViewSet, 'themes', as_view_args=[{'get': 'list'}], zipfile=self.zipfile)
         self.sync_trek_pois(lang, trek, zipfile=self.zipfile)
         self.sync_trek_services(lang, trek, zipfile=self.zipfile)
         self.sync_gpx(lang, trek)
@@ -347,6 +433,154 @@ class Command(BaseCommand):
 
         self.close_zip(self.trek_zipfile, zipname)
 
+    def unit_key(self, lang, obj):
+        return '{model}/{lang}/{pk}'.format(model=obj._meta.model_name, lang=lang, pk=obj.pk)
+
+    def fingerprint(self, lang, obj):
+        """
+        Hash of the inputs of object files: timestamps of object and related
+        objects, language, options and settings.
+        """
+        inputs = [lang, self.options_fingerprint]
+        related = [obj]
+        if isinstance(obj, trekking_models.Trek):
+            related.extend(obj.published_pois)
+            related.extend(obj.published_services)
+            related.extend(obj.parents)
+            related.extend(obj.children)
+            if settings.ZIP_TOURISTIC_CONTENTS_AS_POI:
+                related.extend(obj.published_touristic_contents)
+            if self.with_events:
+                related.extend(obj.touristic_events.all())
+            if self.categories:
+                related.extend(obj.touristic_contents.all())
+            # Information desks have no timestamp
+            inputs.append(list(obj.information_desks.values()))
+            inputs.append(self.dem_version)
+        for related_obj in related:
+            inputs.append((related_obj._meta.model_name, related_obj.pk, related_obj.date_update))
+            attachments = Attachment.objects.attachments_for_object(related_obj)
+            inputs.append(list(attachments.values_list('pk', 'date_update')))
+        return hashlib.md5(json.dumps(inputs, default=unicode, sort_keys=True)).hexdigest()
+
+    def sync_unit(self, lang, obj, sync_method):
+        """
+        Sync object, or copy its files from previous sync if its inputs did
+        not change. Files of global zip are recorded instead of being added.
+        Returns manifest record and success.
+        """
+        key = self.unit_key(lang, obj)
+        if key in self.checkpoint:
+            return self.checkpoint[key], True
+        fingerprint = self.fingerprint(lang, obj)
+        previous = self.previous_manifest.get(key)
+        if previous is not None and previous['fingerprint'] == fingerprint:
+            if self.copy_previous(previous['files']):
+                if self.verbosity == '2':
+                    self.stdout.write(u"\x1b[36m{lang}\x1b[0m \x1b[1m{key}\x1b[0m \x1b[32mreused\x1b[0m".format(lang=lang, key=key))
+                return previous, True
+
+        zipfile, successfull = self.zipfile, self.successfull
+        self.zipfile, self.successfull, self.written = ZipEntries(), True, []
+        try:
+            sync_method(lang, obj)
+            entries = [(os.path.relpath(filename, self.tmp_root), arcname)
+                       for filename, arcname in self.zipfile.entries]
+            record = {'fingerprint': fingerprint, 'files': self.written, 'entries': entries}
+            return record, self.successfull
+        finally:
+            self.zipfile, self.successfull, self.written = zipfile, successfull, None
+
+    def add_unit(self, key, record, successfull):
+        for filename, arcname in record['entries']:
+            self.zipfile.write(os.path.join(self.tmp_root, filename), arcname)
+        if not successfull:
+            self.successfull = False
+            return
+        if key not in self.checkpoint:
+            self.save_checkpoint(key, record)
+        self.manifest[key] = record
+
+    def copy_previous(self, files):
+        """
+        Copy files of previous sync into temporary directory. Returns False
+        if some are missing.
+        """
+        for name in files:
+            src = os.path.join(self.dst_root, name)
+            dst = os.path.join(self.tmp_root, name)
+            if not os.path.exists(src):
+                return False
+            # Previous sync is removed afterwards, files can be shared
+            self.copy_file(src, dst, link=True)
+        return True
+
+    def sync_treks(self, lang, treks):
+        treks = list(treks)
+        if self.jobs > 1 and len(treks) > 1:
+            results = self.sync_treks_in_pool(lang, [trek.pk for trek in treks])
+        else:
+            results = (self.sync_unit(lang, trek, self.sync_trek) for trek in treks)
+
+        for trek, (record, successfull) in zip(treks, results):
+            self.add_unit(self.unit_key(lang, trek), record, successfull)
+
+    def sync_treks_in_pool(self, lang, pks):
+        global _command
+        _command = self
+        # Workers open their own database connection
+        connection.close()
+        pool = multiprocessing.Pool(self.jobs)
+        try:
+            for result in pool.imap(_sync_trek_worker, [(lang, pk) for pk in pks]):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def load_checkpoint(self):
+        self.checkpoint = {}
+        filename = os.path.join(self.tmp_root, CHECKPOINT_NAME)
+        if os.path.exists(filename):
+            with open(filename, 'r') as f:
+                for line in f:
+                    try:
+                        unit = json.loads(line)
+                    except ValueError:
+                        continue  # Truncated by interruption
+                    self.checkpoint[unit['key']] = unit['record']
+        self.checkpoint_file = open(filename, 'a')
+
+    def save_checkpoint(self, key, record):
+        unit = {'key': key, 'record': record}
+        self.checkpoint_file.write(json.dumps(unit) + '\n')
+        self.checkpoint_file.flush()
+
+    def close_checkpoint(self):
+        self.checkpoint_file.close()
+        os.remove(os.path.join(self.tmp_root, CHECKPOINT_NAME))
+
+    def settings_fingerprint(self):
+        inputs = [self.referer, self.skip_pdf, self.skip_dem, self.skip_profile_png,
+                  self.source, self.portal, self.with_events, self.categories, self.geojson_options]
+        for name in sorted(dir(settings)):
+            if name.startswith(FINGERPRINT_SETTINGS):
+                inputs.append((name, getattr(settings, name)))
+        return hashlib.md5(json.dumps(inputs, default=unicode, sort_keys=True)).hexdigest()
+
+    def load_manifest(self):
+        self.manifest = {}
+        self.previous_manifest = {}
+        try:
+            with open(os.path.join(self.dst_root, MANIFEST_NAME), 'r') as f:
+                self.previous_manifest = json.load(f)
+        except (IOError, ValueError):
+            pass
+
+    def save_manifest(self):
+        with open(os.path.join(self.tmp_root, MANIFEST_NAME), 'w') as f:
+            json.dump(self.manifest, f)
+
     def close_zip(self, zipfile, name):
         oldzipfilename = os.path.join(self.dst_root, name)
         zipfilename = os.path.join(self.tmp_root, name)
@@ -361,6 +595,8 @@ class Command(BaseCommand):
             oldzipfile.close()
 
         zipfile.close()
+        if self.written is not None:
+            self.written.append(name)
         if uptodate:
             stat = os.stat(oldzipfilename)
             os.utime(zipfilename, (stat.st_atime, stat.st_mtime))
@@ -378,6 +614,8 @@ class Command(BaseCommand):
         self.zipfile = ZipFile(zipfullname, 'w')
 
         self.sync_geojson(lang, TrekViewSet, 'treks.geojson', zipfile=self.zipfile)
+        self.sync_json(lang, ParametersView, 'parameters', zipfile=self.zipfile)
+        self.sync_json(lang, ThemeViewSet, 'themes', as_view_args=[{'get': 'list'}], zipfile=self.zipfile)
         self.sync_geojson(lang, POIViewSet, 'pois.geojson')
         self.sync_geojson(lang, FlatPageViewSet, 'flatpages.geojson', zipfile=self.zipfile)
         self.sync_geojson(lang, ServiceViewSet, 'services.geojson', zipfile=self.zipfile)
@@ -410,8 +648,9 @@ class Command(BaseCommand):
         if self.portal:
             treks = treks.filter(portal__name__in=self.portal)
 
-        for trek in treks:
-            self.sync_trek(lang, trek)
+        # Compute elevation profiles of all treks at once
+        with trekking_models.Trek.prefetched_elevation_profiles(treks):
+            self.sync_treks(lang, treks)
 
         self.sync_tourism(lang)
 
@@ -533,7 +772,7 @@ class Command(BaseCommand):
             contents = contents.filter(portal__name__in=self.portal)
 
         for content in contents:
-            self.sync_content(lang, content)
+            self.add_unit(self.unit_key(lang, content), *self.sync_unit(lang, content, self.sync_content))
 
         events = tourism_models.TouristicEvent.objects.existing().order_by('pk')
         events = events.filter(**{'published_{lang}'.format(lang=lang): True})
@@ -545,7 +784,7 @@ class Command(BaseCommand):
             events = events.filter(portal__name__in=self.portal)
 
         for event in events:
-            self.sync_event(lang, event)
+            self.add_unit(self.unit_key(lang, event), *self.sync_unit(lang, event, self.sync_event))
 
         # Information desks
         self.sync_geojson(lang, tourism_views.InformationDeskViewSet, 'information_desks.geojson')
@@ -559,6 +798,7 @@ class Command(BaseCommand):
         params = {'format': 'geojson',
                   'categories': ','.join(category for category in self.categories),
                   'portal': ','.join(portal for portal in self.portal)}
+        params.update(self.geojson_options)
 
         view = tourism_views.TrekTouristicContentViewSet.as_view({'get': 'list'})
         name = os.path.join('api', lang, 'treks', str(trek.pk), 'touristiccontents.geojson')
@@ -570,6 +810,7 @@ class Command(BaseCommand):
     def sync_trek_touristicevents(self, lang, trek, zipfile=None):
         params = {'format': 'geojson',
                   'portal': ','.join(portal for portal in self.portal)}
+        params.update(self.geojson_options)
         view = tourism_views.TrekTouristicEventViewSet.as_view({'get': 'list'})
         name = os.path.join('api', lang, 'treks', str(trek.pk), 'touristicevents.geojson')
         self.sync_view(lang, view, name, params=params, zipfile=zipfile, pk=trek.pk)
@@ -595,22 +836,24 @@ class Command(BaseCommand):
         step_value = int(50 / len(settings.MODELTRANSLATION_LANGUAGES))
         current_value = 30
 
-        for lang in self.languages:
-            if self.celery_task:
-                self.celery_task.update_state(
-                    state='PROGRESS',
-                    meta={
-                        'name': self.celery_task.name,
-                        'current': current_value + step_value,
-                        'total': 100,
-                        'infos': u"{} : {} ...".format(_(u"Language"), lang)
-                    }
-                )
-                current_value = current_value + step_value
-
-            translation.activate(lang)
-            self.sync_trekking(lang)
-            translation.deactivate()
+        # Elevation profiles are kept from one language to the other
+        with trekking_models.Trek.prefetched_elevation_profiles([]):
+            for lang in self.languages:
+                if self.celery_task:
+                    self.celery_task.update_state(
+                        state='PROGRESS',
+                        meta={
+                            'name': self.celery_task.name,
+                            'current': current_value + step_value,
+                            'total': 100,
+                            'infos': u"{} : {} ...".format(_(u"Language"), lang)
+                        }
+                    )
+                    current_value = current_value + step_value
+
+                translation.activate(lang)
+                self.sync_trekking(lang)
+                translation.deactivate()
 
         self.sync_static_file('**', 'tourism/touristicevent.svg')
         self.sync_pictograms('**', tourism_models.InformationDeskType)
@@ -622,7 +865,7 @@ class Command(BaseCommand):
         if not os.path.exists(self.dst_root):
             return
         existing = set([os.path.basename(p) for p in os.listdir(self.dst_root)])
-        remaining = existing - set(('api', 'media', 'static', 'zip'))
+        remaining = existing - set(('api', 'media', 'static', 'zip', MANIFEST_NAME))
         if remaining:
             raise CommandError(u"Destination directory contains extra data")
 
@@ -648,7 +891,10 @@ class Command(BaseCommand):
         self.host = self.referer[7:]
         self.factory = RequestFactory()
         self.tmp_root = os.path.join(os.path.dirname(self.dst_root), 'tmp_sync_rando')
-        os.mkdir(self.tmp_root)
+        self.resume = options.get('resume', False)
+        if not (self.resume and os.path.exists(self.tmp_root)):
+            os.mkdir(self.tmp_root)
+        self.jobs = options.get('jobs') or 1
         self.skip_pdf = options['skip_pdf']
         self.skip_tiles = options['skip_tiles']
         self.skip_dem = options['skip_dem']
@@ -663,6 +909,8 @@ class Command(BaseCommand):
         if options.get('content_categories', u""):
             self.categories = options.get('content_categories', u"").split(',')
         self.celery_task = options.get('task', None)
+        self.geojson_options = dict([(name, options[name]) for name in ('zoom', 'precision')
+                                     if options.get(name) is not None])
 
         if self.source is not None:
             self.source = self.source.split(',')
@@ -673,12 +921,21 @@ class Command(BaseCommand):
         else:
             self.portal = []
 
+        tiles_dir = os.path.join(settings.DEPLOY_ROOT, 'var', 'tiles')
         self.builder_args = {
             'tiles_url': settings.MOBILE_TILES_URL,
             'tiles_headers': {"Referer": self.referer},
             'ignore_errors': True,
-            'tiles_dir': os.path.join(settings.DEPLOY_ROOT, 'var', 'tiles'),
+            'tiles_dir': tiles_dir,
+            # Tiles shared by treks are downloaded once
+            'store': TileStore(ZipTilesBuilder.store_folder(tiles_dir, settings.MOBILE_TILES_URL)),
+            'workers': options.get('download_jobs') or 4,
         }
+        self.options_fingerprint = self.settings_fingerprint()
+        self.dem_version = dem.dem_version()
+        self.written = None
+        self.load_manifest()
+        self.load_checkpoint()
         try:
             self.sync()
             if self.celery_task:
@@ -692,9 +949,13 @@ class Command(BaseCommand):
                     }
                 )
         except:
-            shutil.rmtree(self.tmp_root)
+            self.checkpoint_file.close()
+            if not self.resume:
+                shutil.rmtree(self.tmp_root)
             raise
 
+        self.close_checkpoint()
+        self.save_manifest()
         self.rename_root()
 
         if self.verbosity >= '1':
@@ -3,6 +3,7 @@ import logging
 
 from django.conf import settings
 from django.contrib.gis.db import models
+from django.db import connection
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.template.defaultfilters import slugify
@@ -14,7 +15,7 @@ from mapentity.serializers import plain_text
 
 from geotrek.authent.models import StructureRelated
 from geotrek.core.models import Path, Topology
-from geotrek.common.utils import intersecting, classproperty
+from geotrek.common.utils import intersecting, intersecting_batch, classproperty, prefetchable
 from geotrek.common.mixins import (PicturesMixin, PublishableMixin,
                                    PictogramMixin, OptionalPictogramMixin)
 from geotrek.common.models import Theme
@@ -163,17 +164,15 @@ class Trek(StructureRelated, PicturesMixin, PublishableMixin, MapEntityMixin, To
         return TrekRelationship.objects.filter(trek_a=self)
 
     @property
+    @prefetchable
     def published_relationships(self):
         return self.relationships.filter(trek_b__published=True)
 
     @property
     def poi_types(self):
-        if settings.TREKKING_TOPOLOGY_ENABLED:
-            # Can't use values_list and must add 'ordering' because of bug:
-            # https://code.djangoproject.com/ticket/14930
-            values = self.pois.values('ordering', 'type')
-        else:
-            values = self.pois.values('type')
+        # Can't use values_list and must add 'ordering' because of bug:
+        # https://code.djangoproject.com/ticket/14930
+        values = self.pois.values('ordering', 'type')
         pks = [value['type'] for value in values]
         return POIType.objects.filter(pk__in=set(pks))
 
@@ -210,11 +209,10 @@ class Trek(StructureRelated, PicturesMixin, PublishableMixin, MapEntityMixin, To
         line.style.linestyle.color = simplekml.Color.red  # Red
         line.style.linestyle.width = 4  # pixels
         # Place marks
-        for poi in self.pois:
-            place = poi.geom_3d.transform(settings.API_SRID, clone=True)
+        for poi in self.pois.transform(4326, field_name='geom_3d'):
             kml.newpoint(name=poi.name,
                          description=plain_text(poi.description),
-                         coords=[place.coords])
+                         coords=[poi.geom_3d.coords])
         return kml.kml()
 
     def has_geom_valid(self):
@@ -239,6 +237,11 @@ class Trek(StructureRelated, PicturesMixin, PublishableMixin, MapEntityMixin, To
 
     @classmethod
     def topology_treks(cls, topology):
+        if isinstance(topology, (POI, Service)):
+            # Proximity is symmetrical for them
+            sql = """%s.%s IN (SELECT itineraire FROM o_r_itineraire_proximite
+                               WHERE kind = %%s AND objet = %%s)""" % (cls._meta.db_table, cls._meta.pk.column)
+            return cls.objects.existing().extra(where=[sql], params=[topology.kind, topology.pk])
         if settings.TREKKING_TOPOLOGY_ENABLED:
             qs = cls.overlapping(topology)
         else:
@@ -264,6 +267,7 @@ class Trek(StructureRelated, PicturesMixin, PublishableMixin, MapEntityMixin, To
         return Trek.objects.filter(trek_children__child=self, deleted=False)
 
     @property
+    @prefetchable
     def parents_id(self):
         parents = self.trek_parents.values_list('parent__id', flat=True)
         return list(parents)
@@ -273,6 +277,7 @@ class Trek(StructureRelated, PicturesMixin, PublishableMixin, MapEntityMixin, To
         return Trek.objects.filter(trek_parents__parent=self, deleted=False).order_by('trek_parents__order')
 
     @property
+    @prefetchable
     def children_id(self):
         """
         Get children IDs
@@ -297,6 +302,7 @@ class Trek(StructureRelated, PicturesMixin, PublishableMixin, MapEntityMixin, To
         return children_id[index + 1]
 
     @property
+    @prefetchable
     def previous_id(self):
         """
         Dict of parent -> previous child
@@ -304,12 +310,78 @@ class Trek(StructureRelated, PicturesMixin, PublishableMixin, MapEntityMixin, To
         return {parent.id: self.previous_id_for(parent) for parent in self.parents.filter(published=True, deleted=False)}
 
     @property
+    @prefetchable
     def next_id(self):
         """
         Dict of parent -> next child
         """
         return {parent.id: self.next_id_for(parent) for parent in self.parents.filter(published=True, deleted=False)}
 
+    @classmethod
+    def prefetch_serialized_relations(cls, treks):
+        """
+        Compute relations of many treks serialized by ``TrekSerializer`` at
+        once, in a few queries instead of several per trek.
+        """
+        treks = list(treks)
+        if len(treks) == 0:
+            return
+        pks = set([trek.pk for trek in treks])
+
+        # Parents and children, with siblings for previous/next: all children
+        # of treks and of their parents, in order
+        parents = set(OrderedTrekChild.objects.filter(child__in=pks).values_list('parent', flat=True))
+        published_parents = set(cls.objects.filter(pk__in=parents, published=True, deleted=False)
+                                           .values_list('pk', flat=True))
+        links = OrderedTrekChild.objects.filter(parent__in=pks | parents).order_by('parent', 'order')
+        children_of = {}
+        parents_of = {}
+        for parent, child in links.values_list('parent', 'child'):
+            children_of.setdefault(parent, []).append(child)
+            if child in pks:
+                parents_of.setdefault(child, []).append(parent)
+
+        def sibling(trek, parent, shift):
+            children_id = children_of[parent]
+            index = children_id.index(trek.pk) + shift
+            return children_id[index] if 0 <= index < len(children_id) else None
+
+        relationships = {}
+        for relationship in TrekRelationship.objects.filter(trek_a__in=pks, trek_b__published=True)\
+                                                    .select_related('trek_b__practice'):
+            relationships.setdefault(relationship.trek_a_id, []).append(relationship)
+
+        if settings.HIDE_PUBLISHED_TREKS_IN_TOPOLOGIES:
+            published_treks = {}
+        else:
+            queryset = cls.objects.existing().filter(published=True).select_related('practice')
+            published_treks = intersecting_batch(cls, treks, queryset)
+        queryset = tourism_models.TouristicContent.objects.existing().filter(published=True)
+        contents = cls.close_objects_batch(treks, tourism_models.TouristicContent, 'TOURISTICCONTENT',
+                                           queryset.select_related('category'))
+        queryset = tourism_models.TouristicEvent.objects.existing().filter(published=True)
+        events = cls.close_objects_batch(treks, tourism_models.TouristicEvent, 'TOURISTICEVENT', queryset)
+
+        cls.prefetch_attachments(treks)
+        if settings.TREK_WITH_POIS_PICTURES:
+            pois = POI.published_treks_pois(treks)
+            POI.prefetch_attachments(sum(pois.values(), []))
+
+        for trek in treks:
+            own_parents = parents_of.get(trek.pk, [])
+            trek.set_prefetched('children_id', children_of.get(trek.pk, []))
+            trek.set_prefetched('parents_id', sorted(own_parents))
+            trek.set_prefetched('previous_id', dict([(parent, sibling(trek, parent, -1))
+                                                     for parent in own_parents if parent in published_parents]))
+            trek.set_prefetched('next_id', dict([(parent, sibling(trek, parent, 1))
+                                                 for parent in own_parents if parent in published_parents]))
+            trek.set_prefetched('published_relationships', relationships.get(trek.pk, []))
+            trek.set_prefetched('published_treks', published_treks.get(trek.pk, []))
+            trek.set_prefetched('published_touristic_contents', contents[trek.pk])
+            trek.set_prefetched('published_touristic_events', events[trek.pk])
+            if settings.TREK_WITH_POIS_PICTURES:
+                trek.set_prefetched('published_pois', pois[trek.pk])
+
     def clean(self):
         """
         Custom model validation
@@ -330,6 +402,82 @@ class Trek(StructureRelated, PicturesMixin, PublishableMixin, MapEntityMixin, To
         else:
             return settings.TOURISM_INTERSECTION_MARGIN
 
+    def close_objects(self, model, kind):
+        """
+        Objects of ``model`` close to this trek, read from the proximity index
+        maintained at DB level (see ``sql/40_proximite.sql``).
+        POIs and services are ordered by progression along the trek, like
+        ``overlapping()``, other objects are within ``distance()`` and ordered
+        like ``intersecting()``.
+        """
+        table, column = model._meta.db_table, model._meta.pk.column
+        where = """%s.%s IN (SELECT objet FROM o_r_itineraire_proximite
+                             WHERE itineraire = %%s AND kind = %%s AND (%%s IS NULL OR distance <= %%s))""" % (table, column)
+        ordering = """SELECT position FROM o_r_itineraire_proximite
+                      WHERE itineraire = %%s AND kind = %%s AND objet = %s.%s""" % (table, column)
+        distance = None if kind in ('POI', 'SERVICE') else self.distance(model)
+        qs = model.objects.existing().extra(where=[where], params=[self.pk, kind, distance, distance],
+                                            select={'ordering': ordering}, select_params=[self.pk, kind])
+        if not distance:
+            qs = qs.extra(order_by=['ordering'])
+        return qs
+
+    @classmethod
+    def close_objects_batch(cls, treks, model, kind, queryset=None):
+        """
+        Like ``close_objects()``, for many treks at once, as a dict of lists
+        keyed by trek pk. ``queryset`` can be given to select related objects
+        or restrict results.
+        """
+        result = dict([(trek.pk, []) for trek in treks])
+        if len(treks) == 0:
+            return result
+        cursor = connection.cursor()
+        cursor.execute("""SELECT itineraire, objet, position, distance FROM o_r_itineraire_proximite
+                          WHERE itineraire = ANY(%s) AND kind = %s""", [result.keys(), kind])
+        rows = cursor.fetchall()
+
+        if queryset is None:
+            queryset = model.objects.existing()
+        objects = list(queryset.filter(pk__in=set([row[1] for row in rows])))
+        ranks = dict([(obj.pk, i) for i, obj in enumerate(objects)])
+        objects = dict([(obj.pk, obj) for obj in objects])
+        distances = dict([(trek.pk, None if kind in ('POI', 'SERVICE') else trek.distance(model))
+                          for trek in treks])
+        positions = {}
+        for trek_pk, pk, position, distance in rows:
+            limit = distances[trek_pk]
+            if pk in objects and (limit is None or distance <= limit):
+                positions.setdefault(trek_pk, {})[pk] = position
+        for trek in treks:
+            located = positions.get(trek.pk, {})
+            if distances[trek.pk]:
+                ordering = [(ranks[pk], pk) for pk in located]
+            else:
+                ordering = [(located[pk] is None, located[pk], ranks[pk], pk) for pk in located]
+            result[trek.pk] = [objects[row[-1]] for row in sorted(ordering)]
+        return result
+
+    @property
+    @prefetchable
+    def touristic_contents(self):
+        return self.close_objects(tourism_models.TouristicContent, 'TOURISTICCONTENT')
+
+    @property
+    @prefetchable
+    def published_touristic_contents(self):
+        return self.touristic_contents.filter(published=True)
+
+    @property
+    @prefetchable
+    def touristic_events(self):
+        return self.close_objects(tourism_models.TouristicEvent, 'TOURISTICEVENT')
+
+    @property
+    @prefetchable
+    def published_touristic_events(self):
+        return self.touristic_events.filter(published=True)
+
     def is_public(self):
         for parent in self.parents:
             if parent.any_published:
@@ -639,6 +787,8 @@ class POI(StructureRelated, PicturesMixin, PublishableMixin, MapEntityMixin, Top
 
     @classmethod
     def topology_pois(cls, topology):
+        if isinstance(topology, Trek):
+            return topology.close_objects(cls, cls.KIND)
         if settings.TREKKING_TOPOLOGY_ENABLED:
             qs = cls.overlapping(topology)
         else:
@@ -650,6 +800,15 @@ class POI(StructureRelated, PicturesMixin, PublishableMixin, MapEntityMixin, Top
     def published_topology_pois(cls, topology):
         return cls.topology_pois(topology).filter(published=True)
 
+    @classmethod
+    def published_treks_pois(cls, treks):
+        """
+        Like ``published_topology_pois()``, for many treks at once, as a dict
+        of lists keyed by trek pk.
+        """
+        queryset = cls.objects.existing().filter(published=True)
+        return Trek.close_objects_batch(treks, cls, cls.KIND, queryset)
+
     def distance(self, to_cls):
         return settings.TOURISM_INTERSECTION_MARGIN
 
@@ -754,13 +913,13 @@ class Service(StructureRelated, MapEntityMixin, Topology):
 
     @classmethod
     def topology_services(cls, topology):
+        if isinstance(topology, Trek):
+            return topology.close_objects(cls, cls.KIND).filter(type__practices=topology.practice)
         if settings.TREKKING_TOPOLOGY_ENABLED:
             qs = cls.overlapping(topology)
         else:
             area = topology.geom.buffer(settings.TREK_POI_INTERSECTION_MARGIN)
             qs = cls.objects.existing().filter(geom__intersects=area)
-        if isinstance(topology, Trek):
-            qs = qs.filter(type__practices=topology.practice)
         return qs
 
     @classmethod
@@ -17,7 +17,7 @@ from geotrek.common.serializers import (
     PictogramSerializerMixin, ThemeSerializer,
     TranslatedModelSerializer, PicturesSerializerMixin,
     PublishableSerializerMixin, RecordSourceSerializer,
-    TargetPortalSerializer
+    TargetPortalSerializer, GeoJSONSerializerMixin
 )
 from geotrek.authent import models as authent_models
 from geotrek.cirkwi.models import CirkwiTag
@@ -29,11 +29,11 @@ from geotrek.trekking import models as trekking_models
 class TrekGPXSerializer(GPXSerializer):
     def end_object(self, trek):
         super(TrekGPXSerializer, self).end_object(trek)
-        for poi in trek.pois.all():
-            geom_3d = poi.geom_3d.transform(4326, clone=True)  # GPX uses WGS84
-            wpt = gpxpy.gpx.GPXWaypoint(latitude=geom_3d.y,
-                                        longitude=geom_3d.x,
-                                        elevation=geom_3d.z)
+        # GPX uses WGS84
+        for poi in trek.pois.select_related('type').transform(4326, field_name='geom_3d'):
+            wpt = gpxpy.gpx.GPXWaypoint(latitude=poi.geom_3d.y,
+                                        longitude=poi.geom_3d.x,
+                                        elevation=poi.geom_3d.z)
             wpt.name = u"%s: %s" % (poi.type, poi.name)
             wpt.description = poi.description
             self.gpx.waypoints.append(wpt)
@@ -150,7 +150,7 @@ class ChildSerializer(TranslatedModelSerializer):
 
 class TrekSerializer(PublishableSerializerMixin, PicturesSerializerMixin,
                      AltimetrySerializerMixin, ZoningSerializerMixin,
-                     TranslatedModelSerializer):
+                     GeoJSONSerializerMixin, TranslatedModelSerializer):
     duration_pretty = rest_serializers.Field(source='duration_pretty')
     difficulty = DifficultyLevelSerializer()
     route = RouteSerializer()
@@ -304,7 +304,7 @@ class ClosePOISerializer(TranslatedModelSerializer):
 
 
 class POISerializer(PublishableSerializerMixin, PicturesSerializerMixin,
-                    ZoningSerializerMixin, TranslatedModelSerializer):
+                    ZoningSerializerMixin, GeoJSONSerializerMixin, TranslatedModelSerializer):
     type = POITypeSerializer()
     structure = StructureSerializer()
 
@@ -333,7 +333,7 @@ class ServiceTypeSerializer(PictogramSerializerMixin, TranslatedModelSerializer)
         fields = ('id', 'pictogram', 'name')
 
 
-class ServiceSerializer(rest_serializers.ModelSerializer):
+class ServiceSerializer(GeoJSONSerializerMixin, rest_serializers.ModelSerializer):
     type = ServiceTypeSerializer()
     structure = StructureSerializer()
 
@@ -0,0 +1,154 @@
+-------------------------------------------------------------------------------
+-- POIs, services, touristic contents and events close to each trek, with
+-- their position along the trek and their distance.
+-------------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS rando.o_r_itineraire_proximite (
+    itineraire integer NOT NULL,
+    kind varchar(32) NOT NULL,
+    objet integer NOT NULL,
+    position float8,
+    distance float8
+);
+
+DROP INDEX IF EXISTS o_r_itineraire_proximite_itineraire_idx;
+CREATE INDEX o_r_itineraire_proximite_itineraire_idx ON rando.o_r_itineraire_proximite(itineraire, kind);
+DROP INDEX IF EXISTS o_r_itineraire_proximite_objet_idx;
+CREATE INDEX o_r_itineraire_proximite_objet_idx ON rando.o_r_itineraire_proximite(kind, objet);
+
+
+-------------------------------------------------------------------------------
+-- Compute close objects of treks (all if NULL), restricted to objects of
+-- kind (all if NULL) and ids (all if NULL).
+--
+-- POIs and services overlap the trek (or are within TREK_POI_INTERSECTION_MARGIN
+-- without topologies), touristic contents and events are within the distance
+-- of trek practice (or TOURISM_INTERSECTION_MARGIN).
+-------------------------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION rando.ft_itineraire_proximite_refresh(treks integer[], obj_kind varchar, objets integer[]) RETURNS void AS $$
+BEGIN
+    DELETE FROM o_r_itineraire_proximite
+        WHERE (treks IS NULL OR itineraire = ANY(treks))
+          AND (obj_kind IS NULL OR kind = obj_kind)
+          AND (objets IS NULL OR objet = ANY(objets));
+
+    INSERT INTO o_r_itineraire_proximite (itineraire, kind, objet, position, distance)
+    WITH itineraires AS (
+        SELECT e.id, e.geom, coalesce(p.distance, {{TOURISM_INTERSECTION_MARGIN}}) AS marge
+        FROM o_t_itineraire i
+        JOIN e_t_evenement e ON (e.id = i.evenement)
+        LEFT JOIN o_b_pratique p ON (p.id = i.pratique)
+        WHERE (treks IS NULL OR e.id = ANY(treks))
+          AND e.geom IS NOT NULL AND NOT ST_IsEmpty(e.geom)
+    ),
+    proches AS (
+        SELECT o.itineraire, e.kind, e.id AS objet, e.geom
+        FROM (SELECT DISTINCT ta.evenement AS itineraire, oa.evenement AS objet
+              FROM itineraires t
+              JOIN e_r_evenement_troncon ta ON (ta.evenement = t.id)
+              JOIN e_r_evenement_troncon oa ON (oa.troncon = ta.troncon)
+              WHERE {{TREKKING_TOPOLOGY_ENABLED}}
+                AND (objets IS NULL OR oa.evenement = ANY(objets))
+                AND least(oa.pk_debut, oa.pk_fin) <= greatest(ta.pk_debut, ta.pk_fin)
+                AND greatest(oa.pk_debut, oa.pk_fin) >= least(ta.pk_debut, ta.pk_fin)) AS o
+        JOIN e_t_evenement e ON (e.id = o.objet)
+        WHERE e.kind IN ('POI', 'SERVICE')
+          AND (obj_kind IS NULL OR e.kind = obj_kind)
+        UNION ALL
+        SELECT t.id, e.kind, e.id, e.geom
+        FROM itineraires t, e_t_evenement e
+        WHERE NOT {{TREKKING_TOPOLOGY_ENABLED}}
+          AND e.kind IN ('POI', 'SERVICE')
+          AND (obj_kind IS NULL OR e.kind = obj_kind)
+          AND (objets IS NULL OR e.id = ANY(objets))
+          AND e.geom && ST_Expand(t.geom, {{TREK_POI_INTERSECTION_MARGIN}})
+          AND ST_DWithin(t.geom, e.geom, {{TREK_POI_INTERSECTION_MARGIN}})
+        UNION ALL
+        SELECT t.id, 'TOURISTICCONTENT', c.id, c.geom
+        FROM itineraires t, t_t_contenu_touristique c
+        WHERE (obj_kind IS NULL OR obj_kind = 'TOURISTICCONTENT')
+          AND (objets IS NULL OR c.id = ANY(objets))
+          AND c.geom && ST_Expand(t.geom, t.marge)
+          AND CASE WHEN t.marge > 0 THEN ST_DWithin(t.geom, c.geom, t.marge)
+                   ELSE ST_Intersects(t.geom, c.geom) END
+        UNION ALL
+        SELECT t.id, 'TOURISTICEVENT', c.id, c.geom
+        FROM itineraires t, t_t_evenement_touristique c
+        WHERE (obj_kind IS NULL OR obj_kind = 'TOURISTICEVENT')
+          AND (objets IS NULL OR c.id = ANY(objets))
+          AND c.geom && ST_Expand(t.geom, t.marge)
+          AND CASE WHEN t.marge > 0 THEN ST_DWithin(t.geom, c.geom, t.marge)
+                   ELSE ST_Intersects(t.geom, c.geom) END
+    )
+    SELECT p.itineraire, p.kind, p.objet,
+           CASE WHEN GeometryType(t.geom) = 'LINESTRING'
+                THEN ST_Line_Locate_Point(t.geom, ST_ClosestPoint(t.geom, p.geom)) END,
+           ST_Distance(t.geom, p.geom)
+    FROM proches p
+    JOIN itineraires t ON (t.id = p.itineraire);
+END;
+$$ LANGUAGE plpgsql;
+
+
+-------------------------------------------------------------------------------
+-- Keep close objects up-to-date
+-------------------------------------------------------------------------------
+
+DROP TRIGGER IF EXISTS e_t_evenement_proximite_iud_tgr ON e_t_evenement;
+
+CREATE OR REPLACE FUNCTION rando.evenement_proximite_iud() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM o_r_itineraire_proximite
+            WHERE itineraire = OLD.id OR (kind = OLD.kind AND objet = OLD.id);
+    ELSIF NEW.kind = 'TREK' THEN
+        PERFORM ft_itineraire_proximite_refresh(ARRAY[NEW.id], NULL, NULL);
+    ELSIF NEW.kind IN ('POI', 'SERVICE') THEN
+        PERFORM ft_itineraire_proximite_refresh(NULL, NEW.kind, ARRAY[NEW.id]);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER e_t_evenement_proximite_iud_tgr
+AFTER INSERT OR UPDATE OF geom OR DELETE ON e_t_evenement
+FOR EACH ROW EXECUTE PROCEDURE evenement_proximite_iud();
+
+
+-- Trek row is inserted after its topology, and distance depends on practice
+DROP TRIGGER IF EXISTS o_t_itineraire_proximite_iu_tgr ON o_t_itineraire;
+
+CREATE OR REPLACE FUNCTION rando.itineraire_proximite_iu() RETURNS trigger AS $$
+BEGIN
+    PERFORM ft_itineraire_proximite_refresh(ARRAY[NEW.evenement], NULL, NULL);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER o_t_itineraire_proximite_iu_tgr
+AFTER INSERT OR UPDATE OF pratique ON o_t_itineraire
+FOR EACH ROW EXECUTE PROCEDURE itineraire_proximite_iu();
+
+
+DROP TRIGGER IF EXISTS o_b_pratique_proximite_u_tgr ON o_b_pratique;
+
+CREATE OR REPLACE FUNCTION rando.pratique_proximite_u() RETURNS trigger AS $$
+DECLARE
+    treks integer[];
+BEGIN
+    SELECT array_agg(evenement) INTO treks FROM o_t_itineraire WHERE pratique = NEW.id;
+    IF treks IS NOT NULL THEN
+        PERFORM ft_itineraire_proximite_refresh(treks, NULL, NULL);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER o_b_pratique_proximite_u_tgr
+AFTER UPDATE OF distance ON o_b_pratique
+FOR EACH ROW EXECUTE PROCEDURE pratique_proximite_u();
+
+
+-- Touristic contents and events triggers, as well as initial computation,
+-- are in tourism application, migrated after this one.
@@ -1,16 +1,20 @@
+from django.conf import settings
 from django.test import TestCase
 from django.contrib.gis.geos import (LineString, Polygon, MultiPolygon,
                                      MultiLineString)
 from django.core.exceptions import ValidationError
+from django.db import connection
 
 from bs4 import BeautifulSoup
 
 from geotrek.common.tests import TranslationResetMixin
 from geotrek.core.factories import PathFactory, PathAggregationFactory
 from geotrek.zoning.factories import DistrictFactory, CityFactory
+from geotrek.zoning.helpers import flush_zoning
+from geotrek.tourism.factories import TouristicContentFactory, TouristicEventFactory
 from geotrek.trekking.factories import (POIFactory, TrekFactory,
                                         TrekWithPOIsFactory, ServiceFactory)
-from geotrek.trekking.models import Trek, OrderedTrekChild
+from geotrek.trekking.models import Trek, POI, OrderedTrekChild
 
 
 class TrekTest(TranslationResetMixin, TestCase):
@@ -170,6 +174,7 @@ class RelatedObjectsTest(TranslationResetMixin, TestCase):
         self.assertItemsEqual(trek.services, [service])
         self.assertItemsEqual(poi.treks, [trek])
         self.assertItemsEqual(service.treks, [trek])
+        flush_zoning()
         self.assertItemsEqual(trek.districts, [d1])
 
         # Ensure there is no duplicates
@@ -182,6 +187,7 @@ class RelatedObjectsTest(TranslationResetMixin, TestCase):
 
         d2 = DistrictFactory.create(geom=MultiPolygon(
             Polygon(((3, 3), (9, 3), (9, 9), (3, 9), (3, 3)))))
+        flush_zoning()
         self.assertItemsEqual(trek.districts, [d1, d2])
 
     def test_deleted_pois(self):
@@ -238,10 +244,67 @@ class RelatedObjectsTest(TranslationResetMixin, TestCase):
                                                               (-1, 3), (-1, -1)))))
         city2 = CityFactory.create(geom=MultiPolygon(Polygon(((3, 3), (9, 3), (9, 9),
                                                               (3, 9), (3, 3)))))
+        flush_zoning()
         self.assertEqual(trek.cities, [city1, city2])
         self.assertEqual(trek.city_departure, unicode(city1))
 
 
+class ProximityIndexTest(TestCase):
+    def setUp(self):
+        path = PathFactory.create(geom=LineString((0, 0), (1000, 0)))
+        self.trek = TrekFactory.create(no_path=True)
+        self.trek.add_path(path)
+        self.poi = POIFactory.create(no_path=True)
+        self.poi.add_path(path, start=0.5, end=0.5)
+        self.content = TouristicContentFactory.create(geom='SRID=%s;POINT(500 100)' % settings.SRID)
+        self.event = TouristicEventFactory.create(geom='SRID=%s;POINT(900 -100)' % settings.SRID)
+
+    def index_rows(self):
+        cursor = connection.cursor()
+        cursor.execute("SELECT kind, objet FROM o_r_itineraire_proximite WHERE itineraire = %s",
+                       [self.trek.pk])
+        return set(cursor.fetchall())
+
+    def test_index_is_maintained_on_save(self):
+        self.assertEqual(self.index_rows(), set([('POI', self.poi.pk),
+                                                 ('TOURISTICCONTENT', self.content.pk),
+                                                 ('TOURISTICEVENT', self.event.pk)]))
+        self.assertItemsEqual(self.trek.touristic_contents, [self.content])
+        self.assertItemsEqual(self.trek.touristic_events, [self.event])
+
+    def test_index_follows_moved_objects(self):
+        self.content.geom = 'SRID=%s;POINT(500 10000)' % settings.SRID
+        self.content.save()
+        self.assertItemsEqual(self.trek.touristic_contents, [])
+        self.assertItemsEqual(self.content.treks, [])
+
+    def test_index_follows_practice_distance(self):
+        self.trek.practice.distance = 50
+        self.trek.practice.save()
+        self.assertItemsEqual(self.trek.touristic_contents, [])
+        self.trek.practice.distance = 150
+        self.trek.practice.save()
+        self.assertItemsEqual(self.trek.touristic_contents, [self.content])
+
+    def test_index_is_cleaned_on_delete(self):
+        self.content.delete(force=True)
+        self.poi.delete(force=True)
+        self.assertEqual(self.index_rows(), set([('TOURISTICEVENT', self.event.pk)]))
+        self.trek.delete(force=True)
+        self.assertEqual(self.index_rows(), set())
+
+    def test_batch_matches_properties(self):
+        other = TrekFactory.create(no_path=True)
+        other.add_path(PathFactory.create(geom=LineString((0, 5000), (1000, 5000))))
+        treks = [self.trek, other]
+        pois = POI.published_treks_pois(treks)
+        self.assertEqual(pois[self.trek.pk], list(self.trek.published_pois))
+        self.assertEqual(pois[other.pk], [])
+        contents = Trek.close_objects_batch(treks, self.content.__class__, 'TOURISTICCONTENT')
+        self.assertEqual(contents[self.trek.pk], list(self.trek.touristic_contents))
+        self.assertEqual(contents[other.pk], [])
+
+
 class TrekUpdateGeomTest(TestCase):
     def setUp(self):
         self.trek = TrekFactory.create(published=True, geom=LineString(((700000, 6600000), (700100, 6600100)), srid=2154))
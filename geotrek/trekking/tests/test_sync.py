@@ -1,12 +1,23 @@
 import os
 import json
 import mock
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from zipfile import ZipFile
+
+from django.test import TestCase, TransactionTestCase
 from django.core import management
 from django.conf import settings
 from geotrek.common.factories import RecordSourceFactory, TargetPortalFactory
+from geotrek.common.utils.testdata import get_dummy_uploaded_image
+from geotrek.tourism.factories import InformationDeskFactory
 from geotrek.trekking.factories import TrekFactory
 from geotrek.trekking import models as trek_models
+from geotrek.trekking.management.commands.sync_rando import CHECKPOINT_NAME, MANIFEST_NAME, ZipTilesBuilder
+from geotrek.common.utils.tiles import TileStore
 
 
 class SyncTest(TestCase):
@@ -77,3 +88,147 @@ class SyncTest(TestCase):
                                                                   portal__name__in=[self.portal_a.name,
                                                                                     self.portal_b.name, ])
                                                           .distinct('pk').count())
+
+    def test_sync_resume(self):
+        tmp_root = os.path.join(os.path.dirname(settings.SYNC_RANDO_ROOT.rstrip('/')), 'tmp_sync_rando')
+        os.mkdir(tmp_root)
+        with open(os.path.join(tmp_root, CHECKPOINT_NAME), 'w') as f:
+            record = {'fingerprint': '', 'files': [], 'entries': []}
+            f.write(json.dumps({'key': 'trek/en/%s' % self.trek_1.pk, 'record': record}) + '\n')
+            f.write('{"key": "trek/en/')  # interrupted while writing
+        with mock.patch('geotrek.trekking.management.commands.sync_rando.Command.sync_trek') as sync_trek:
+            management.call_command('sync_rando', settings.SYNC_RANDO_ROOT, url='http://localhost:8000',
+                                    skip_tiles=True, skip_pdf=True, languages='en', resume=True, verbosity='0')
+        synced = [args[1].pk for args, kwargs in sync_trek.call_args_list]
+        self.assertNotIn(self.trek_1.pk, synced)
+        self.assertIn(self.trek_2.pk, synced)
+        self.assertFalse(os.path.exists(tmp_root))
+        self.assertFalse(os.path.exists(os.path.join(settings.SYNC_RANDO_ROOT, CHECKPOINT_NAME)))
+
+    def test_sync_reuses_unchanged_treks(self):
+        options = dict(url='http://localhost:8000', skip_tiles=True, skip_pdf=True,
+                       skip_profile_png=True, languages='en', verbosity='0')
+        with mock.patch('geotrek.trekking.models.Trek.prepare_map_image'):
+            management.call_command('sync_rando', settings.SYNC_RANDO_ROOT, **options)
+        self.assertTrue(os.path.exists(os.path.join(settings.SYNC_RANDO_ROOT, MANIFEST_NAME)))
+        gpx = os.path.join(settings.SYNC_RANDO_ROOT, 'api', 'en', 'treks', str(self.trek_1.pk),
+                           '%s.gpx' % self.trek_1.slug)
+        self.assertTrue(os.path.exists(gpx))
+
+        self.trek_2.save()
+        with mock.patch('geotrek.trekking.management.commands.sync_rando.Command.sync_trek') as sync_trek:
+            management.call_command('sync_rando', settings.SYNC_RANDO_ROOT, **options)
+        synced = [args[1].pk for args, kwargs in sync_trek.call_args_list]
+        self.assertEqual(synced, [self.trek_2.pk])
+        # Files of unchanged treks were copied from previous sync
+        self.assertTrue(os.path.exists(gpx))
+
+
+class SyncJobsTest(TransactionTestCase):
+    """ Workers read data with their own database connection """
+    def setUp(self):
+        self.desk = InformationDeskFactory.create(photo=get_dummy_uploaded_image())
+        self.treks = [TrekFactory.create(published=True) for i in range(4)]
+        for trek in self.treks:
+            trek.information_desks.add(self.desk)
+
+    def test_shared_files_are_complete_in_zips(self):
+        with mock.patch('geotrek.trekking.models.Trek.prepare_map_image'):
+            management.call_command('sync_rando', settings.SYNC_RANDO_ROOT, url='http://localhost:8000',
+                                    skip_tiles=True, skip_pdf=True, skip_profile_png=True,
+                                    languages='en', jobs=2, verbosity='0')
+        thumbnail = self.desk.thumbnail
+        arcname = os.path.join(settings.MEDIA_URL.strip('/'), thumbnail.name)
+        with open(os.path.join(settings.SYNC_RANDO_ROOT, arcname), 'rb') as f:
+            content = f.read()
+        self.assertEqual(content, open(os.path.join(settings.MEDIA_ROOT, thumbnail.name), 'rb').read())
+        for trek in self.treks:
+            zipname = os.path.join(settings.SYNC_RANDO_ROOT, 'zip', 'treks', 'en', '%s.zip' % trek.pk)
+            self.assertEqual(ZipFile(zipname).read(arcname), content)
+        # No temporary copy left
+        for root, dirs, files in os.walk(settings.SYNC_RANDO_ROOT):
+            self.assertFalse([name for name in files if name.endswith('.tmp')])
+
+
+class TileServer(ThreadingMixIn, HTTPServer):
+    """ Stand-in tile server: tiles of a zoom level have the same content,
+    tiles with y = 9 are missing.
+    """
+    daemon_threads = True
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.server.requests.append(self.path)
+            z, x, y = self.path.strip('/').split('.')[0].split('/')
+            if y == '9':
+                self.send_error(404)
+                return
+            body = 'tile-%s' % z
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), self.Handler)
+        self.requests = []
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s/{z}/{x}/{y}.png' % self.server_address[1]
+
+
+class ZipTilesBuilderTest(TestCase):
+    def setUp(self):
+        self.server = TileServer()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.tmp = tempfile.mkdtemp()
+        self.store = TileStore(os.path.join(self.tmp, 'store'))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp)
+
+    def build(self, name, tiles):
+        filepath = os.path.join(self.tmp, name)
+        builder = ZipTilesBuilder(filepath, lambda zipfile: zipfile.close(), store=self.store, workers=4,
+                                  tiles_url=self.server.url, tiles_dir=self.tmp)
+        builder.tiles = set(tiles)
+        builder.run()
+        return ZipFile(filepath)
+
+    def test_tiles_are_zipped_from_store(self):
+        zipfile = self.build('1.zip', [(10, x, y) for x in range(3) for y in range(3)])
+        self.assertEqual(len(zipfile.namelist()), 9)
+        self.assertEqual(zipfile.read('10/2/1.png'), 'tile-10')
+        self.assertEqual(self.store.read((10, 2, 1)), 'tile-10')
+        self.assertEqual(len(self.server.requests), 9)
+
+    def test_shared_tiles_are_downloaded_once(self):
+        self.build('1.zip', [(10, x, 0) for x in range(4)])
+        zipfile = self.build('2.zip', [(10, x, 0) for x in range(2, 6)])
+        self.assertEqual(sorted(zipfile.namelist()), ['10/2/0.png', '10/3/0.png', '10/4/0.png', '10/5/0.png'])
+        self.assertEqual(len(self.server.requests), 6)
+
+    def test_identical_contents_are_stored_once(self):
+        self.build('1.zip', [(10, x, 0) for x in range(4)] + [(11, 0, 0)])
+        objects = [name for path, dirs, names in os.walk(os.path.join(self.tmp, 'store', 'objects'))
+                   for name in names]
+        self.assertEqual(len(objects), 2)
+
+    def test_missing_tiles_are_skipped(self):
+        with mock.patch('landez.sources.DOWNLOAD_RETRIES', 1):
+            zipfile = self.build('1.zip', [(10, 0, 8), (10, 0, 9)])
+            self.assertEqual(zipfile.namelist(), ['10/0/8.png'])
+            self.assertIn((10, 0, 9), self.store.failed)
+            # Not tried again by next packages
+            requests = len(self.server.requests)
+            self.build('2.zip', [(10, 0, 9)])
+            self.assertEqual(len(self.server.requests), requests)
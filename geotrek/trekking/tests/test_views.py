@@ -17,7 +17,7 @@ from django.core.urlresolvers import reverse
 from django.db import connection, connections, DEFAULT_DB_ALIAS
 from django.template.loader import find_template
 from django.test import RequestFactory
-from django.test.utils import override_settings
+from django.test.utils import override_settings, CaptureQueriesContext
 from django.utils import translation
 from django.utils.timezone import utc, make_aware
 from django.utils.unittest import util as testutil
@@ -29,11 +29,13 @@ from geotrek.authent.models import default_structure
 from geotrek.common.factories import (AttachmentFactory, ThemeFactory,
                                       RecordSourceFactory, TargetPortalFactory)
 from geotrek.common.tests import CommonTest, TranslationResetMixin
+from geotrek.common.utils import prefetch_geojson
 from geotrek.common.utils.testdata import get_dummy_uploaded_image
 from geotrek.authent.factories import TrekkingManagerFactory, StructureFactory, UserProfileFactory
 from geotrek.authent.tests.base import AuthentFixturesTest
 from geotrek.core.factories import PathFactory
 from geotrek.zoning.factories import DistrictFactory, CityFactory
+from geotrek.zoning.helpers import flush_zoning
 from geotrek.trekking.models import POI, Trek, Service, OrderedTrekChild
 from geotrek.trekking.factories import (POIFactory, POITypeFactory, TrekFactory, TrekWithPOIsFactory,
                                         TrekNetworkFactory, WebLinkFactory, AccessibilityFactory,
@@ -130,6 +132,7 @@ class POIJSONDetailTest(TrekkingManagerTest):
         tourism_factories.TouristicEventFactory(geom='SRID=%s;POINT(702000 6602000)' % settings.SRID,
                                                 published=True)  # too far
 
+        flush_zoning()
         self.pk = self.poi.pk
         url = '/api/en/pois/%s.json' % self.pk
         self.response = self.client.get(url)
@@ -500,6 +503,7 @@ class TrekJSONDetailTest(TrekkingManagerTest):
         OrderedTrekChild(parent=self.trek, child=self.child2, order=2).save()
         OrderedTrekChild(parent=self.parent, child=self.sibling, order=1).save()
 
+        flush_zoning()
         self.pk = self.trek.pk
         url = '/api/en/treks/{pk}.json'.format(pk=self.pk)
         self.response = self.client.get(url)
@@ -706,6 +710,114 @@ class TrekJSONDetailTest(TrekkingManagerTest):
         self.assertDictEqual(self.result['next'],
                              {u"%s" % self.parent.pk: self.sibling.pk})
 
+    def test_previous_next_of_child_without_its_parent(self):
+        # Sibling (order 1) is prefetched without its parent nor first sibling
+        sibling = Trek.objects.get(pk=self.sibling.pk)
+        Trek.prefetch_serialized_relations([sibling])
+        self.assertEqual(sibling.previous_id, {self.parent.pk: self.trek.pk})
+        self.assertEqual(sibling.next_id, {self.parent.pk: None})
+        self.assertEqual(sibling.previous_id, Trek.objects.get(pk=self.sibling.pk).previous_id)
+
+    def test_prefetched_relations(self):
+        def relations(trek):
+            # Ordering of close objects with same name is not defined
+            return (trek.children_id, trek.parents_id, trek.previous_id, trek.next_id,
+                    set(trek.published_relationships), set(trek.published_treks),
+                    set(trek.published_touristic_contents), set(trek.published_touristic_events),
+                    trek.pictures, list(trek.videos), list(trek.files))
+
+        pks = [self.trek.pk, self.trek_b.pk, self.child1.pk, self.sibling.pk]
+        expected = [relations(trek) for trek in Trek.objects.filter(pk__in=pks).order_by('pk')]
+        treks = list(Trek.objects.filter(pk__in=pks).order_by('pk'))
+        Trek.prefetch_serialized_relations(treks)
+        with self.assertNumQueries(0):
+            self.assertEqual([relations(trek) for trek in treks], expected)
+
+
+class TrekJSONListTest(TrekkingManagerTest):
+    def create_treks(self, count):
+        parent = TrekFactory.create(published=True)
+        for i in range(count):
+            trek = TrekFactory.create(published=True)
+            OrderedTrekChild(parent=parent, child=trek, order=i).save()
+            AttachmentFactory.create(obj=trek, attachment_file=get_dummy_uploaded_image())
+            tourism_factories.TouristicContentFactory(published=True)
+
+    def test_number_of_queries_does_not_depend_on_treks(self):
+        self.create_treks(2)
+        # Content is streamed, hence queried when read
+        with CaptureQueriesContext(connection) as few:
+            ''.join(self.client.get('/api/en/treks.geojson').streaming_content)
+        self.create_treks(8)
+        with CaptureQueriesContext(connection) as many:
+            content = ''.join(self.client.get('/api/en/treks.geojson').streaming_content)
+        self.assertEqual(len(json.loads(content)['features']), 12)
+        self.assertEqual(len(few), len(many))
+
+    def test_geojson_list_is_streamed_by_chunks(self):
+        self.create_treks(6)
+        with mock.patch.object(trekking_views.TrekViewSet, 'chunk_size', 3):
+            response = self.client.get('/api/en/treks.geojson')
+            self.assertTrue(response.streaming)
+            chunks = list(response.streaming_content)
+        collection = json.loads(''.join(chunks))
+        self.assertEqual(collection['type'], 'FeatureCollection')
+        pks = [feature['id'] for feature in collection['features']]
+        self.assertEqual(pks, list(Trek.objects.filter(published=True).values_list('pk', flat=True)))
+        # Opening, 7 features and closing
+        self.assertEqual(len(chunks), 9)
+
+    def test_json_list_is_not_streamed(self):
+        self.create_treks(1)
+        response = self.client.get('/api/en/treks.json')
+        self.assertFalse(response.streaming)
+        self.assertEqual(len(json.loads(response.content)), 2)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    'fat': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'geojson-tests'},
+})
+class TrekGeoJSONOptionsTest(TrekkingManagerTest):
+    def setUp(self):
+        # Zigzag of 1m every 10m
+        coords = [(700000 + 10 * i, 6600000 + i % 2) for i in range(101)]
+        path = PathFactory.create(geom=LineString(coords, srid=settings.SRID))
+        self.trek = TrekFactory.create(published=True, no_path=True)
+        self.trek.add_path(path)
+
+    def get_geometry(self, params=''):
+        response = self.client.get('/api/en/treks.geojson' + params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(''.join(response.streaming_content))['features'][0]['geometry']
+
+    def test_full_geometry_by_default(self):
+        self.assertEqual(len(self.get_geometry()['coordinates']), 101)
+
+    def test_geometry_is_simplified_for_zoom(self):
+        geometry = self.get_geometry('?zoom=10')
+        self.assertEqual(geometry['type'], 'LineString')
+        self.assertEqual(len(geometry['coordinates']), 2)
+        self.assertEqual(len(self.get_geometry('?zoom=20')['coordinates']), 101)
+
+    def test_coordinates_are_rounded(self):
+        geometry = self.get_geometry('?precision=4')
+        for x, y in geometry['coordinates']:
+            self.assertEqual(round(x, 4), x)
+            self.assertEqual(round(y, 4), y)
+
+    def test_invalid_options(self):
+        self.assertEqual(self.client.get('/api/en/treks.geojson?zoom=a').status_code, 400)
+        self.assertEqual(self.client.get('/api/en/treks.geojson?precision=-1').status_code, 400)
+
+    def test_geometries_are_cached_until_update(self):
+        prefetch_geojson([self.trek], zoom=10)
+        with self.assertNumQueries(0):
+            prefetch_geojson([self.trek], zoom=10)
+        self.trek.date_update += datetime.timedelta(seconds=1)
+        with self.assertNumQueries(1):
+            prefetch_geojson([self.trek], zoom=10)
+
 
 class TrekPointsReferenceTest(TrekkingManagerTest):
     def setUp(self):
@@ -787,6 +899,58 @@ class TrekGPXTest(TrekkingManagerTest):
         self.assertEqual(elevation, '42.0')
 
 
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    'fat': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'exports-tests'},
+})
+class TrekExportCacheTest(TrekkingManagerTest):
+    def setUp(self):
+        self.trek = TrekWithPOIsFactory.create(published=True)
+        self.url = '/api/en/treks/{pk}/slug.kml'.format(pk=self.trek.pk)
+
+    def test_export_is_rendered_once(self):
+        first = self.client.get(self.url)
+        with mock.patch.object(Trek, 'kml') as kml:
+            second = self.client.get(self.url)
+            self.assertFalse(kml.called)
+        self.assertEqual(first.content, second.content)
+
+    def test_trek_is_fetched_once(self):
+        with mock.patch('geotrek.trekking.views.PublicOrReadPermMixin.get_object',
+                        autospec=True, return_value=self.trek) as get_object:
+            response = self.client.get('/api/en/treks/{pk}/slug.gpx'.format(pk=self.trek.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_object.call_count, 1)
+
+    def test_unchanged_export_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_export_changes_with_pois(self):
+        etag = self.client.get(self.url)['ETag']
+        poi = self.trek.pois.all()[0]
+        poi.name = u"Renamed POI"
+        poi.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Renamed POI', response.content)
+
+    def test_export_depends_on_language(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get('/api/fr/treks/{pk}/slug.kml'.format(pk=self.trek.pk), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_gpx_export(self):
+        url = '/api/en/treks/{pk}/slug.gpx'.format(pk=self.trek.pk)
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=%s.gpx' % self.trek.slug)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
 class TrekViewTranslationTest(TrekkingManagerTest):
     def setUp(self):
         self.trek = TrekFactory.build()
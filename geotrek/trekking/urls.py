@@ -12,7 +12,7 @@ from .views import (
     TrekGPXDetail, TrekKMLDetail, WebLinkCreatePopup,
     CirkwiTrekView, CirkwiPOIView, TrekPOIViewSet,
     SyncRandoRedirect, TrekServiceViewSet, sync_view,
-    sync_update_json
+    sync_update_json, TrekVectorTile
 )
 from . import serializers as trekking_serializers
 
@@ -30,6 +30,7 @@ urlpatterns = patterns(
     url(r'^commands/syncview$', sync_view, name='sync_randos_view'),
     url(r'^commands/statesync/$', sync_update_json, name='sync_randos_state'),
     url(r'^image/trek-(?P<pk>\d+)-(?P<lang>\w\w).png$', TrekMapImage.as_view(), name='trek_map_image'),
+    url(r'^api/tiles/treks/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.pbf$', TrekVectorTile.as_view(), name='trek_tiles'),
 )
 
 
@@ -1,9 +1,12 @@
 from datetime import datetime, timedelta
+import hashlib
 import json
 import redis
+from StringIO import StringIO
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.core.cache import get_cache
 from django.db.models import Q
 from django.http import HttpResponse, Http404
 from django.shortcuts import render_to_response
@@ -12,23 +15,27 @@ from django.utils import translation
 from django.utils.decorators import method_decorator
 from django.utils.html import escape
 from django.views.generic import CreateView, ListView, RedirectView
+from django.views.decorators.http import condition
 from django.views.generic.detail import BaseDetailView
 from djcelery.models import TaskMeta
 from mapentity.helpers import alphabet_enumeration
 from mapentity.views import (MapEntityLayer, MapEntityList, MapEntityJsonList,
                              MapEntityFormat, MapEntityDetail, MapEntityMapImage,
                              MapEntityDocument, MapEntityCreate, MapEntityUpdate,
-                             MapEntityDelete, LastModifiedMixin, MapEntityViewSet)
+                             MapEntityDelete, MapEntityViewSet)
 from paperclip.models import Attachment
 from rest_framework import permissions as rest_permissions, viewsets
 from rest_framework_gis.serializers import GeoFeatureModelSerializer
 
 from geotrek.authent.decorators import same_structure_required
 from geotrek.common.models import RecordSource, TargetPortal
-from geotrek.common.views import FormsetMixin, PublicOrReadPermMixin, DocumentPublic
+from geotrek.common.utils import prefetch_with
+from geotrek.common.views import (FormsetMixin, PublicOrReadPermMixin, DocumentPublic, GeoJSONOptionsMixin,
+                                  StreamingGeoJSONMixin, VectorTileView)
 from geotrek.core.models import AltimetryMixin
 from geotrek.core.views import CreateFromTopologyMixin
 from geotrek.trekking.forms import SyncRandoForm
+from geotrek.zoning.helpers import prefetch_zoning
 from geotrek.zoning.models import District, City, RestrictedArea
 from geotrek.celery import app as celery_app
 
@@ -96,6 +103,12 @@ class TrekLayer(MapEntityLayer):
     queryset = Trek.objects.existing()
 
 
+class TrekVectorTile(VectorTileView):
+    queryset = Trek.objects.existing()
+    layer = 'treks'
+    properties = ['name', 'published']
+
+
 class TrekList(FlattenPicturesMixin, MapEntityList):
     queryset = Trek.objects.existing()
     filterform = TrekFilterSet
@@ -107,6 +120,7 @@ class TrekJsonList(MapEntityJsonList, TrekList):
 
 
 class TrekFormatList(MapEntityFormat, TrekList):
+    queryset = prefetch_with(Trek.objects.existing(), prefetch_zoning)
     columns = [
         'id', 'eid', 'eid2', 'name', 'departure', 'arrival', 'duration',
         'duration_pretty', 'description', 'description_teaser',
@@ -120,27 +134,79 @@ class TrekFormatList(MapEntityFormat, TrekList):
     ] + AltimetryMixin.COLUMNS
 
 
-class TrekGPXDetail(LastModifiedMixin, PublicOrReadPermMixin, BaseDetailView):
+class TrekExportMixin(PublicOrReadPermMixin):
+    """
+    Rendered exports are kept in ``fat`` cache, keyed by trek, language and
+    modification dates of trek and its POIs, which are also used for
+    conditional requests (ETag and Last-Modified). Exports are rendered by
+    the trek method named after ``export_name``, unless ``render_export()``
+    is overridden.
+    """
     queryset = Trek.objects.existing()
+    content_type = None
+    export_name = None
 
-    def render_to_response(self, context):
-        gpx_serializer = TrekGPXSerializer()
-        response = HttpResponse(mimetype='application/gpx+xml')
-        response['Content-Disposition'] = 'attachment; filename=%s.gpx' % self.get_object().slug
-        gpx_serializer.serialize([self.get_object()], stream=response, geom_field='geom')
-        return response
+    def get_object(self, queryset=None):
+        """ Trek is fetched once, for conditional checks and rendering
+        """
+        if getattr(self, 'object', None) is None:
+            self.object = super(TrekExportMixin, self).get_object(queryset)
+        return self.object
 
+    def fingerprint(self):
+        """ Latest modification of trek and its POIs, and ETag of export
+        """
+        if not hasattr(self, '_fingerprint'):
+            trek = self.get_object()
+            dates = [trek.date_update] + list(trek.pois.order_by().values_list('date_update', flat=True))
+            dates = [date for date in dates if date is not None]
+            etag = hashlib.md5('%s_%s_%s_%s' % (self.export_name, trek.pk, translation.get_language(),
+                                                ','.join([d.isoformat() for d in sorted(dates)]))).hexdigest()
+            self._fingerprint = (max(dates), etag)
+        return self._fingerprint
 
-class TrekKMLDetail(LastModifiedMixin, PublicOrReadPermMixin, BaseDetailView):
-    queryset = Trek.objects.existing()
+    def dispatch(self, *args, **kwargs):
+        @condition(etag_func=lambda request, *args, **kwargs: self.fingerprint()[1],
+                   last_modified_func=lambda request, *args, **kwargs: self.fingerprint()[0])
+        def _dispatch(*args, **kwargs):
+            return super(TrekExportMixin, self).dispatch(*args, **kwargs)
+        return _dispatch(*args, **kwargs)
+
+    def render_export(self, trek):
+        return getattr(trek, self.export_name)()
 
     def render_to_response(self, context):
         trek = self.get_object()
-        response = HttpResponse(trek.kml(),
-                                content_type='application/vnd.google-earth.kml+xml')
+        cache = get_cache('fat')
+        key = 'trek_export_%s' % self.fingerprint()[1]
+        content = cache.get(key)
+        if content is None:
+            content = self.render_export(trek)
+            cache.set(key, content)
+        return HttpResponse(content, content_type=self.content_type)
+
+
+class TrekGPXDetail(TrekExportMixin, BaseDetailView):
+    content_type = 'application/gpx+xml'
+    export_name = 'gpx'
+
+    def render_export(self, trek):
+        stream = StringIO()
+        gpx_serializer = TrekGPXSerializer()
+        gpx_serializer.serialize([trek], stream=stream, geom_field='geom')
+        return stream.getvalue()
+
+    def render_to_response(self, context):
+        response = super(TrekGPXDetail, self).render_to_response(context)
+        response['Content-Disposition'] = 'attachment; filename=%s.gpx' % self.get_object().slug
         return response
 
 
+class TrekKMLDetail(TrekExportMixin, BaseDetailView):
+    content_type = 'application/vnd.google-earth.kml+xml'
+    export_name = 'kml'
+
+
 class TrekDetail(MapEntityDetail):
     queryset = Trek.objects.existing()
 
@@ -369,7 +435,7 @@ class WebLinkCreatePopup(CreateView):
         """ % (escape(form.instance._get_pk_val()), escape(form.instance)))
 
 
-class TrekViewSet(MapEntityViewSet):
+class TrekViewSet(StreamingGeoJSONMixin, GeoJSONOptionsMixin, MapEntityViewSet):
     model = Trek
     serializer_class = TrekSerializer
     permission_classes = [rest_permissions.DjangoModelPermissionsOrAnonReadOnly]
@@ -387,19 +453,24 @@ class TrekViewSet(MapEntityViewSet):
 
         qs = qs.transform(settings.API_SRID, field_name='geom')
 
-        return qs
+        # Relations of the whole page are fetched at once for serializer
+        qs = qs.select_related('difficulty', 'route', 'practice', 'structure')
+        qs = qs.prefetch_related('networks', 'themes', 'accessibilities', 'web_links__category',
+                                 'information_desks__type', 'source', 'portal')
+        return prefetch_with(qs, prefetch_zoning, Trek.prefetch_serialized_relations)
 
 
-class POIViewSet(MapEntityViewSet):
+class POIViewSet(GeoJSONOptionsMixin, MapEntityViewSet):
     model = POI
     serializer_class = POISerializer
     permission_classes = [rest_permissions.DjangoModelPermissionsOrAnonReadOnly]
 
     def get_queryset(self):
-        return POI.objects.existing().filter(published=True).transform(settings.API_SRID, field_name='geom')
+        qs = POI.objects.existing().filter(published=True).transform(settings.API_SRID, field_name='geom')
+        return prefetch_with(qs, prefetch_zoning)
 
 
-class TrekPOIViewSet(viewsets.ModelViewSet):
+class TrekPOIViewSet(GeoJSONOptionsMixin, viewsets.ModelViewSet):
     model = POI
     permission_classes = [rest_permissions.DjangoModelPermissionsOrAnonReadOnly]
 
@@ -471,7 +542,7 @@ class ServiceDelete(MapEntityDelete):
         return super(ServiceDelete, self).dispatch(*args, **kwargs)
 
 
-class ServiceViewSet(MapEntityViewSet):
+class ServiceViewSet(GeoJSONOptionsMixin, MapEntityViewSet):
     model = Service
     serializer_class = ServiceSerializer
     permission_classes = [rest_permissions.DjangoModelPermissionsOrAnonReadOnly]
@@ -480,7 +551,7 @@ class ServiceViewSet(MapEntityViewSet):
         return Service.objects.existing().filter(type__published=True).transform(settings.API_SRID, field_name='geom')
 
 
-class TrekServiceViewSet(viewsets.ModelViewSet):
+class TrekServiceViewSet(GeoJSONOptionsMixin, viewsets.ModelViewSet):
     model = Service
     permission_classes = [rest_permissions.DjangoModelPermissionsOrAnonReadOnly]
 
@@ -0,0 +1,107 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+
+@contextmanager
+def skip_zoning_triggers():
+    """
+    Prevent triggers from linking land layers objects to paths one at a time,
+    while a layer is loaded. Edges have to be recomputed with ``recompute_edges()``.
+
+    Setting is kept for the session, since loaded objects may be saved in
+    several transactions.
+    """
+    cursor = connection.cursor()
+    cursor.execute("SET geotrek.skip_zoning_triggers = 'on'")
+    try:
+        yield
+    finally:
+        cursor.execute("SET geotrek.skip_zoning_triggers = 'off'")
+
+
+def recompute_edges(model):
+    """
+    Replace all edges of ``model`` (``CityEdge``, ``DistrictEdge`` or
+    ``RestrictedAreaEdge``) with one statement per table. Returns the number
+    of edges created.
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT lien_auto_couche_sig_recompute(%s)", [model.KIND])
+    return cursor.fetchone()[0]
+
+
+ZONING_KINDS = (('CITYEDGE', 'cities'),
+                ('DISTRICTEDGE', 'districts'),
+                ('RESTRICTEDAREAEDGE', 'areas'))
+
+
+def flush_zoning():
+    """
+    Compute zoning of topologies modified in the current transaction, which
+    is otherwise done at commit. Returns the number of topologies computed.
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT ft_evenements_zonage_flush()")
+    return cursor.fetchone()[0]
+
+
+def zoning_of(pks):
+    """
+    Cities, districts and restricted areas of the specified topologies, in
+    order of progression along them, as ``{pk: {'cities': [...], ...}}``.
+
+    They are read from the table maintained in database, with one query. Zoning
+    of topologies modified in the current transaction is computed at commit,
+    see ``flush_zoning()``.
+    """
+    from .models import City, District, RestrictedArea
+
+    pks = list(pks)
+    result = dict([(pk, dict([(attrname, []) for kind, attrname in ZONING_KINDS])) for pk in pks])
+    if len(pks) == 0:
+        return result
+
+    cursor = connection.cursor()
+    cursor.execute("""SELECT evenement, kind, zone FROM e_r_evenement_zonage
+                      WHERE evenement = ANY(%s)
+                      ORDER BY evenement, rang, zone""", [pks])
+    rows = cursor.fetchall()
+
+    models = {'CITYEDGE': City, 'DISTRICTEDGE': District, 'RESTRICTEDAREAEDGE': RestrictedArea}
+    objects = {}
+    for kind, model in models.items():
+        zone_pks = set([model._meta.pk.to_python(zone) for evenement, k, zone in rows if k == kind])
+        objects[kind] = model.objects.in_bulk(zone_pks) if zone_pks else {}
+
+    attrnames = dict(ZONING_KINDS)
+    for evenement, kind, zone in rows:
+        obj = objects[kind].get(models[kind]._meta.pk.to_python(zone))
+        if obj is not None:
+            result[evenement][attrnames[kind]].append(obj)
+    return result
+
+
+def prefetch_zoning(topologies):
+    """
+    Fetch cities, districts and restricted areas of many topologies at once,
+    instead of three queries per topology. See ``prefetch_with()``.
+    """
+    if not settings.TREKKING_TOPOLOGY_ENABLED:
+        return
+    zoning = zoning_of([topology.pk for topology in topologies])
+    for topology in topologies:
+        topology._zoning = zoning[topology.pk]
+
+
+def topology_zoning(topology, attrname):
+    """
+    ``cities``, ``districts`` or ``areas`` of a topology, prefetched or not.
+    """
+    zoning = getattr(topology, '_zoning', None)
+    if zoning is None:
+        if topology.pk is None:
+            return []
+        zoning = zoning_of([topology.pk])[topology.pk]
+    return zoning[attrname]
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from geotrek.zoning.helpers import recompute_edges
+from geotrek.zoning.models import CityEdge, DistrictEdge, RestrictedAreaEdge
+
+
+LAYERS = {
+    'city': CityEdge,
+    'district': DistrictEdge,
+    'restrictedarea': RestrictedAreaEdge,
+}
+
+
+class Command(BaseCommand):
+    args = '[city|district|restrictedarea ...]'
+    help = 'Recompute links between paths and land layers (all layers by default)\n'
+    can_import_settings = True
+
+    def handle(self, *args, **options):
+        for name in args:
+            if name not in LAYERS:
+                raise CommandError('Unknown layer: %s' % name)
+
+        for name in args or sorted(LAYERS.keys()):
+            with transaction.atomic():
+                count = recompute_edges(LAYERS[name])
+            if int(options['verbosity']) > 0:
+                self.stdout.write('%s: %s edges created' % (name, count))
@@ -14,6 +14,7 @@ from geotrek.common.utils import uniquify, intersecting
 from geotrek.core.models import Topology, Path
 from geotrek.maintenance.models import Intervention, Project
 from geotrek.tourism.models import TouristicContent, TouristicEvent
+from geotrek.zoning.helpers import topology_zoning
 
 
 class RestrictedAreaType(models.Model):
@@ -85,7 +86,7 @@ if settings.TREKKING_TOPOLOGY_ENABLED:
     Path.add_property('area_edges', RestrictedAreaEdge.path_area_edges, _(u"Restricted area edges"))
     Path.add_property('areas', lambda self: uniquify(map(attrgetter('restricted_area'), self.area_edges)), _(u"Restricted areas"))
     Topology.add_property('area_edges', RestrictedAreaEdge.topology_area_edges, _(u"Restricted area edges"))
-    Topology.add_property('areas', lambda self: uniquify(map(attrgetter('restricted_area'), self.area_edges)), _(u"Restricted areas"))
+    Topology.add_property('areas', lambda self: topology_zoning(self, 'areas'), _(u"Restricted areas"))
     Intervention.add_property('area_edges', lambda self: self.topology.area_edges if self.topology else [], _(u"Restricted area edges"))
     Intervention.add_property('areas', lambda self: self.topology.areas if self.topology else [], _(u"Restricted areas"))
     Project.add_property('area_edges', lambda self: self.edges_by_attr('area_edges'), _(u"Restricted area edges"))
@@ -145,7 +146,7 @@ if settings.TREKKING_TOPOLOGY_ENABLED:
     Path.add_property('city_edges', CityEdge.path_city_edges, _(u"City edges"))
     Path.add_property('cities', lambda self: uniquify(map(attrgetter('city'), self.city_edges)), _(u"Cities"))
     Topology.add_property('city_edges', CityEdge.topology_city_edges, _(u"City edges"))
-    Topology.add_property('cities', lambda self: uniquify(map(attrgetter('city'), self.city_edges)), _(u"Cities"))
+    Topology.add_property('cities', lambda self: topology_zoning(self, 'cities'), _(u"Cities"))
     Intervention.add_property('city_edges', lambda self: self.topology.city_edges if self.topology else [], _(u"City edges"))
     Intervention.add_property('cities', lambda self: self.topology.cities if self.topology else [], _(u"Cities"))
     Project.add_property('city_edges', lambda self: self.edges_by_attr('city_edges'), _(u"City edges"))
@@ -203,7 +204,7 @@ if settings.TREKKING_TOPOLOGY_ENABLED:
     Path.add_property('district_edges', DistrictEdge.path_district_edges, _(u"District edges"))
     Path.add_property('districts', lambda self: uniquify(map(attrgetter('district'), self.district_edges)), _(u"Districts"))
     Topology.add_property('district_edges', DistrictEdge.topology_district_edges, _(u"District edges"))
-    Topology.add_property('districts', lambda self: uniquify(map(attrgetter('district'), self.district_edges)), _(u"Districts"))
+    Topology.add_property('districts', lambda self: topology_zoning(self, 'districts'), _(u"Districts"))
     Intervention.add_property('district_edges', lambda self: self.topology.district_edges if self.topology else [], _(u"District edges"))
     Intervention.add_property('districts', lambda self: self.topology.districts if self.topology else [], _(u"Districts"))
     Project.add_property('district_edges', lambda self: self.edges_by_attr('district_edges'), _(u"District edges"))
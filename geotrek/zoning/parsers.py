@@ -4,19 +4,27 @@ from django.contrib.gis.geos import MultiPolygon
 from django.utils.translation import ugettext as _
 
 from geotrek.common.parsers import ShapeParser
-from geotrek.zoning.models import City
+from geotrek.zoning.helpers import skip_zoning_triggers, recompute_edges
+from geotrek.zoning.models import City, CityEdge
 
 
 # Data: https://www.data.gouv.fr/fr/datasets/decoupage-administratif-communal-francais-issu-d-openstreetmap/
 class CityParser(ShapeParser):
     model = City
     eid = 'code'
+    batch_size = 500
     fields = {
         'code': 'insee',
         'name': 'nom',
         'geom': 'geom',
     }
 
+    def parse(self, filename=None, limit=None):
+        # Link cities to paths at once, instead of one city after the other
+        with skip_zoning_triggers():
+            super(CityParser, self).parse(filename, limit)
+        recompute_edges(CityEdge)
+
     def filter_code(self, src, val):
         return unicode(val)
 
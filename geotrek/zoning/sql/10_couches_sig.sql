@@ -41,6 +41,11 @@ DECLARE
     tab varchar;
     eid integer;
 BEGIN
+    -- Layers evenements are being recomputed at once (see lien_auto_couche_sig_recompute())
+    IF ft_setting_enabled('geotrek.skip_zoning_triggers') THEN
+        RETURN NULL;
+    END IF;
+
     FOREACH tab IN ARRAY ARRAY[['f_t_commune', 'f_t_secteur', 'f_t_zonage']]
     LOOP
         -- Delete related object in association tables
@@ -74,6 +79,11 @@ DROP TRIGGER IF EXISTS zonage_troncons_d_tgr ON f_t_zonage;
 
 CREATE OR REPLACE FUNCTION zonage.nettoyage_auto_couches_sig_d() RETURNS trigger AS $$
 BEGIN
+    -- Layers evenements are being recomputed at once (see lien_auto_couche_sig_recompute())
+    IF ft_setting_enabled('geotrek.skip_zoning_triggers') THEN
+        RETURN NULL;
+    END IF;
+
     DELETE FROM e_r_evenement_troncon WHERE evenement = OLD.evenement;
     DELETE FROM e_t_evenement WHERE id = OLD.evenement;
     RETURN NULL;
@@ -106,6 +116,11 @@ DECLARE
     tab varchar;
     eid integer;
 BEGIN
+    -- Bulk insertions are linked all at once (see lien_auto_troncons_couches_sig())
+    IF ft_setting_enabled('geotrek.skip_path_triggers') THEN
+        RETURN NULL;
+    END IF;
+
     -- Remove obsolete evenement
     IF TG_OP = 'UPDATE' THEN
         -- Related evenement/zonage/secteur/commune will be cleared by another trigger
@@ -150,6 +165,111 @@ AFTER INSERT OR UPDATE OF geom ON l_t_troncon
 FOR EACH ROW EXECUTE PROCEDURE lien_auto_troncon_couches_sig_iu();
 
 
+-------------------------------------------------------------------------------
+-- Set-based sync of Troncons and Commune/Zonage/Secteur
+-------------------------------------------------------------------------------
+
+-- Layer table, layer id, association table, association column, for each kind
+CREATE OR REPLACE FUNCTION zonage.couche_sig(kind varchar) RETURNS varchar[] AS $$
+SELECT CASE $1
+    WHEN 'CITYEDGE' THEN ARRAY['l_commune', 'insee', 'f_t_commune', 'commune']
+    WHEN 'DISTRICTEDGE' THEN ARRAY['l_secteur', 'id', 'f_t_secteur', 'secteur']
+    WHEN 'RESTRICTEDAREAEDGE' THEN ARRAY['l_zonage_reglementaire', 'id', 'f_t_zonage', 'zone']
+END::varchar[];
+$$ LANGUAGE sql IMMUTABLE;
+
+
+-- Link Troncons (all of them if NULL) to a layer, with one statement.
+-- Evenement ids are drawn beforehand, to insert the three tables at once, and
+-- geometries are computed here instead of by triggers.
+CREATE OR REPLACE FUNCTION zonage.lien_auto_couche_sig_troncons(kind varchar, troncons integer[]) RETURNS integer AS $$
+DECLARE
+    layer varchar[];
+    skipped boolean;
+    t_count integer;
+BEGIN
+    layer := couche_sig(kind);
+    skipped := ft_setting_enabled('geotrek.skip_evenement_geometry');
+    PERFORM set_config('geotrek.skip_evenement_geometry', 'on', true);
+
+    EXECUTE 'WITH edges AS ('
+         || '    SELECT nextval(pg_get_serial_sequence(''e_t_evenement'', ''id'')) AS eid, troncon, zone,'
+         || '           tgeom, tgeom_3d, least(pk_a, pk_b) AS pk_debut, greatest(pk_a, pk_b) AS pk_fin'
+         || '    FROM (SELECT troncon, zone, tgeom, tgeom_3d,'
+         || '                 ST_Line_Locate_Point(tgeom, COALESCE(ST_StartPoint(geom), geom)) AS pk_a,'
+         || '                 ST_Line_Locate_Point(tgeom, COALESCE(ST_EndPoint(geom), geom)) AS pk_b'
+         || '          FROM (SELECT t.id AS troncon, t.geom AS tgeom, t.geom_3d AS tgeom_3d,'
+         || '                       l.' || quote_ident(layer[2]) || ' AS zone,'
+         || '                       (ST_Dump(ST_Multi(ST_Intersection(l.geom, t.geom)))).geom AS geom'
+         || '                FROM l_t_troncon t, ' || quote_ident(layer[1]) || ' l'
+         || '                WHERE ($1 IS NULL OR t.id = ANY($1)) AND ST_Intersects(l.geom, t.geom)) AS sub'
+         || '         ) AS located'
+         || '), geometries AS ('
+         || '    SELECT eid, geom, ft_elevation_infos(geom_3d, {{ALTIMETRIC_PROFILE_STEP}}) AS elevation'
+         || '    FROM (SELECT eid,'
+         || '                 CASE WHEN pk_debut = pk_fin THEN ST_Line_Interpolate_Point(tgeom, pk_debut)'
+         || '                      ELSE ST_Smart_Line_Substring(tgeom, pk_debut, pk_fin) END AS geom,'
+         || '                 CASE WHEN pk_debut = pk_fin THEN ST_Line_Interpolate_Point(tgeom, pk_debut)'
+         || '                      ELSE ST_Smart_Line_Substring(tgeom_3d, pk_debut, pk_fin) END AS geom_3d'
+         || '          FROM edges) AS sub'
+         || '), evenements AS ('
+         || '    INSERT INTO e_t_evenement (id, date_insert, date_update, kind, decallage, supprime, geom, geom_3d,'
+         || '                               longueur, pente, altitude_minimum, altitude_maximum,'
+         || '                               denivelee_positive, denivelee_negative)'
+         || '    SELECT eid, now(), now(), $2, 0, FALSE, ST_Force_2D(geom), ST_Force_3DZ((elevation).draped),'
+         || '           ST_3DLength((elevation).draped), (elevation).slope, (elevation).min_elevation,'
+         || '           (elevation).max_elevation, (elevation).positive_gain, (elevation).negative_gain'
+         || '    FROM geometries'
+         || '), aggregations AS ('
+         || '    INSERT INTO e_r_evenement_troncon (troncon, evenement, pk_debut, pk_fin)'
+         || '    SELECT troncon, eid, pk_debut, pk_fin FROM edges'
+         || ')'
+         || 'INSERT INTO ' || quote_ident(layer[3]) || ' (evenement, ' || quote_ident(layer[4]) || ')'
+         || '    SELECT eid, zone FROM edges'
+    USING troncons, kind;
+    GET DIAGNOSTICS t_count = ROW_COUNT;
+
+    PERFORM set_config('geotrek.skip_evenement_geometry', CASE WHEN skipped THEN 'on' ELSE 'off' END, true);
+    RETURN t_count;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Link several Troncons to all layers (see ft_troncons_import())
+CREATE OR REPLACE FUNCTION zonage.lien_auto_troncons_couches_sig(troncons integer[]) RETURNS void AS $$
+BEGIN
+    PERFORM lien_auto_couche_sig_troncons('CITYEDGE', troncons);
+    PERFORM lien_auto_couche_sig_troncons('DISTRICTEDGE', troncons);
+    PERFORM lien_auto_couche_sig_troncons('RESTRICTEDAREAEDGE', troncons);
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Replace all evenements of a layer, without per-row triggers cascades.
+-- Returns the number of evenements created.
+CREATE OR REPLACE FUNCTION zonage.lien_auto_couche_sig_recompute(kind varchar) RETURNS integer AS $$
+DECLARE
+    layer varchar[];
+    skipped boolean;
+    skipped_geometry boolean;
+BEGIN
+    layer := couche_sig(kind);
+    skipped := ft_setting_enabled('geotrek.skip_zoning_triggers');
+    skipped_geometry := ft_setting_enabled('geotrek.skip_evenement_geometry');
+    PERFORM set_config('geotrek.skip_zoning_triggers', 'on', true);
+    PERFORM set_config('geotrek.skip_evenement_geometry', 'on', true);
+
+    EXECUTE 'WITH deleted AS (DELETE FROM ' || quote_ident(layer[3]) || ' RETURNING evenement),'
+         || '     aggregations AS (DELETE FROM e_r_evenement_troncon WHERE evenement IN (SELECT evenement FROM deleted))'
+         || 'DELETE FROM e_t_evenement WHERE id IN (SELECT evenement FROM deleted)';
+
+    PERFORM set_config('geotrek.skip_zoning_triggers', CASE WHEN skipped THEN 'on' ELSE 'off' END, true);
+    PERFORM set_config('geotrek.skip_evenement_geometry', CASE WHEN skipped_geometry THEN 'on' ELSE 'off' END, true);
+    RETURN lien_auto_couche_sig_troncons(kind, NULL);
+END;
+$$ LANGUAGE plpgsql;
+
+
 
 -------------------------------------------------------------------------------
 -- Sync when Commune/Zonage/Secteur modified
@@ -169,6 +289,11 @@ DECLARE
     rec record;
     eid integer;
 BEGIN
+    -- Layer is being loaded, evenements will be recomputed at once (see lien_auto_couche_sig_recompute())
+    IF ft_setting_enabled('geotrek.skip_zoning_triggers') THEN
+        RETURN NULL;
+    END IF;
+
     -- Harmonize ID name
     BEGIN
         SELECT NEW.insee AS id INTO obj;
@@ -0,0 +1,137 @@
+-------------------------------------------------------------------------------
+-- Commune/Secteur/Zonage of each evenement, ordered along the evenement
+-- (rang), as found by overlapping() on zoning edges.
+-------------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS zonage.e_r_evenement_zonage (
+    evenement integer NOT NULL,
+    kind varchar(32) NOT NULL,
+    zone varchar(32) NOT NULL,
+    rang float8
+);
+
+DROP INDEX IF EXISTS e_r_evenement_zonage_evenement_idx;
+CREATE INDEX e_r_evenement_zonage_evenement_idx ON zonage.e_r_evenement_zonage(evenement);
+
+-- Evenements and troncons whose aggregations changed since last flush
+CREATE TABLE IF NOT EXISTS zonage.e_r_evenement_zonage_dirty (
+    evenement integer,
+    troncon integer
+);
+
+
+-------------------------------------------------------------------------------
+-- Compute zoning of evenements (all of them if NULL)
+-------------------------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION zonage.ft_evenements_zonage_refresh(eids integer[]) RETURNS void AS $$
+BEGIN
+    IF eids IS NULL THEN
+        DELETE FROM e_r_evenement_zonage;
+    ELSE
+        DELETE FROM e_r_evenement_zonage WHERE evenement = ANY(eids);
+    END IF;
+
+    INSERT INTO e_r_evenement_zonage (evenement, kind, zone, rang)
+        SELECT pa.evenement, z.kind, z.zone,
+               min(pa.ordre + CASE WHEN pa.pk_debut > pa.pk_fin THEN (1 - a.pk_debut) ELSE a.pk_debut END)
+        FROM e_r_evenement_troncon pa
+        JOIN e_t_evenement pe ON (pe.id = pa.evenement)
+        JOIN e_r_evenement_troncon a ON (a.troncon = pa.troncon)
+        JOIN e_t_evenement e ON (e.id = a.evenement)
+        JOIN (SELECT evenement, 'CITYEDGE'::varchar AS kind, commune::varchar AS zone FROM f_t_commune
+              UNION ALL
+              SELECT evenement, 'DISTRICTEDGE'::varchar, secteur::varchar FROM f_t_secteur
+              UNION ALL
+              SELECT evenement, 'RESTRICTEDAREAEDGE'::varchar, zone::varchar FROM f_t_zonage) AS z ON (z.evenement = e.id)
+        WHERE (eids IS NULL OR pa.evenement = ANY(eids))
+          AND pe.kind NOT IN ('CITYEDGE', 'DISTRICTEDGE', 'RESTRICTEDAREAEDGE')
+          AND NOT e.supprime
+          AND least(a.pk_debut, a.pk_fin) <= greatest(pa.pk_debut, pa.pk_fin)
+          AND greatest(a.pk_debut, a.pk_fin) >= least(pa.pk_debut, pa.pk_fin)
+        GROUP BY pa.evenement, z.kind, z.zone;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-------------------------------------------------------------------------------
+-- Compute zoning of evenements recorded as dirty. Returns their number.
+-------------------------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION zonage.ft_evenements_zonage_flush() RETURNS integer AS $$
+DECLARE
+    eids integer[];
+BEGIN
+    -- Evenements changed, and those lying on troncons whose zoning changed
+    WITH dirty AS (DELETE FROM e_r_evenement_zonage_dirty RETURNING evenement, troncon)
+    SELECT array_agg(DISTINCT id) INTO eids
+        FROM (SELECT evenement AS id FROM dirty
+              UNION ALL
+              SELECT et.evenement FROM e_r_evenement_troncon et
+              WHERE et.troncon IN (SELECT troncon FROM dirty WHERE troncon IS NOT NULL)) AS sub;
+
+    IF eids IS NULL THEN
+        RETURN 0;
+    END IF;
+    PERFORM ft_evenements_zonage_refresh(eids);
+    RETURN array_length(eids, 1);
+END;
+$$ LANGUAGE plpgsql;
+
+
+-------------------------------------------------------------------------------
+-- Record dirty evenements when aggregations change
+-------------------------------------------------------------------------------
+
+DROP TRIGGER IF EXISTS e_r_evenement_troncon_zonage_iud_tgr ON e_r_evenement_troncon;
+
+CREATE OR REPLACE FUNCTION zonage.evenement_zonage_dirty_iud() RETURNS trigger AS $$
+DECLARE
+    rec record;
+    edge boolean;
+BEGIN
+    FOR rec IN SELECT OLD.evenement, OLD.troncon WHERE TG_OP IN ('UPDATE', 'DELETE')
+               UNION ALL
+               SELECT NEW.evenement, NEW.troncon WHERE TG_OP IN ('INSERT', 'UPDATE')
+    LOOP
+        -- Zoning edges (or evenements already deleted) change the zoning of
+        -- every evenement on the troncon
+        SELECT kind IN ('CITYEDGE', 'DISTRICTEDGE', 'RESTRICTEDAREAEDGE') INTO edge
+            FROM e_t_evenement WHERE id = rec.evenement;
+        IF edge IS NULL OR edge THEN
+            INSERT INTO e_r_evenement_zonage_dirty (evenement, troncon) VALUES (rec.evenement, rec.troncon);
+        ELSE
+            INSERT INTO e_r_evenement_zonage_dirty (evenement) VALUES (rec.evenement);
+        END IF;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER e_r_evenement_troncon_zonage_iud_tgr
+AFTER INSERT OR UPDATE OR DELETE ON e_r_evenement_troncon
+FOR EACH ROW EXECUTE PROCEDURE evenement_zonage_dirty_iud();
+
+
+-------------------------------------------------------------------------------
+-- Make sure dirty evenements are computed before commit
+-------------------------------------------------------------------------------
+
+DROP TRIGGER IF EXISTS e_r_evenement_zonage_dirty_flush_tgr ON zonage.e_r_evenement_zonage_dirty;
+
+CREATE OR REPLACE FUNCTION zonage.evenements_zonage_flush_tgr() RETURNS trigger AS $$
+BEGIN
+    PERFORM ft_evenements_zonage_flush();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE CONSTRAINT TRIGGER e_r_evenement_zonage_dirty_flush_tgr
+AFTER INSERT ON zonage.e_r_evenement_zonage_dirty
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE PROCEDURE evenements_zonage_flush_tgr();
+
+
+-- Initial computation (or after upgrade)
+SELECT zonage.ft_evenements_zonage_refresh(NULL);
+DELETE FROM zonage.e_r_evenement_zonage_dirty;
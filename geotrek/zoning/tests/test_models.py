@@ -1,11 +1,16 @@
+from django.core.management import call_command
 from django.test import TestCase
 from django.conf import settings
 from django.contrib.gis.geos import LineString, Polygon, MultiPolygon
 
+from geotrek.common.utils import prefetch_with
 from geotrek.core.models import Topology
-from geotrek.core.factories import PathFactory
+from geotrek.core.factories import PathFactory, TopologyFactory
+from geotrek.core.helpers import PathHelper
+from geotrek.core.models import Path
 from geotrek.land.tests.test_views import EdgeHelperTest
-from geotrek.zoning.models import City
+from geotrek.zoning.helpers import skip_zoning_triggers, recompute_edges, prefetch_zoning, flush_zoning
+from geotrek.zoning.models import City, CityEdge, RestrictedAreaEdge
 from geotrek.zoning.factories import (DistrictEdgeFactory, CityEdgeFactory,
                                       RestrictedAreaFactory, RestrictedAreaEdgeFactory)
 
@@ -38,6 +43,17 @@ class PathUpdateTest(TestCase):
         p1.geom = LineString((2, 2), (4, 4), srid=settings.SRID)
         p1.save()
 
+    def test_imported_paths_are_linked(self):
+        city = City.objects.create(code='005177', name='Trifouillis-les-oies',
+                                   geom=MultiPolygon(Polygon(((0, 0), (2, 0), (2, 2), (0, 2), (0, 0)),
+                                                             srid=settings.SRID)))
+        pks = PathHelper.bulk_create([Path(geom=LineString((1, 1), (3, 1), srid=settings.SRID)),
+                                      Path(geom=LineString((5, 5), (6, 6), srid=settings.SRID))])
+        inside, outside = Path.objects.get(pk=pks[0]), Path.objects.get(pk=pks[1])
+        self.assertEqual([edge.city for edge in inside.city_edges], [city])
+        self.assertEqual(inside.aggregations.get().end_position, 0.5)
+        self.assertEqual(list(outside.city_edges), [])
+
 
 class LandLayersUpdateTest(TestCase):
 
@@ -168,3 +184,102 @@ class LandLayersUpdateTest(TestCase):
         self.assertEquals(Topology.objects.filter(pk=t_ra1.pk).count(), 0)
         self.assertEquals(ra2.restrictedareaedge_set.count(), 0)
         self.assertEquals(Topology.objects.filter(pk=t_ra2.pk).count(), 0)
+
+
+class RecomputeEdgesTest(TestCase):
+    def setUp(self):
+        self.path = PathFactory.create(geom=LineString((1, 1), (3, 1)))
+        self.other = PathFactory.create(geom=LineString((5, 5), (6, 6)))
+
+    def create_city(self):
+        return City.objects.create(code='005177', name='Trifouillis-les-oies',
+                                   geom=MultiPolygon(Polygon(((0, 0), (2, 0), (2, 2), (0, 2), (0, 0)),
+                                                             srid=settings.SRID)))
+
+    def test_same_edges_as_triggers(self):
+        city = self.create_city()
+        edge = CityEdge.objects.get()
+        self.assertEqual(recompute_edges(CityEdge), 1)
+        recomputed = CityEdge.objects.get()
+        self.assertNotEqual(recomputed.pk, edge.pk)
+        self.assertEqual(recomputed.city, city)
+        self.assertEqual(recomputed.geom, edge.geom)
+        self.assertEqual(recomputed.geom, LineString((1, 1), (2, 1)))
+        self.assertEqual(recomputed.length, 1)
+        aggregation = recomputed.aggregations.get()
+        self.assertEqual((aggregation.path, aggregation.start_position, aggregation.end_position),
+                         (self.path, 0.0, 0.5))
+        self.assertFalse(Topology.objects.filter(pk=edge.pk).exists())
+
+    def test_layer_loaded_without_triggers(self):
+        with skip_zoning_triggers():
+            city = self.create_city()
+        self.assertEqual(CityEdge.objects.count(), 0)
+        recompute_edges(CityEdge)
+        self.assertEqual([edge.city for edge in self.path.city_edges], [city])
+        self.assertEqual(list(self.other.city_edges), [])
+
+    def test_other_layers_are_kept(self):
+        RestrictedAreaFactory.create(geom=MultiPolygon(Polygon(((0, 0), (2, 0), (2, 2), (0, 2), (0, 0)))))
+        self.create_city()
+        area_edge = RestrictedAreaEdge.objects.get()
+        call_command('recompute_zoning_edges', 'city', verbosity=0)
+        self.assertEqual(CityEdge.objects.count(), 1)
+        self.assertEqual(RestrictedAreaEdge.objects.get(), area_edge)
+
+
+class ZoningPropertiesTest(TestCase):
+    def setUp(self):
+        self.path = PathFactory.create(geom=LineString((0, 0), (4, 0)))
+        self.city1 = City.objects.create(code='005177', name='Trifouillis-les-oies',
+                                         geom=MultiPolygon(Polygon(((0, -1), (2, -1), (2, 1), (0, 1), (0, -1)),
+                                                                   srid=settings.SRID)))
+        self.city2 = City.objects.create(code='005178', name='Trifouillis-les-marmottes',
+                                         geom=MultiPolygon(Polygon(((2, -1), (4, -1), (4, 1), (2, 1), (2, -1)),
+                                                                   srid=settings.SRID)))
+
+    def create_topology(self, start, end):
+        topology = TopologyFactory.create(no_path=True)
+        topology.add_path(self.path, start=start, end=end)
+        flush_zoning()
+        return topology
+
+    def test_cities_in_order(self):
+        self.assertEqual(self.create_topology(0, 1).cities, [self.city1, self.city2])
+        self.assertEqual(self.create_topology(1, 0).cities, [self.city2, self.city1])
+        self.assertEqual(self.create_topology(0, 0.25).cities, [self.city1])
+
+    def test_same_as_edges(self):
+        topology = self.create_topology(0.25, 1)
+        self.assertEqual(topology.cities, [edge.city for edge in topology.city_edges])
+        self.assertEqual(topology.districts, [])
+        self.assertEqual(topology.areas, [])
+
+    def test_follow_edges_changes(self):
+        topology = self.create_topology(0, 1)
+        self.assertEqual(topology.cities, [self.city1, self.city2])
+        self.city2.delete()
+        flush_zoning()
+        self.assertEqual(topology.cities, [self.city1])
+        area = RestrictedAreaFactory.create(geom=MultiPolygon(Polygon(((1, -1), (3, -1), (3, 1), (1, 1), (1, -1)))))
+        flush_zoning()
+        self.assertEqual(topology.areas, [area])
+
+    def test_computed_when_flushed(self):
+        topology = TopologyFactory.create(no_path=True)
+        topology.add_path(self.path, start=0, end=1)
+        self.assertEqual(topology.cities, [])
+        self.assertEqual(flush_zoning(), 1)
+        self.assertEqual(topology.cities, [self.city1, self.city2])
+
+    def test_prefetch(self):
+        topologies = [self.create_topology(0, 1), self.create_topology(0, 0.25)]
+        queryset = prefetch_with(Topology.objects.filter(pk__in=[t.pk for t in topologies]), prefetch_zoning)
+        queryset = queryset.order_by('pk')
+        # Topologies, zoning and cities
+        with self.assertNumQueries(3):
+            topologies = list(queryset)
+        with self.assertNumQueries(0):
+            self.assertEqual([t.cities for t in topologies],
+                             [[self.city1, self.city2], [self.city1]])
+            self.assertEqual([t.districts for t in topologies], [[], []])
@@ -8,4 +8,7 @@ urlpatterns = patterns(
     url(r'^api/restrictedarea/restrictedarea.geojson$', views.RestrictedAreaGeoJSONLayer.as_view(), name="restrictedarea_layer"),
     url(r'^api/restrictedarea/type/(?P<type_pk>\d+)/restrictedarea.geojson$', views.RestrictedAreaTypeGeoJSONLayer.as_view(), name="restrictedarea_type_layer"),
     url(r'^api/district/district.geojson$', views.DistrictGeoJSONLayer.as_view(), name="district_layer"),
+    url(r'^api/tiles/cities/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.pbf$', views.CityVectorTile.as_view(), name="city_tiles"),
+    url(r'^api/tiles/restrictedareas/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.pbf$', views.RestrictedAreaVectorTile.as_view(), name="restrictedarea_tiles"),
+    url(r'^api/tiles/districts/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.pbf$', views.DistrictVectorTile.as_view(), name="district_tiles"),
 )
@@ -4,6 +4,8 @@ from django.conf import settings
 from django.utils.decorators import method_decorator
 from djgeojson.views import GeoJSONLayerView
 
+from geotrek.common.views import VectorTileView
+
 from .models import City, RestrictedArea, RestrictedAreaType, District
 
 
@@ -41,3 +43,25 @@ class RestrictedAreaTypeGeoJSONLayer(LandLayerMixin, GeoJSONLayerView):
 class DistrictGeoJSONLayer(LandLayerMixin, GeoJSONLayerView):
     model = District
     properties = ['name']
+
+
+class LandVectorTileMixin(object):
+    cache_timeout = settings.CACHE_TIMEOUT_LAND_LAYERS
+
+
+class CityVectorTile(LandVectorTileMixin, VectorTileView):
+    model = City
+    layer = 'cities'
+    properties = ['name']
+
+
+class RestrictedAreaVectorTile(LandVectorTileMixin, VectorTileView):
+    model = RestrictedArea
+    layer = 'restrictedareas'
+    properties = ['name', 'area_type']
+
+
+class DistrictVectorTile(LandVectorTileMixin, VectorTileView):
+    model = District
+    layer = 'districts'
+    properties = ['name']
@@ -20,6 +20,7 @@ setup(
         'psycopg2',
         'docutils',
         'GDAL',
+        'numpy',
         'Pillow',
         'easy-thumbnails',
         'simplekml',